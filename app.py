@@ -3,6 +3,7 @@ Postify - Automated Holiday Social Media Post Generator
 
 A minimal FastAPI application entry point that wires up all modules.
 """
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes import (
@@ -12,12 +13,39 @@ from routes import (
     subscribers_router,
     holidays_router,
     test_post_router,
+    pregeneration_router,
+    metrics_router,
 )
+from config import PREGENERATION_ENABLED
+from services import (
+    start_pregeneration,
+    stop_pregeneration,
+    load_assets,
+    stop_render_engine,
+    stop_image_executor,
+    stop_send_schedulers,
+    UploadLimitMiddleware,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background services with the application."""
+    load_assets()
+    if PREGENERATION_ENABLED:
+        start_pregeneration()
+    yield
+    await stop_pregeneration()
+    stop_render_engine()
+    stop_image_executor()
+    stop_send_schedulers()
+
 
 # Create FastAPI app
 app = FastAPI(
     title="Postify",
-    description="Automated Holiday Social Media Post Generator"
+    description="Automated Holiday Social Media Post Generator",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -29,6 +57,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Refuse oversized request bodies while they are received
+app.add_middleware(UploadLimitMiddleware)
+
 # Include routers
 app.include_router(health_router)
 # app.include_router(users_router)  # Deprecated: Using subscribers now
@@ -36,6 +67,8 @@ app.include_router(posts_router)
 app.include_router(subscribers_router)
 app.include_router(holidays_router)
 app.include_router(test_post_router)
+app.include_router(pregeneration_router)
+app.include_router(metrics_router)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,76 @@
+"""
+Benchmark Script: NumPy batch compositor vs Image.alpha_composite
+Composites synthetic overlays over 1024x1024 base frames with both
+implementations, checks the outputs are bit-identical and prints timings.
+
+Usage: python benchmark_compositor.py [overlays] [stack]
+"""
+import sys
+import time
+import random
+from PIL import Image, ImageDraw
+from services.compositor import BatchCompositor
+from config import IMAGE_SIZE
+
+
+def make_base(opaque: bool) -> Image.Image:
+    """Build a noisy base frame (opaque like a generated image, or semi-transparent)."""
+    base = Image.effect_noise((IMAGE_SIZE, IMAGE_SIZE), 64).convert("RGB").convert("RGBA")
+    if not opaque:
+        base.putalpha(Image.linear_gradient("L").resize((IMAGE_SIZE, IMAGE_SIZE)))
+    return base
+
+
+def make_overlay(seed: int) -> Image.Image:
+    """Build a subscriber-like overlay: transparent centre, branded border with soft edges."""
+    rng = random.Random(seed)
+    overlay = Image.new("RGBA", (IMAGE_SIZE, IMAGE_SIZE), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    color = tuple(rng.randrange(256) for _ in range(3))
+    draw.rectangle((0, IMAGE_SIZE - 140, IMAGE_SIZE, IMAGE_SIZE), fill=color + (rng.randrange(128, 256),))
+    draw.rectangle((0, 0, IMAGE_SIZE, 90), fill=color + (rng.randrange(1, 256),))
+    for _ in range(20):
+        x, y = rng.randrange(IMAGE_SIZE), rng.randrange(IMAGE_SIZE)
+        draw.ellipse((x, y, x + 60, y + 60), fill=tuple(rng.randrange(256) for _ in range(4)))
+    return overlay
+
+
+def run_benchmark(count: int, stack: int):
+    """Compare both compositors on opaque and semi-transparent bases."""
+    overlays = [make_overlay(seed) for seed in range(count)]
+
+    for opaque in (True, False):
+        base = make_base(opaque)
+        print(f"\n{'opaque' if opaque else 'semi-transparent'} base, {count} overlays, {IMAGE_SIZE}x{IMAGE_SIZE}")
+
+        start = time.perf_counter()
+        expected = [Image.alpha_composite(base, overlay) for overlay in overlays]
+        pillow_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        compositor = BatchCompositor(base)
+        setup_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        single = [compositor.composite(overlay) for overlay in overlays]
+        single_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stacked = compositor.composite_many(overlays, stack=stack)
+        stacked_seconds = time.perf_counter() - start
+
+        identical = all(
+            a.tobytes() == b.tobytes() == c.tobytes()
+            for a, b, c in zip(expected, single, stacked)
+        )
+        print(f"  Image.alpha_composite:      {pillow_seconds / count * 1000:8.2f} ms/overlay")
+        print(f"  BatchCompositor setup:      {setup_seconds * 1000:8.2f} ms (once per base)")
+        print(f"  BatchCompositor:            {single_seconds / count * 1000:8.2f} ms/overlay")
+        print(f"  BatchCompositor (stack={stack}): {stacked_seconds / count * 1000:8.2f} ms/overlay")
+        print(f"  Bit-identical:              {identical}")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    stack = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    run_benchmark(count, stack)
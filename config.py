@@ -17,20 +17,87 @@ CSV_FILE_PATH = "holidays.csv"
 OVERLAY_IMAGE_PATH = "overlay.png"
 LOGO_IMAGE_PATH = "logo.png"
 FONT_PATH = "GoogleSans_17pt-SemiBold.ttf"
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "generated_images")
 
 # ==================== API ENDPOINTS ====================
 SEND_MEDIA_URL = "https://fast.meteor-fitness.com/send-media?type=base64"
 DEFAULT_PHONE_NUMBER = "8299396255"
+# How images are sent to each sender endpoint: "json" (base64 string in a JSON
+# body), "json-stream" (same body, base64 encoded while streaming) or
+# "multipart" (raw bytes as a file part, no base64 on the wire)
+DEFAULT_SEND_MEDIA_TRANSPORT = os.getenv("SEND_MEDIA_TRANSPORT", "json-stream")
+SEND_MEDIA_TRANSPORTS = {
+    SEND_MEDIA_URL: DEFAULT_SEND_MEDIA_TRANSPORT,
+}
+SEND_MEDIA_FILE_FIELD = "file"  # Multipart field holding the image
+
+# ==================== SEND SCHEDULER SETTINGS ====================
+# Every send to a sender endpoint is paced by one scheduler per endpoint:
+# at least SEND_MIN_SPACING_SECONDS plus up to SEND_JITTER_SECONDS of random
+# jitter between sends, and at most SEND_HOURLY_CAP / SEND_DAILY_CAP sends in
+# any rolling hour / day (0 = no cap). Lanes are served in priority order.
+SEND_MIN_SPACING_SECONDS = float(os.getenv("SEND_MIN_SPACING_SECONDS", "240"))
+SEND_JITTER_SECONDS = float(os.getenv("SEND_JITTER_SECONDS", "240"))
+SEND_HOURLY_CAP = int(os.getenv("SEND_HOURLY_CAP", "20"))
+SEND_DAILY_CAP = int(os.getenv("SEND_DAILY_CAP", "300"))
+SEND_MIN_SAFE_SPACING_SECONDS = float(os.getenv("SEND_MIN_SAFE_SPACING_SECONDS", "60"))  # Floor for deadline-paced sends
+SEND_LANES = ("priority", "bulk")  # One-off sends, then distributions
+SEND_REQUEST_MAX_WAIT_SECONDS = int(os.getenv("SEND_REQUEST_MAX_WAIT_SECONDS", "60"))  # Request-path sends get 503 beyond this
 
 # ==================== GEMINI MODELS ====================
+AI_BACKEND = os.getenv("AI_BACKEND", "gemini")  # "gemini" or "fake" (offline load testing)
 GEMINI_TEXT_MODEL = "gemini-flash-latest"
 GEMINI_IMAGE_MODEL = "gemini-3-pro-image-preview"
+AI_MAX_CONCURRENT_REQUESTS = int(os.getenv("AI_MAX_CONCURRENT_REQUESTS", "8"))  # In-flight Gemini calls per worker
+
+# ==================== AI RATE LIMITS & RETRIES ====================
+# Requests per minute per worker; split the project quota across workers
+GEMINI_TEXT_RPM = int(os.getenv("GEMINI_TEXT_RPM", "60"))
+GEMINI_IMAGE_RPM = int(os.getenv("GEMINI_IMAGE_RPM", "10"))
+AI_RATE_LIMIT_MAX_WAITERS = int(os.getenv("AI_RATE_LIMIT_MAX_WAITERS", "50"))  # Queued callers before 503
+GEMINI_TEXT_TIMEOUT_SECONDS = 60
+GEMINI_IMAGE_TIMEOUT_SECONDS = 180
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "4"))
+AI_RETRY_BASE_SECONDS = 2
+AI_RETRY_MAX_SECONDS = 60
+
+# Estimated USD prices per million tokens, used for the daily cost report
+AI_PRICING = {
+    GEMINI_TEXT_MODEL: {"input_per_million": 0.30, "output_per_million": 2.50},
+    GEMINI_IMAGE_MODEL: {"input_per_million": 2.00, "output_per_million": 120.00},
+}
+
+# ==================== FAKE AI BACKEND ====================
+# Median latencies of the log-normal distribution used by AI_BACKEND=fake
+FAKE_AI_TEXT_LATENCY_SECONDS = float(os.getenv("FAKE_AI_TEXT_LATENCY_SECONDS", "3"))
+FAKE_AI_IMAGE_LATENCY_SECONDS = float(os.getenv("FAKE_AI_IMAGE_LATENCY_SECONDS", "40"))
+FAKE_AI_LATENCY_SIGMA = float(os.getenv("FAKE_AI_LATENCY_SIGMA", "0.35"))
+FAKE_AI_ERROR_RATE = float(os.getenv("FAKE_AI_ERROR_RATE", "0"))  # Fraction of calls failing with 503
+
+# ==================== AI CACHE SETTINGS ====================
+STRUCTURED_OUTPUT_CACHE_TTL_SECONDS = int(os.getenv("STRUCTURED_OUTPUT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+STRUCTURED_OUTPUT_LRU_SIZE = 256
+IMAGE_STORE_BACKEND = os.getenv("IMAGE_STORE_BACKEND", "local")  # "local" (disk) or "memory"
+
+# ==================== BATCH PREVIEW SETTINGS ====================
+PREVIEW_BATCH_CONCURRENCY = int(os.getenv("PREVIEW_BATCH_CONCURRENCY", "4"))
+PREVIEW_BATCH_MAX_ITEMS = 100
+
+# ==================== PRE-GENERATION SETTINGS ====================
+PREGENERATION_ENABLED = os.getenv("PREGENERATION_ENABLED", "true").lower() == "true"
+PREGENERATION_LOOKAHEAD_DAYS = int(os.getenv("PREGENERATION_LOOKAHEAD_DAYS", "3"))
+PREGENERATION_CONCURRENCY = int(os.getenv("PREGENERATION_CONCURRENCY", "2"))
+PREGENERATION_DAILY_BUDGET = int(os.getenv("PREGENERATION_DAILY_BUDGET", "10"))  # Image generations per day
+PREGENERATION_INTERVAL_SECONDS = int(os.getenv("PREGENERATION_INTERVAL_SECONDS", "3600"))
+# How long the worker running the scheduled loop keeps it after its last renewal
+PREGENERATION_LEASE_SECONDS = int(os.getenv("PREGENERATION_LEASE_SECONDS", str(2 * PREGENERATION_INTERVAL_SECONDS)))
 
 # ==================== IMAGE SETTINGS ====================
 IMAGE_SIZE = 1024
 LOGO_SIZE = 120
 LOGO_PADDING = 20
 USER_LOGO_SIZE = 150
+OVERLAY_THUMBNAIL_SIZE = 128
 
 # ==================== FOOTER SETTINGS ====================
 DEFAULT_FOOTER_TEXT = "+91 8299396255   |   ANDROCODERS21@GMAIL.COM   |   ANDROCODERS.IN"
@@ -38,6 +105,56 @@ FOOTER_ELEVATION = 40
 FOOTER_FONT_SIZE = 24
 FOOTER_TEXT_COLOR = (255, 255, 255)  # White text
 
+# ==================== ASSET SETTINGS ====================
+ASSET_RELOAD_CHECK_SECONDS = 5  # How often overlay/logo/font files are checked for changes
+OVERLAY_CACHE_MAX_MB = int(os.getenv("OVERLAY_CACHE_MAX_MB", "256"))  # Decoded subscriber overlays (~4 MB each)
+OVERLAY_DIRTY_MAX_FRACTION = 0.25  # Above this dirty area, a full alpha_composite is faster than per-rectangle blending
+BRAND_LAYER_CACHE_MAX_MB = int(os.getenv("BRAND_LAYER_CACHE_MAX_MB", "64"))  # Pre-rendered legacy user brand layers
+
+# ==================== OUTPUT ENCODING PROFILES ====================
+# Outbound image encodings, selectable per job. max_dimension downsizes the
+# longest side; "png" reproduces the original unoptimized output and stays the
+# default (lossless, so overlay text and logos stay crisp). Deployments opt into
+# a lossy profile with DEFAULT_ENCODING_PROFILE=jpeg (or webp).
+ENCODING_PROFILES = {
+    "png": {"format": "PNG", "compress_level": 6},
+    "png-optimized": {"format": "PNG", "optimize": True},
+    "jpeg": {"format": "JPEG", "quality": 90, "subsampling": 0},
+    "jpeg-medium": {"format": "JPEG", "quality": 85, "max_dimension": 800},
+    "webp": {"format": "WEBP", "quality": 88, "method": 4},
+    "webp-small": {"format": "WEBP", "quality": 80, "method": 4, "max_dimension": 640},
+}
+DEFAULT_ENCODING_PROFILE = os.getenv("DEFAULT_ENCODING_PROFILE", "png")
+
+# ==================== RENDER ENGINE SETTINGS ====================
+# Worker processes compositing and encoding distribution images (0 = render in a thread)
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 1)))
+RENDER_BATCH_SIZE = int(os.getenv("RENDER_BATCH_SIZE", "8"))  # Overlays rendered per worker task
+RENDER_OVERLAY_CACHE_MAX_MB = int(os.getenv("RENDER_OVERLAY_CACHE_MAX_MB", "128"))  # Prepared overlays kept per render worker
+
+# ==================== DISTRIBUTION SETTINGS ====================
+ROSTER_PAGE_SIZE = int(os.getenv("ROSTER_PAGE_SIZE", "200"))  # Subscribers read per roster page query
+JOB_PROGRESS_FLUSH_ITEMS = 20  # Buffered results written per progress update
+JOB_PROGRESS_FLUSH_SECONDS = 5  # Max age of unwritten progress
+# Delivery windows: a job given a window spreads its remaining recipients
+# evenly over what is left of it, never closer than SEND_MIN_SAFE_SPACING_SECONDS
+# and never further apart than DEADLINE_MAX_SPACING_SECONDS
+DEADLINE_MAX_SPACING_SECONDS = float(os.getenv("DEADLINE_MAX_SPACING_SECONDS", str(15 * 60)))
+DEADLINE_JITTER_FRACTION = 0.2  # Deadline spacing varies by up to +/- this fraction
+JOB_HEARTBEAT_SECONDS = 60  # A waiting job (send slot, window, image generation) touches its document this often
+JOB_STALE_SECONDS = 15 * 60  # A running job not updated for this long (many missed heartbeats) can be resumed
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(30 * 24 * 3600)))  # TTL after the last update
+
+# ==================== IMAGE WORK SETTINGS ====================
+# Request-path Pillow work (uploads, previews) runs on a bounded thread pool
+IMAGE_WORK_THREADS = int(os.getenv("IMAGE_WORK_THREADS", str(min(4, os.cpu_count() or 1))))
+IMAGE_WORK_MAX_QUEUE = int(os.getenv("IMAGE_WORK_MAX_QUEUE", "16"))  # Waiting jobs before uploads get 503
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+# Whole request bodies (the upload plus its multipart form fields), refused while received
+UPLOAD_MAX_BODY_BYTES = UPLOAD_MAX_BYTES + 256 * 1024
+UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", str(4096 * 4096)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
 # ==================== PROMPT TEMPLATES ====================
 STRUCTURED_OUTPUT_PROMPT = """You are a creative visual designer. For the holiday "{holiday}", produce a JSON object with exactly two keys: "prompt" and "caption".
 
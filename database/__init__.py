@@ -1,7 +1,13 @@
 """Postify Database Package"""
-from .connection import get_collection, serialize_doc, get_subscribers_collection, serialize_subscriber_doc
+from .connection import get_collection, serialize_doc, get_subscribers_collection, get_subscriber_overlays_collection, serialize_subscriber_doc
 from .user_repository import UserRepository
 from .subscriber_repository import SubscriberRepository
 from .holiday_repository import HolidayRepository
+from .structured_output_repository import StructuredOutputRepository
+from .ai_usage_repository import AIUsageRepository
+from .job_repository import JobRepository
+from .delivery_repository import DeliveryRepository
+from .pregeneration_repository import PregenerationRepository
+from .send_budget_repository import SendBudgetRepository
 
-__all__ = ["get_collection", "serialize_doc", "get_subscribers_collection", "serialize_subscriber_doc", "UserRepository", "SubscriberRepository", "HolidayRepository"]
+__all__ = ["get_collection", "serialize_doc", "get_subscribers_collection", "get_subscriber_overlays_collection", "serialize_subscriber_doc", "UserRepository", "SubscriberRepository", "HolidayRepository", "StructuredOutputRepository", "AIUsageRepository", "JobRepository", "DeliveryRepository", "PregenerationRepository", "SendBudgetRepository"]
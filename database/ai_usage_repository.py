@@ -0,0 +1,32 @@
+"""
+AI usage repository - per-day, per-model usage and cost totals.
+"""
+from typing import List
+from .connection import get_database
+
+
+def get_ai_usage_collection():
+    """Get the AI usage collection."""
+    return get_database().get_collection("ai_usage")
+
+
+class AIUsageRepository:
+    """Repository class for daily AI usage aggregates."""
+
+    @staticmethod
+    async def record(date: str, model: str, increments: dict):
+        """Add one call's usage to the (date, model) totals."""
+        await get_ai_usage_collection().update_one(
+            {"date": date, "model": model},
+            {"$inc": increments},
+            upsert=True,
+        )
+
+    @staticmethod
+    async def get_by_date(date: str) -> List[dict]:
+        """Get the usage totals of every model for a date (DD-MM-YYYY format)."""
+        cursor = get_ai_usage_collection().find({"date": date}, {"_id": 0})
+        usage = []
+        async for doc in cursor:
+            usage.append(doc)
+        return usage
@@ -57,6 +57,17 @@ def get_subscribers_collection():
     return _subscribers_collection
 
 
+_subscriber_overlays_collection = None
+
+
+def get_subscriber_overlays_collection():
+    """Get the subscriber overlays collection (PNG bytes keyed by content hash)."""
+    global _subscriber_overlays_collection
+    if _subscriber_overlays_collection is None:
+        _subscriber_overlays_collection = get_database().get_collection("subscriber_overlays")
+    return _subscriber_overlays_collection
+
+
 def serialize_subscriber_doc(doc):
     """Convert MongoDB subscriber document to JSON-serializable dict."""
     if not doc:
@@ -0,0 +1,120 @@
+"""
+Delivery repository - per-recipient delivery ledger for distributions.
+
+Every send is recorded under (holiday, date, phone), which a unique index
+makes the idempotency key, so a rerun, a resumed job or a second worker
+cannot send the same day's post to the same phone twice. A recipient is
+claimed as "queued" before its job waits for a send slot, and moved to
+"sending" only once the slot is granted, right before the send. Queued and
+failed deliveries can be claimed by another run (nothing went out for
+them); entries still "sending" (a send interrupted by a crash) are not
+retried, since the message may have gone out. Timestamps are UTC datetimes.
+"""
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+from .connection import get_database
+from config import JOB_RETENTION_SECONDS
+
+_indexes_ready = False
+
+
+def get_deliveries_collection():
+    """Get the delivery ledger collection."""
+    return get_database().get_collection("deliveries")
+
+
+async def _ensure_indexes():
+    """Create the idempotency and TTL indexes once per process."""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    collection = get_deliveries_collection()
+    await collection.create_index(
+        [("holiday", ASCENDING), ("date", ASCENDING), ("phone", ASCENDING)], unique=True
+    )
+    await collection.create_index("job_id")
+    await collection.create_index("expires_at", expireAfterSeconds=0)
+    _indexes_ready = True
+
+
+def _key(holiday: str, date: str, phone: str) -> dict:
+    return {"holiday": holiday, "date": date, "phone": phone}
+
+
+class DeliveryRepository:
+    """Repository class for the delivery ledger."""
+
+    @staticmethod
+    async def get(holiday: str, date: str, phone: str):
+        """Get the ledger entry of a recipient, or None if nothing was attempted."""
+        await _ensure_indexes()
+        return await get_deliveries_collection().find_one(_key(holiday, date, phone), {"_id": 0})
+
+    @staticmethod
+    async def claim(holiday: str, date: str, phone: str, job_id: str) -> bool:
+        """Claim a recipient as queued for sending; False when it was already sent or is being sent."""
+        await _ensure_indexes()
+        collection = get_deliveries_collection()
+        now = datetime.now(timezone.utc)
+        claim = {
+            "status": "queued",
+            "job_id": job_id,
+            "claimed_at": now,
+            "expires_at": now + timedelta(seconds=JOB_RETENTION_SECONDS),
+        }
+        try:
+            await collection.insert_one({**_key(holiday, date, phone), **claim, "attempts": 1})
+            return True
+        except DuplicateKeyError:
+            # Only a delivery that never went out may be attempted again
+            retried = await collection.find_one_and_update(
+                {**_key(holiday, date, phone), "status": {"$in": ["queued", "failed"]}},
+                {"$set": claim, "$inc": {"attempts": 1}},
+            )
+            return retried is not None
+
+    @staticmethod
+    async def mark_sending(holiday: str, date: str, phone: str, job_id: str) -> bool:
+        """Move a job's queued claim to sending; False when another run took the recipient over."""
+        sending = await get_deliveries_collection().find_one_and_update(
+            {**_key(holiday, date, phone), "status": "queued", "job_id": job_id},
+            {"$set": {"status": "sending", "sending_at": datetime.now(timezone.utc)}},
+        )
+        return sending is not None
+
+    @staticmethod
+    async def release(holiday: str, date: str, phone: str, job_id: str):
+        """Give back a job's queued claim, so a later run may claim it."""
+        await get_deliveries_collection().update_one(
+            {**_key(holiday, date, phone), "status": "queued", "job_id": job_id},
+            {"$set": {"status": "failed", "error": "cancelled before sending", "failed_at": datetime.now(timezone.utc)}},
+        )
+
+    @staticmethod
+    async def mark_sent(holiday: str, date: str, phone: str):
+        """Record a successful send."""
+        await get_deliveries_collection().update_one(
+            _key(holiday, date, phone),
+            {"$set": {"status": "sent", "sent_at": datetime.now(timezone.utc)}, "$unset": {"error": ""}},
+        )
+
+    @staticmethod
+    async def mark_failed(holiday: str, date: str, phone: str, error: str, job_id: str = None):
+        """Record a failed send, which a later run may retry (only while job_id still holds the claim, if given)."""
+        query = _key(holiday, date, phone)
+        if job_id:
+            query["job_id"] = job_id
+        await get_deliveries_collection().update_one(
+            query,
+            {"$set": {"status": "failed", "error": error, "failed_at": datetime.now(timezone.utc)}},
+        )
+
+    @staticmethod
+    async def count_by_status(job_id: str) -> dict:
+        """Count a job's ledger entries per status."""
+        pipeline = [{"$match": {"job_id": job_id}}, {"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+        counts = {}
+        async for row in get_deliveries_collection().aggregate(pipeline):
+            counts[row["_id"]] = row["count"]
+        return counts
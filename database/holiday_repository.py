@@ -75,6 +75,22 @@ class HolidayRepository:
         doc = await get_holidays_collection().find_one({"date": date})
         return serialize_holiday_doc(doc) if doc else None
 
+    @staticmethod
+    async def get_by_dates(dates: List[str]) -> List[dict]:
+        """Get all holidays whose date (DD-MM-YYYY format) is in the given list."""
+        cursor = get_holidays_collection().find({"date": {"$in": dates}})
+        holidays = []
+        async for doc in cursor:
+            holidays.append(serialize_holiday_doc(doc))
+        return holidays
+
+    @staticmethod
+    async def set_assets(holiday_id: str, assets: dict):
+        """Record the pre-generated asset state (readiness) of a holiday."""
+        await get_holidays_collection().update_one(
+            {"_id": ObjectId(holiday_id)}, {"$set": {"assets": assets}}
+        )
+
     @staticmethod
     async def update(holiday_id: str, update_data: dict) -> dict:
         """Update a holiday by ID."""
@@ -94,8 +110,10 @@ class HolidayRepository:
                 )
 
         try:
+            # Content changed, so any pre-generated assets are stale
             result = await get_holidays_collection().update_one(
-                {"_id": ObjectId(holiday_id)}, {"$set": update_data}
+                {"_id": ObjectId(holiday_id)},
+                {"$set": update_data, "$unset": {"assets": ""}}
             )
             if result.matched_count == 0:
                 raise HTTPException(status_code=404, detail="Holiday not found")
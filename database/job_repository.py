@@ -0,0 +1,163 @@
+"""
+Job repository - durable distribution job status shared by every worker.
+
+Job documents hold the status and counters; per-recipient results live in
+a separate collection so progress writes stay small ($inc on the job, one
+insert_many per batch of results). Both carry an expires_at date that a TTL
+index uses to drop jobs JOB_RETENTION_SECONDS after their last update. All
+timestamps are stored as UTC datetimes.
+
+A job stores the parameters needed to rerun it and a checkpoint (the last
+recipient processed), so an interrupted job can be resumed.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError
+from .connection import get_database
+from config import JOB_RETENTION_SECONDS
+
+_indexes_ready = False
+
+
+def get_jobs_collection():
+    """Get the distribution jobs collection."""
+    return get_database().get_collection("distribution_jobs")
+
+
+def get_job_results_collection():
+    """Get the per-recipient distribution results collection."""
+    return get_database().get_collection("distribution_job_results")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _expires_at() -> datetime:
+    return _now() + timedelta(seconds=JOB_RETENTION_SECONDS)
+
+
+async def _ensure_indexes():
+    """Create the lookup and TTL indexes once per process."""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    jobs = get_jobs_collection()
+    await jobs.create_index([("kind", ASCENDING), ("started_at", ASCENDING)])
+    await jobs.create_index("expires_at", expireAfterSeconds=0)
+    results = get_job_results_collection()
+    await results.create_index([("job_id", ASCENDING), ("seq", ASCENDING)], unique=True)
+    await results.create_index("expires_at", expireAfterSeconds=0)
+    _indexes_ready = True
+
+
+class JobRepository:
+    """Repository class for distribution jobs and their results."""
+
+    @staticmethod
+    async def create(job_id: str, kind: str, fields: dict):
+        """Create a running job with zeroed counters."""
+        await _ensure_indexes()
+        now = _now()
+        await get_jobs_collection().insert_one({
+            "_id": job_id,
+            "kind": kind,
+            "status": "running",
+            "processed": 0,
+            "successful": 0,
+            "failed": 0,
+            "skipped": 0,
+            **fields,
+            "started_at": now,
+            "updated_at": now,
+            "expires_at": _expires_at(),
+        })
+
+    @staticmethod
+    async def record_progress(
+        job_id: str, counters: dict, results: List[dict], first_seq: int, fields: Optional[dict] = None
+    ):
+        """Apply a batch of counter increments, append its results and set fields (the checkpoint).
+
+        Results are keyed by (job_id, seq), so retrying a batch whose counter
+        update failed does not duplicate them.
+        """
+        if results:
+            expires_at = _expires_at()
+            try:
+                await get_job_results_collection().insert_many([
+                    {"job_id": job_id, "seq": first_seq + offset, **result, "expires_at": expires_at}
+                    for offset, result in enumerate(results)
+                ], ordered=False)
+            except BulkWriteError as e:
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+        update = {"$set": {**(fields or {}), "updated_at": _now(), "expires_at": _expires_at()}}
+        if counters:
+            update["$inc"] = counters
+        await get_jobs_collection().update_one({"_id": job_id}, update)
+
+    @staticmethod
+    async def update(job_id: str, fields: dict):
+        """Set job fields (status, error, completed_at, ...) and extend its retention."""
+        expires_at = _expires_at()
+        await get_jobs_collection().update_one(
+            {"_id": job_id},
+            {"$set": {**fields, "updated_at": _now(), "expires_at": expires_at}},
+        )
+        if fields.get("status") in ("completed", "failed"):
+            # Results are retained as long as the finished job
+            await get_job_results_collection().update_many(
+                {"job_id": job_id}, {"$set": {"expires_at": expires_at}}
+            )
+
+    @staticmethod
+    async def claim_resume(job_id: str, kind: str, stale_seconds: int) -> Optional[dict]:
+        """Mark an interrupted job running again and return it (with its params and checkpoint).
+
+        A job can be resumed when it failed, or when it is still "running"
+        but has not been updated for stale_seconds (its process went away).
+        Returns None when the job does not exist or cannot be resumed.
+        """
+        now = _now()
+        stale_before = now - timedelta(seconds=stale_seconds)
+        return await get_jobs_collection().find_one_and_update(
+            {
+                "_id": job_id,
+                "kind": kind,
+                "$or": [
+                    {"status": "failed"},
+                    {"status": "running", "updated_at": {"$lt": stale_before}},
+                    # Jobs written before timestamps were datetimes (local ISO strings)
+                    {"status": "running", "updated_at": {"$lt": (datetime.now() - timedelta(seconds=stale_seconds)).isoformat()}},
+                ],
+            },
+            {
+                "$set": {"status": "running", "resumed_at": now, "updated_at": now, "expires_at": _expires_at()},
+                "$unset": {"error": ""},
+                "$inc": {"resumes": 1},
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+
+    @staticmethod
+    async def count_results(job_id: str) -> int:
+        """Count the results recorded for a job."""
+        return await get_job_results_collection().count_documents({"job_id": job_id})
+
+    @staticmethod
+    async def get(job_id: str, kind: Optional[str] = None, include_results: bool = True) -> Optional[dict]:
+        """Get a job's status (and results, in send order), or None if it does not exist."""
+        query = {"_id": job_id}
+        if kind:
+            query["kind"] = kind
+        job = await get_jobs_collection().find_one(query, {"_id": 0, "kind": 0, "expires_at": 0})
+        if job is None:
+            return None
+        if include_results:
+            cursor = get_job_results_collection().find(
+                {"job_id": job_id}, {"_id": 0, "job_id": 0, "seq": 0, "expires_at": 0}
+            ).sort("seq", ASCENDING)
+            job["results"] = [result async for result in cursor]
+        return job
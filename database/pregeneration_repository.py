@@ -0,0 +1,84 @@
+"""
+Pregeneration repository - state of the pre-generation scheduler shared by every worker.
+
+Holds the daily image generation budget (one counter per day, reserved with
+an atomic $inc so concurrent workers can never overspend it) and the lease
+that elects the single process running the scheduled pre-generation loop.
+Both carry an expires_at date (UTC) for a TTL index.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from pymongo.errors import DuplicateKeyError
+from .connection import get_database
+
+_indexes_ready = False
+BUDGET_RETENTION_DAYS = 7
+
+
+def get_pregeneration_state_collection():
+    """Get the pre-generation state collection."""
+    return get_database().get_collection("pregeneration_state")
+
+
+async def _ensure_indexes():
+    """Create the TTL index once per process."""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    await get_pregeneration_state_collection().create_index("expires_at", expireAfterSeconds=0)
+    _indexes_ready = True
+
+
+class PregenerationRepository:
+    """Repository class for the pre-generation budget and scheduler lease."""
+
+    @staticmethod
+    async def reserve_budget(date: str, budget: int) -> bool:
+        """Reserve one image generation from a day's budget; False when it is spent."""
+        await _ensure_indexes()
+        try:
+            # Only matches while budget remains; a spent day fails the upsert on its _id instead
+            await get_pregeneration_state_collection().find_one_and_update(
+                {"_id": f"budget:{date}", "spent": {"$lt": budget}},
+                {
+                    "$inc": {"spent": 1},
+                    "$setOnInsert": {
+                        "expires_at": datetime.now(timezone.utc) + timedelta(days=BUDGET_RETENTION_DAYS)
+                    },
+                },
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    @staticmethod
+    async def get_budget_spent(date: str) -> int:
+        """Get how many image generations were reserved on a day."""
+        doc = await get_pregeneration_state_collection().find_one({"_id": f"budget:{date}"})
+        return doc.get("spent", 0) if doc else 0
+
+    @staticmethod
+    async def acquire_lease(name: str, owner: str, ttl_seconds: int) -> bool:
+        """Take or renew a lease; False while another owner holds an unexpired one."""
+        await _ensure_indexes()
+        now = datetime.now(timezone.utc)
+        try:
+            await get_pregeneration_state_collection().find_one_and_update(
+                {"_id": f"lease:{name}", "$or": [{"owner": owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": owner, "renewed_at": now, "expires_at": now + timedelta(seconds=ttl_seconds)}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    @staticmethod
+    async def release_lease(name: str, owner: str):
+        """Give up a lease held by owner."""
+        await get_pregeneration_state_collection().delete_one({"_id": f"lease:{name}", "owner": owner})
+
+    @staticmethod
+    async def get_lease(name: str) -> Optional[dict]:
+        """Get the current holder of a lease, or None."""
+        return await get_pregeneration_state_collection().find_one({"_id": f"lease:{name}"}, {"_id": 0})
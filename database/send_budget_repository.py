@@ -0,0 +1,85 @@
+"""
+Send budget repository - per-sender send budget shared by every worker.
+
+Each WhatsApp sender endpoint has a spacing document holding the earliest
+time of its next send, and one counter per clock hour and UTC day. A send
+slot is reserved by moving the next send time forward and incrementing the
+counters, each with an atomic update that only matches while the budget
+allows it, so workers pacing the same sender can never exceed it together.
+Every document carries an expires_at date (UTC) for a TTL index.
+"""
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import DuplicateKeyError
+from .connection import get_database
+
+_indexes_ready = False
+
+
+def get_send_budget_collection():
+    """Get the send budget collection."""
+    return get_database().get_collection("send_budget")
+
+
+async def _ensure_indexes():
+    """Create the TTL index once per process."""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    await get_send_budget_collection().create_index("expires_at", expireAfterSeconds=0)
+    _indexes_ready = True
+
+
+def _utc(value: datetime) -> datetime:
+    """Stored datetimes come back naive (in UTC)."""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+async def _take_count(key: str, cap: int, window_end: datetime) -> bool:
+    """Count one send in a window; False when the window's cap is reached."""
+    try:
+        await get_send_budget_collection().find_one_and_update(
+            {"_id": key, "count": {"$lt": cap}},
+            {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": window_end + timedelta(days=1)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+class SendBudgetRepository:
+    """Repository class for the shared per-sender send budget."""
+
+    @staticmethod
+    async def reserve(sender: str, gap: float, hourly_cap: int = 0, daily_cap: int = 0) -> float:
+        """Reserve a send slot needing gap seconds since the sender's previous send.
+
+        Returns 0 when the slot is reserved, otherwise the seconds until the
+        budget may allow it (nothing is reserved then).
+        """
+        await _ensure_indexes()
+        collection = get_send_budget_collection()
+        now = datetime.now(timezone.utc)
+        spacing_key = f"spacing:{sender}"
+        try:
+            await collection.find_one_and_update(
+                {"_id": spacing_key, "next_at": {"$lte": now}},
+                {"$set": {"next_at": now + timedelta(seconds=gap), "expires_at": now + timedelta(days=1)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            doc = await collection.find_one({"_id": spacing_key})
+            return max(0.01, (_utc(doc["next_at"]) - now).total_seconds()) if doc else 0.01
+
+        hour_start = now.replace(minute=0, second=0, microsecond=0)
+        hour_end = hour_start + timedelta(hours=1)
+        hour_key = f"hour:{sender}:{hour_start:%Y%m%d%H}"
+        if hourly_cap and not await _take_count(hour_key, hourly_cap, hour_end):
+            return (hour_end - now).total_seconds()
+        day_end = hour_start.replace(hour=0) + timedelta(days=1)
+        if daily_cap and not await _take_count(f"day:{sender}:{now:%Y%m%d}", daily_cap, day_end):
+            if hourly_cap:
+                # Give back the hour's count; the send does not go out
+                await collection.update_one({"_id": hour_key}, {"$inc": {"count": -1}})
+            return (day_end - now).total_seconds()
+        return 0.0
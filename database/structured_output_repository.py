@@ -0,0 +1,62 @@
+"""
+Structured output repository - persistent cache of Gemini prompt/caption results.
+"""
+from datetime import datetime
+from typing import Optional
+from .connection import get_database
+from config import STRUCTURED_OUTPUT_CACHE_TTL_SECONDS
+
+_indexes_ready = False
+
+
+def get_structured_outputs_collection():
+    """Get the structured outputs cache collection."""
+    return get_database().get_collection("structured_outputs")
+
+
+async def _ensure_indexes():
+    """Create the lookup and TTL indexes once per process."""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    collection = get_structured_outputs_collection()
+    await collection.create_index("key", unique=True)
+    await collection.create_index("holiday")
+    await collection.create_index(
+        "created_at", expireAfterSeconds=STRUCTURED_OUTPUT_CACHE_TTL_SECONDS
+    )
+    _indexes_ready = True
+
+
+class StructuredOutputRepository:
+    """Repository class for cached structured outputs."""
+
+    @staticmethod
+    async def get(key: str) -> Optional[dict]:
+        """Get a cached structured output by cache key."""
+        await _ensure_indexes()
+        doc = await get_structured_outputs_collection().find_one({"key": key})
+        return doc.get("result") if doc else None
+
+    @staticmethod
+    async def set(key: str, holiday: str, description: Optional[str], model: str, result: dict):
+        """Store (or replace) a structured output under the given cache key."""
+        await _ensure_indexes()
+        await get_structured_outputs_collection().update_one(
+            {"key": key},
+            {"$set": {
+                "key": key,
+                "holiday": holiday,
+                "description": description,
+                "model": model,
+                "result": result,
+                "created_at": datetime.now(),
+            }},
+            upsert=True,
+        )
+
+    @staticmethod
+    async def delete_for_holiday(holiday: str) -> int:
+        """Delete every cached structured output for a holiday name."""
+        result = await get_structured_outputs_collection().delete_many({"holiday": holiday})
+        return result.deleted_count
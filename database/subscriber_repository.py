@@ -1,31 +1,150 @@
 """
 Subscriber repository for database operations.
+
+Overlay PNGs (normalized at upload, see process_overlay) are stored as BSON
+Binary in the subscriber_overlays collection with a thumbnail, keyed by
+their SHA-256 content hash. Subscriber documents only carry the overlay
+hash, size and dimensions, so roster queries stay small and overlay bytes
+are fetched when a post is actually composited. Each overlay counts the
+subscribers referencing it in "refs" (store_overlay adds one, release_overlay
+takes one and deletes the overlay at zero in the same filter); overlays
+stored before the count existed get it from backfill_overlay_refs.
+
+Distributions read the roster in pages of compact records (id, phone, name,
+overlay hash) ordered by _id, so a job never holds the whole audience and no
+server-side cursor has to stay open across the hours a distribution runs.
 """
+import base64
+import hashlib
 from datetime import datetime
-from bson import ObjectId
+from typing import AsyncIterator, Optional
+from bson import Binary, ObjectId
 from fastapi import HTTPException
-from .connection import get_subscribers_collection, serialize_subscriber_doc
+from pymongo import ReturnDocument
+from config import ROSTER_PAGE_SIZE
+from .connection import (
+    get_subscribers_collection,
+    get_subscriber_overlays_collection,
+    serialize_subscriber_doc,
+)
+
+# Fields kept per recipient for the lifetime of a distribution
+ROSTER_PROJECTION = {"_id": 1, "phone": 1, "name": 1, "overlay_hash": 1}
+
+
+def _invalidate_overlay(subscriber_id: str):
+    """Drop the subscriber's decoded overlays from the in-process cache."""
+    # Imported here: the services package imports the database package
+    from services.overlay_cache import invalidate_subscriber_overlay
+    invalidate_subscriber_overlay(subscriber_id)
 
 
 class SubscriberRepository:
     """Repository class for subscriber CRUD operations."""
 
     @staticmethod
-    async def create(phone: str, overlay_base64: str, name: str = "") -> str:
-        """Create a new subscriber and return the inserted ID."""
+    async def store_overlay(overlay: dict) -> dict:
+        """Store a processed overlay, counting one more reference, and return the overlay fields for the subscriber document."""
+        overlay_bytes = overlay["data"]
+        overlay_hash = hashlib.sha256(overlay_bytes).hexdigest()
+        await get_subscriber_overlays_collection().update_one(
+            {"_id": overlay_hash},
+            {"$setOnInsert": {
+                "data": Binary(overlay_bytes),
+                "thumbnail": Binary(overlay["thumbnail"]),
+                "size": len(overlay_bytes),
+                "created_at": datetime.now(),
+            }, "$inc": {"refs": 1}},
+            upsert=True,
+        )
+        return {
+            "overlay_hash": overlay_hash,
+            "overlay_size": len(overlay_bytes),
+            "overlay_width": overlay["width"],
+            "overlay_height": overlay["height"],
+            "overlay_original_width": overlay["original_width"],
+            "overlay_original_height": overlay["original_height"],
+        }
+
+    @staticmethod
+    async def get_overlay(overlay_hash: str) -> bytes:
+        """Get overlay PNG bytes by content hash."""
+        doc = await get_subscriber_overlays_collection().find_one({"_id": overlay_hash})
+        if not doc:
+            raise HTTPException(status_code=404, detail="Subscriber overlay not found")
+        return bytes(doc["data"])
+
+    @staticmethod
+    async def get_overlay_thumbnail(overlay_hash: str) -> bytes:
+        """Get an overlay's PNG thumbnail by content hash."""
+        doc = await get_subscriber_overlays_collection().find_one({"_id": overlay_hash}, {"thumbnail": 1})
+        if not doc or not doc.get("thumbnail"):
+            raise HTTPException(status_code=404, detail="Subscriber overlay thumbnail not found")
+        return bytes(doc["thumbnail"])
+
+    @staticmethod
+    async def get_overlay_bytes(subscriber: dict) -> bytes:
+        """Get a subscriber's overlay bytes (from the overlay store or a legacy base64 field)."""
+        if subscriber.get("overlay_hash"):
+            return await SubscriberRepository.get_overlay(subscriber["overlay_hash"])
+        if subscriber.get("overlay"):
+            return base64.b64decode(subscriber["overlay"])
+        if "overlay" not in subscriber and subscriber.get("_id"):
+            # Compact roster record: fetch a legacy base64 overlay just in time
+            doc = await get_subscribers_collection().find_one({"_id": subscriber["_id"]}, {"overlay": 1})
+            if doc and doc.get("overlay"):
+                return base64.b64decode(doc["overlay"])
+        raise HTTPException(status_code=404, detail="Subscriber has no overlay")
+
+    @staticmethod
+    async def release_overlay(overlay_hash: str):
+        """Drop one reference to a stored overlay and delete it once none are left."""
+        if not overlay_hash:
+            return
+        collection = get_subscriber_overlays_collection()
+        # Overlays without a count (not backfilled yet) are kept rather than guessed at
+        await collection.update_one({"_id": overlay_hash, "refs": {"$exists": True}}, {"$inc": {"refs": -1}})
+        await collection.delete_one({"_id": overlay_hash, "refs": {"$lte": 0}})
+
+    @staticmethod
+    async def backfill_overlay_refs() -> int:
+        """Set every stored overlay's reference count from the subscribers using it; returns the overlays updated."""
+        counts = {}
+        pipeline = [
+            {"$match": {"overlay_hash": {"$exists": True}}},
+            {"$group": {"_id": "$overlay_hash", "refs": {"$sum": 1}}},
+        ]
+        async for row in get_subscribers_collection().aggregate(pipeline):
+            counts[row["_id"]] = row["refs"]
+        collection = get_subscriber_overlays_collection()
+        updated = 0
+        async for doc in collection.find({}, {"_id": 1, "refs": 1}):
+            refs = counts.get(doc["_id"], 0)
+            if doc.get("refs") != refs:
+                await collection.update_one({"_id": doc["_id"]}, {"$set": {"refs": refs}})
+                updated += 1
+        return updated
+
+    @staticmethod
+    async def create(phone: str, overlay: dict, name: str = "") -> str:
+        """Create a new subscriber with a processed overlay and return the inserted ID."""
         subscriber_data = {
             "name": name,
             "phone": phone,
-            "overlay": overlay_base64,  # stored as base64 string
+            **await SubscriberRepository.store_overlay(overlay),
             "created_at": datetime.now(),
         }
-        result = await get_subscribers_collection().insert_one(subscriber_data)
+        try:
+            result = await get_subscribers_collection().insert_one(subscriber_data)
+        except Exception:
+            await SubscriberRepository.release_overlay(subscriber_data["overlay_hash"])
+            raise
         return str(result.inserted_id)
 
     @staticmethod
     async def get_all():
         """Get all subscribers (excluding overlay for performance)."""
-        projection = {"overlay": 0}  # Exclude overlay from list response
+        projection = {"overlay": 0}  # Exclude legacy base64 overlays from list response
         cursor = get_subscribers_collection().find({}, projection)
         subscribers = []
         async for doc in cursor:
@@ -33,36 +152,89 @@ class SubscriberRepository:
         return subscribers
 
     @staticmethod
-    async def get_by_id(subscriber_id: str):
-        """Get a subscriber by ID."""
+    async def get_by_id(subscriber_id: str, include_overlay: bool = True):
+        """Get a subscriber by ID, with the overlay as base64 unless include_overlay is False."""
         try:
             doc = await get_subscribers_collection().find_one({"_id": ObjectId(subscriber_id)})
             if not doc:
                 raise HTTPException(status_code=404, detail="Subscriber not found")
+            if include_overlay and doc.get("overlay_hash"):
+                overlay_bytes = await SubscriberRepository.get_overlay(doc["overlay_hash"])
+                doc["overlay"] = base64.b64encode(overlay_bytes).decode("utf-8")
+            elif not include_overlay:
+                doc.pop("overlay", None)
             return serialize_subscriber_doc(doc)
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid Subscriber ID or query failed")
 
     @staticmethod
-    async def get_all_raw():
-        """Get all subscribers with raw data (for internal use)."""
-        cursor = get_subscribers_collection().find({})
-        subscribers = []
-        async for doc in cursor:
-            subscribers.append(doc)
-        return subscribers
+    async def get_roster_snapshot() -> dict:
+        """Get the roster size and the last _id at this moment (the bounds of a distribution)."""
+        collection = get_subscribers_collection()
+        last = await collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        return {
+            "total": await collection.count_documents({}),
+            "last_id": last["_id"] if last else None,
+        }
 
     @staticmethod
-    async def update(subscriber_id: str, update_data: dict):
-        """Update a subscriber by ID."""
-        if not update_data:
+    async def iter_roster(
+        last_id: Optional[ObjectId] = None,
+        page_size: int = ROSTER_PAGE_SIZE,
+        after: Optional[ObjectId] = None,
+    ) -> AsyncIterator[dict]:
+        """Yield compact roster records in _id order, one page query at a time.
+
+        Subscribers created after last_id (from get_roster_snapshot) are not
+        included, so the audience of a running distribution stays fixed;
+        after skips the records up to a resumed job's checkpoint.
+        """
+        collection = get_subscribers_collection()
+        while True:
+            query = {}
+            if after is not None:
+                query["_id"] = {"$gt": after}
+            if last_id is not None:
+                query.setdefault("_id", {})["$lte"] = last_id
+            page = await collection.find(query, ROSTER_PROJECTION).sort("_id", 1).limit(page_size).to_list(page_size)
+            for record in page:
+                yield record
+            if len(page) < page_size:
+                return
+            after = page[-1]["_id"]
+
+    @staticmethod
+    async def get_roster_record(subscriber_id: str) -> Optional[dict]:
+        """Get the compact roster record of one subscriber."""
+        try:
+            return await get_subscribers_collection().find_one({"_id": ObjectId(subscriber_id)}, ROSTER_PROJECTION)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid Subscriber ID or query failed")
+
+    @staticmethod
+    async def update(subscriber_id: str, update_data: dict, overlay: dict = None):
+        """Update a subscriber by ID, replacing the overlay when a processed overlay is given."""
+        if not update_data and overlay is None:
             raise HTTPException(status_code=400, detail="No fields to update")
         try:
-            result = await get_subscribers_collection().update_one(
-                {"_id": ObjectId(subscriber_id)}, {"$set": update_data}
+            update = {"$set": dict(update_data)}
+            if overlay is not None:
+                update["$set"].update(await SubscriberRepository.store_overlay(overlay))
+                update["$unset"] = {"overlay": ""}
+            previous = await get_subscribers_collection().find_one_and_update(
+                {"_id": ObjectId(subscriber_id)},
+                update,
+                projection={"overlay_hash": 1},
+                return_document=ReturnDocument.BEFORE,
             )
-            if result.matched_count == 0:
+            if previous is None:
+                if overlay is not None:
+                    await SubscriberRepository.release_overlay(update["$set"]["overlay_hash"])
                 raise HTTPException(status_code=404, detail="Subscriber not found")
+            if overlay is not None:
+                # Also when unchanged: store_overlay counted the new reference
+                await SubscriberRepository.release_overlay(previous.get("overlay_hash"))
+            _invalidate_overlay(subscriber_id)
             return {"status": "success", "message": "Subscriber updated successfully"}
         except HTTPException:
             raise
@@ -73,9 +245,13 @@ class SubscriberRepository:
     async def delete(subscriber_id: str):
         """Delete a subscriber by ID."""
         try:
-            result = await get_subscribers_collection().delete_one({"_id": ObjectId(subscriber_id)})
-            if result.deleted_count == 0:
+            deleted = await get_subscribers_collection().find_one_and_delete(
+                {"_id": ObjectId(subscriber_id)}, projection={"overlay_hash": 1}
+            )
+            if deleted is None:
                 raise HTTPException(status_code=404, detail="Subscriber not found")
+            await SubscriberRepository.release_overlay(deleted.get("overlay_hash"))
+            _invalidate_overlay(subscriber_id)
             return {"status": "success", "message": "Subscriber deleted successfully"}
         except HTTPException:
             raise
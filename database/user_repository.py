@@ -7,6 +7,13 @@ from fastapi import HTTPException
 from .connection import get_collection, serialize_doc
 
 
+def _invalidate_brand_layer(user_id: str):
+    """Drop the user's pre-rendered brand layers from the in-process cache."""
+    # Imported here: the services package imports the database package
+    from services.brand_layer import invalidate_user_brand_layer
+    invalidate_user_brand_layer(user_id)
+
+
 class UserRepository:
     """Repository class for user CRUD operations."""
 
@@ -45,6 +52,11 @@ class UserRepository:
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid User ID or query failed")
 
+    @staticmethod
+    async def get_raw_by_id(user_id: str):
+        """Get a user by ID with raw data (for internal use), or None."""
+        return await get_collection().find_one({"_id": ObjectId(user_id)})
+
     @staticmethod
     async def get_all_raw():
         """Get all users with raw data (for internal use)."""
@@ -65,6 +77,7 @@ class UserRepository:
             )
             if result.matched_count == 0:
                 raise HTTPException(status_code=404, detail="User not found")
+            _invalidate_brand_layer(user_id)
             return {"status": "success", "message": "User updated successfully"}
         except HTTPException:
             raise
@@ -78,6 +91,7 @@ class UserRepository:
             result = await get_collection().delete_one({"_id": ObjectId(user_id)})
             if result.deleted_count == 0:
                 raise HTTPException(status_code=404, detail="User not found")
+            _invalidate_brand_layer(user_id)
             return {"status": "success", "message": "User deleted successfully"}
         except HTTPException:
             raise
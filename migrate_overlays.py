@@ -0,0 +1,79 @@
+"""
+Migration Script: Subscriber overlays to binary storage
+Moves base64 overlay strings out of subscriber documents into the
+subscriber_overlays collection, normalizing each overlay to IMAGE_SIZE
+(see process_overlay) and recording its hash, size and dimensions.
+Overlays stored before normalization existed are re-processed as well.
+Reference counts of the stored overlays are recomputed first, so run it
+while no subscribers are being created, updated or deleted.
+"""
+import asyncio
+import base64
+from database import SubscriberRepository, get_subscribers_collection
+from services import process_overlay
+
+
+async def migrate_overlays():
+    """Migrate legacy subscriber overlays to normalized binary storage."""
+    print("Starting subscriber overlay migration...")
+
+    backfilled = await SubscriberRepository.backfill_overlay_refs()
+    print(f"Recounted references of {backfilled} stored overlays")
+
+    collection = get_subscribers_collection()
+    query = {"$or": [
+        {"overlay": {"$type": "string"}},
+        {"overlay_hash": {"$exists": True}, "overlay_width": {"$exists": False}},
+    ]}
+    total = await collection.count_documents(query)
+    print(f"Found {total} subscribers with base64 or unnormalized overlays")
+
+    success_count = 0
+    error_count = 0
+    saved_bytes = 0
+
+    # Only ids are listed up front so a single overlay is held in memory at a time
+    subscriber_ids = [doc["_id"] async for doc in collection.find(query, {"_id": 1})]
+
+    for subscriber_id in subscriber_ids:
+        try:
+            doc = await collection.find_one({"_id": subscriber_id}, {"overlay": 1, "overlay_hash": 1, "phone": 1})
+            if not doc:
+                continue
+
+            if isinstance(doc.get("overlay"), str):
+                original_size = len(doc["overlay"])
+                overlay_bytes = base64.b64decode(doc["overlay"])
+            else:
+                overlay_bytes = await SubscriberRepository.get_overlay(doc["overlay_hash"])
+                original_size = len(overlay_bytes)
+
+            processed = await asyncio.to_thread(process_overlay, overlay_bytes)
+            overlay_fields = await SubscriberRepository.store_overlay(processed)
+            await collection.update_one(
+                {"_id": subscriber_id},
+                {"$set": overlay_fields, "$unset": {"overlay": ""}},
+            )
+            # Also when unchanged: store_overlay counted the new reference
+            await SubscriberRepository.release_overlay(doc.get("overlay_hash"))
+
+            success_count += 1
+            saved_bytes += original_size - overlay_fields["overlay_size"]
+            print(
+                f"Migrated: {subscriber_id} ({doc.get('phone', '')}) - "
+                f"{original_size} -> {overlay_fields['overlay_size']} bytes"
+            )
+        except Exception as e:
+            error_count += 1
+            print(f"Failed to migrate {subscriber_id}: {str(e)}")
+
+    print("\n" + "="*60)
+    print(f"Migration Complete!")
+    print(f"Successfully migrated: {success_count} subscribers")
+    print(f"Failed: {error_count} subscribers")
+    print(f"Overlay bytes saved: {saved_bytes / 1024:.1f} KB")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate_overlays())
@@ -2,7 +2,7 @@
 Pydantic models for request/response validation.
 """
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 
 
@@ -35,12 +35,16 @@ class HolidayResponse(BaseModel):
     prompt: str
     description: Optional[str] = None
     created_at: Optional[str] = None
+    assets: Optional[dict] = None
 
 
 class SendFestivalRequest(BaseModel):
     """Request model for sending a specific festival to a subscriber."""
     subscriber_id: str
     festival_id: str
+    force_refresh: bool = Field(False, description="Regenerate instead of using the cached prompt/caption")
+    regenerate_image: bool = Field(False, description="Generate a new base image instead of reusing the stored one")
+    encoding_profile: Optional[str] = Field(None, description="Output encoding profile (defaults to DEFAULT_ENCODING_PROFILE)")
 
 
 class GeneratePromptResponse(BaseModel):
@@ -50,3 +54,11 @@ class GeneratePromptResponse(BaseModel):
     ai_input_context: str
     generated_image_prompt: str
     generated_caption: str
+
+
+class BatchPreviewRequest(BaseModel):
+    """Request model for previewing prompts of many festivals at once."""
+    start_date: Optional[str] = Field(None, description="Range start in DD-MM-YYYY format", example="01-12-2025")
+    end_date: Optional[str] = Field(None, description="Range end (inclusive) in DD-MM-YYYY format", example="31-12-2025")
+    holiday_ids: Optional[List[str]] = Field(None, description="Explicit list of holiday IDs (instead of a date range)")
+    force_refresh: bool = Field(False, description="Regenerate instead of using the cached prompts/captions")
@@ -5,6 +5,8 @@ from .posts import router as posts_router
 from .subscribers import router as subscribers_router
 from .holidays import router as holidays_router
 from .test_post import router as test_post_router
+from .pregeneration import router as pregeneration_router
+from .metrics import router as metrics_router
 
 __all__ = [
 	"health_router",
@@ -13,4 +15,6 @@ __all__ = [
 	"subscribers_router",
 	"holidays_router",
 	"test_post_router",
+	"pregeneration_router",
+	"metrics_router",
 ]
@@ -1,15 +1,35 @@
 """
 Holiday API Routes - CRUD operations for holidays.
 """
-from fastapi import APIRouter, HTTPException, status
+import json
+import asyncio
+from datetime import datetime, timedelta
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from typing import List
-from models.schemas import HolidayCreate, HolidayUpdate, HolidayResponse, GeneratePromptResponse
+from config import PREVIEW_BATCH_CONCURRENCY, PREVIEW_BATCH_MAX_ITEMS
+from models.schemas import (
+    HolidayCreate,
+    HolidayUpdate,
+    HolidayResponse,
+    GeneratePromptResponse,
+    BatchPreviewRequest,
+)
 from database import HolidayRepository
-from services import generate_structured_output
+from services import generate_structured_output, invalidate_structured_output, get_image_store
 
 router = APIRouter(prefix="/holidays", tags=["Holidays"])
 
 
+async def _invalidate_cached_outputs(holiday_name: str):
+    """Drop cached AI output for a holiday without failing the caller."""
+    try:
+        removed = await invalidate_structured_output(holiday_name)
+        print(f"[Holidays] Invalidated {removed} cached outputs for: {holiday_name}")
+    except Exception as e:
+        print(f"[Holidays] Warning: Could not invalidate cached outputs for {holiday_name}: {e}")
+
+
 @router.post(
     "/",
     response_model=dict,
@@ -108,7 +128,10 @@ async def update_holiday(holiday_id: str, holiday: HolidayUpdate):
             detail="No fields provided for update"
         )
 
-    return await HolidayRepository.update(holiday_id, update_data)
+    existing = await HolidayRepository.get_by_id(holiday_id)
+    result = await HolidayRepository.update(holiday_id, update_data)
+    await _invalidate_cached_outputs(existing.get("prompt"))
+    return result
 
 
 @router.delete(
@@ -119,7 +142,14 @@ async def update_holiday(holiday_id: str, holiday: HolidayUpdate):
 )
 async def delete_holiday(holiday_id: str):
     """Delete a holiday by ID."""
-    return await HolidayRepository.delete(holiday_id)
+    existing = await HolidayRepository.get_by_id(holiday_id)
+    result = await HolidayRepository.delete(holiday_id)
+    await _invalidate_cached_outputs(existing.get("prompt"))
+    try:
+        await asyncio.to_thread(get_image_store().delete, holiday_id)
+    except Exception as e:
+        print(f"[Holidays] Warning: Could not delete stored images for {holiday_id}: {e}")
+    return result
 
 
 @router.get(
@@ -128,7 +158,10 @@ async def delete_holiday(holiday_id: str):
     summary="Preview image generation prompt",
     description="Generate and preview the AI prompt that will be sent to the image generation model for a specific festival."
 )
-async def preview_image_prompt(holiday_id: str):
+async def preview_image_prompt(
+    holiday_id: str,
+    force_refresh: bool = Query(False, description="Regenerate instead of using the cached prompt/caption"),
+):
     """
     Preview the image generation prompt for a festival.
 
@@ -143,42 +176,144 @@ async def preview_image_prompt(holiday_id: str):
     if not holiday_data:
         raise HTTPException(status_code=404, detail="Festival not found")
 
+    try:
+        return await _build_prompt_preview(holiday_data, force_refresh)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to generate prompt: {str(e)}"
+        )
+
+
+async def _build_prompt_preview(holiday_data: dict, force_refresh: bool = False) -> GeneratePromptResponse:
+    """Generate the prompt preview (context, image prompt, caption) for a holiday."""
     festival_name = holiday_data.get("prompt")
     festival_description = holiday_data.get("description")
 
-    # 2. Build AI input context (same as in generate_structured_output)
+    # Build AI input context (same as in generate_structured_output)
     if festival_description:
         ai_input_context = f"{festival_name}. Context: {festival_description}"
     else:
         ai_input_context = festival_name
 
+    # Generate structured output (prompt + caption)
+    print(f"\n[Preview] Generating prompt for: {festival_name}")
+    if festival_description:
+        print(f"[Preview] With description: {festival_description}")
+
+    structured_output = await generate_structured_output(
+        festival_name, festival_description, force_refresh=force_refresh
+    )
+    image_prompt = structured_output.get("prompt", "")
+    caption = structured_output.get("caption", "")
+
+    print(f"[Preview] Generated image prompt length: {len(image_prompt)} characters")
+    print(f"[Preview] Generated caption: {caption}")
+
+    return GeneratePromptResponse(
+        festival_name=festival_name,
+        festival_description=festival_description,
+        ai_input_context=ai_input_context,
+        generated_image_prompt=image_prompt,
+        generated_caption=caption
+    )
+
+
+def _dates_in_range(start_date: str, end_date: str) -> List[str]:
+    """List every date (DD-MM-YYYY) from start_date through end_date."""
     try:
-        # 3. Generate structured output (prompt + caption)
-        print(f"\n[Preview] Generating prompt for: {festival_name}")
-        if festival_description:
-            print(f"[Preview] With description: {festival_description}")
-
-        structured_output = generate_structured_output(festival_name, festival_description)
-        image_prompt = structured_output.get("prompt", "")
-        caption = structured_output.get("caption", "")
-
-        print(f"[Preview] Generated image prompt length: {len(image_prompt)} characters")
-        print(f"[Preview] Generated caption: {caption}")
-
-        return GeneratePromptResponse(
-            festival_name=festival_name,
-            festival_description=festival_description,
-            ai_input_context=ai_input_context,
-            generated_image_prompt=image_prompt,
-            generated_caption=caption
+        start = datetime.strptime(start_date, "%d-%m-%Y")
+        end = datetime.strptime(end_date, "%d-%m-%Y")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be in DD-MM-YYYY format")
+    if end < start:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    days = (end - start).days + 1
+    if days > PREVIEW_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Date range too large (max {PREVIEW_BATCH_MAX_ITEMS} days)"
         )
+    return [(start + timedelta(days=offset)).strftime("%d-%m-%Y") for offset in range(days)]
 
-    except Exception as e:
+
+@router.post(
+    "/preview-prompts",
+    summary="Preview image generation prompts in bulk",
+    description="Generate prompt previews for a date range or a list of holiday IDs. "
+                "Results are streamed as NDJSON, one line per holiday as soon as it completes, "
+                "followed by a summary line."
+)
+async def preview_image_prompts(request: BatchPreviewRequest):
+    """
+    Preview the image generation prompts for many festivals at once.
+
+    Generation fans out with bounded concurrency (PREVIEW_BATCH_CONCURRENCY).
+    Each streamed line reports success or the error for that holiday, so a
+    single failure does not abort the batch.
+    """
+    if request.holiday_ids:
+        if len(request.holiday_ids) > PREVIEW_BATCH_MAX_ITEMS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Too many holiday IDs (max {PREVIEW_BATCH_MAX_ITEMS})"
+            )
+        items = [{"holiday_id": holiday_id} for holiday_id in request.holiday_ids]
+    elif request.start_date and request.end_date:
+        holidays = await HolidayRepository.get_by_dates(
+            _dates_in_range(request.start_date, request.end_date)
+        )
+        holidays.sort(key=lambda holiday: datetime.strptime(holiday["date"], "%d-%m-%Y"))
+        items = [{"holiday_id": holiday["id"], "holiday": holiday} for holiday in holidays]
+    else:
         raise HTTPException(
-            status_code=500,
-            detail=f"Failed to generate prompt: {str(e)}"
+            status_code=400,
+            detail="Provide either holiday_ids or both start_date and end_date"
         )
 
+    semaphore = asyncio.Semaphore(PREVIEW_BATCH_CONCURRENCY)
+
+    async def _preview_one(item: dict) -> dict:
+        async with semaphore:
+            try:
+                holiday_data = item.get("holiday") or await HolidayRepository.get_by_id(item["holiday_id"])
+                preview = await _build_prompt_preview(holiday_data, request.force_refresh)
+                return {
+                    "holiday_id": item["holiday_id"],
+                    "date": holiday_data.get("date"),
+                    "success": True,
+                    **preview.model_dump(),
+                }
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                return {
+                    "holiday_id": item["holiday_id"],
+                    "date": (item.get("holiday") or {}).get("date"),
+                    "success": False,
+                    "error": detail,
+                }
+
+    async def _stream():
+        succeeded = 0
+        tasks = [asyncio.create_task(_preview_one(item)) for item in items]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                succeeded += 1 if result["success"] else 0
+                yield json.dumps(result) + "\n"
+        finally:
+            # Client disconnected: stop generating the rest
+            for task in tasks:
+                task.cancel()
+        yield json.dumps({
+            "done": True,
+            "total": len(items),
+            "succeeded": succeeded,
+            "failed": len(items) - succeeded,
+        }) + "\n"
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
 
 @router.delete(
     "/",
@@ -0,0 +1,81 @@
+"""
+Metrics endpoints - runtime counters for the generation pipeline.
+"""
+from datetime import datetime
+from fastapi import APIRouter, Query
+from database import AIUsageRepository
+from services import (
+    get_single_flight_stats,
+    get_rate_limit_stats,
+    get_metrics_snapshot,
+    get_overlay_cache_stats,
+    get_render_stats,
+    get_brand_layer_stats,
+    get_image_executor_stats,
+    get_send_scheduler_stats,
+)
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+@router.get("/single-flight")
+async def single_flight_metrics():
+    """Get how many AI calls were executed and how many were coalesced."""
+    return get_single_flight_stats()
+
+
+@router.get("/rate-limits")
+async def rate_limit_metrics():
+    """Get the per-model token bucket state (tokens, queue depth, throttling)."""
+    return get_rate_limit_stats()
+
+
+@router.get("/overlay-cache")
+async def overlay_cache_metrics():
+    """Get the decoded subscriber overlay cache size, budget and hit rate."""
+    return get_overlay_cache_stats()
+
+
+@router.get("/brand-layers")
+async def brand_layer_metrics():
+    """Get the pre-rendered legacy user brand layer cache size and hit rate."""
+    return get_brand_layer_stats()
+
+
+@router.get("/render")
+async def render_metrics():
+    """Get the render engine worker count, in-flight batches and item counters."""
+    return get_render_stats()
+
+
+@router.get("/image-work")
+async def image_work_metrics():
+    """Get the request-path image work pool: threads, queue depth, rejections and upload limits."""
+    return get_image_executor_stats()
+
+
+@router.get("/send-scheduler")
+async def send_scheduler_metrics():
+    """Get each WhatsApp sender's pacing budget, recent sends and waiting senders per lane."""
+    return get_send_scheduler_stats()
+
+
+@router.get("/ai")
+async def ai_metrics():
+    """Get AI call histograms (latency, tokens, image bytes) and counters for this worker."""
+    return get_metrics_snapshot()
+
+
+@router.get("/ai/cost")
+async def ai_cost(
+    date: str = Query(None, description="Date in DD-MM-YYYY format (defaults to today)"),
+):
+    """Get the estimated AI usage and cost for a day, per model, across all workers."""
+    date = date or datetime.now().strftime("%d-%m-%Y")
+    models = await AIUsageRepository.get_by_date(date)
+    return {
+        "date": date,
+        "models": models,
+        "total_calls": sum(model.get("calls", 0) for model in models),
+        "estimated_cost_usd": round(sum(model.get("cost_usd", 0.0) for model in models), 4),
+    }
@@ -1,27 +1,29 @@
 """
 Post generation endpoints.
 """
-import random
-import asyncio
-import uuid
-from datetime import datetime
 from fastapi import APIRouter, HTTPException, Query, BackgroundTasks
-from config import DEFAULT_PHONE_NUMBER
+from config import DEFAULT_PHONE_NUMBER, DEFAULT_ENCODING_PROFILE
 from models import GeneratePostResponse
-from database import UserRepository
+from database import UserRepository, JobRepository
 from services import (
     get_holiday_with_description_for_today,
     generate_structured_output,
-    generate_image,
+    get_base_image,
+    holiday_image_key,
     overlay_images,
-    image_to_base64,
+    user_footer_text,
+    encode_image,
+    get_encoding_profile,
+    run_image_work,
     send_to_whatsapp,
+    acquire_send_slot,
+    check_send_slot,
+    JobTracker,
 )
 
 router = APIRouter(tags=["Posts"])
 
-# In-memory job tracker
-distribution_jobs = {}
+JOB_KIND = "user_distribution"
 
 
 @router.post("/generate-post", response_model=GeneratePostResponse)
@@ -30,12 +32,20 @@ async def generate_post(
     phone: str = Query(DEFAULT_PHONE_NUMBER, description="Receiver phone number"),
     mail: str = Query("ANDROCODERS21@GMAIL.COM", description="Email for footer"),
     website: str = Query("ANDROCODERS.IN", description="Website for footer"),
+    force_refresh: bool = Query(False, description="Regenerate instead of using the cached prompt/caption"),
+    regenerate_image: bool = Query(False, description="Generate a new base image instead of reusing the stored one"),
+    encoding_profile: str = Query(None, description="Output encoding profile (e.g. png, jpeg, webp-small; defaults to DEFAULT_ENCODING_PROFILE)"),
 ):
     """
     Generate and send a custom holiday post.
     Useful for testing specific holidays or branding.
     """
+    get_encoding_profile(encoding_profile)
+    # Refuse before generating anything when the sender is busy (e.g. a distribution is running)
+    check_send_slot()
+
     # Step 1: Resolve Holiday
+    holiday_id = None
     holiday_description = None
     if not holiday:
         holiday_data = await get_holiday_with_description_for_today()
@@ -44,11 +54,14 @@ async def generate_post(
                 status_code=404,
                 detail="No holiday found for today and no holiday parameter provided"
             )
+        holiday_id = holiday_data.get("id")
         holiday = holiday_data.get("prompt")
         holiday_description = holiday_data.get("description")
 
     # Step 2: Generate structured output (prompt and caption) with description
-    structured_output = generate_structured_output(holiday, holiday_description)
+    structured_output = await generate_structured_output(
+        holiday, holiday_description, force_refresh=force_refresh
+    )
     image_prompt = structured_output.get("prompt", "")
     caption = structured_output.get("caption", "")
 
@@ -56,17 +69,22 @@ async def generate_post(
         raise HTTPException(status_code=500, detail="Failed to generate image prompt")
 
     # Step 3: Generate and Customize Image
-    generated_image = generate_image(image_prompt)
+    base = await get_base_image(
+        holiday_image_key(holiday_id, holiday), image_prompt, regenerate=regenerate_image
+    )
+    generated_image = base["image"]
 
     footer = f"+91 {phone}   |   {mail.upper()}   |   {website.upper()}"
-    final_image = overlay_images(generated_image, footer_text=footer)
-
-    # Step 4: Convert to base64
-    image_base64 = image_to_base64(final_image)
+    # Steps 3-4: Overlay and encode off the event loop
+    image_data = await run_image_work(
+        "generate_post",
+        lambda: encode_image(overlay_images(generated_image, footer_text=footer), encoding_profile),
+    )
 
-    # Step 5: Send to WhatsApp
+    # Step 5: Send to WhatsApp (one-off sends go ahead of distributions)
+    await acquire_send_slot("priority")
     try:
-        await send_to_whatsapp(image_base64, caption, phone=phone)
+        await send_to_whatsapp(image_data, caption, phone=phone)
         return GeneratePostResponse(
             success=True,
             holiday=holiday,
@@ -83,18 +101,26 @@ async def generate_post(
 
 
 @router.post("/distribute-holiday-post")
-async def distribute_holiday_post(background_tasks: BackgroundTasks):
+async def distribute_holiday_post(
+    background_tasks: BackgroundTasks,
+    force_refresh: bool = Query(False, description="Regenerate instead of using the cached prompt/caption"),
+    regenerate_image: bool = Query(False, description="Generate a new base image instead of reusing the stored one"),
+    encoding_profile: str = Query(None, description="Output encoding profile (e.g. png, jpeg, webp-small; defaults to DEFAULT_ENCODING_PROFILE)"),
+):
     """
     Generate a holiday post once and send customized versions to all users
-    with randomized staggered delays to avoid rate-limiting/bans.
+    paced by the sender's send scheduler to avoid rate-limiting/bans.
 
     Returns immediately with a job_id. Use /distribution-status/{job_id} to check progress.
     """
+    get_encoding_profile(encoding_profile)
+
     # 1. Get Today's Holiday with description
     holiday_data = await get_holiday_with_description_for_today()
     if not holiday_data:
         return {"status": "error", "message": "No holiday found for today"}
 
+    holiday_id = holiday_data.get("id")
     holiday = holiday_data.get("prompt")
     holiday_description = holiday_data.get("description")
 
@@ -105,35 +131,36 @@ async def distribute_holiday_post(background_tasks: BackgroundTasks):
         return {"status": "error", "message": "No users found in database"}
 
     # 3. Generate Base Image (Once) with description for better context
-    structured_output = generate_structured_output(holiday, holiday_description)
+    structured_output = await generate_structured_output(
+        holiday, holiday_description, force_refresh=force_refresh
+    )
     image_prompt = structured_output.get("prompt", "")
     caption = structured_output.get("caption", "")
 
     if not image_prompt:
         raise HTTPException(status_code=500, detail="Failed to generate image prompt")
 
-    generated_base_image = generate_image(image_prompt)
+    base = await get_base_image(
+        holiday_image_key(holiday_id, holiday), image_prompt, regenerate=regenerate_image
+    )
+    generated_base_image = base["image"]
 
-    # 4. Create a job ID and start background task
-    job_id = str(uuid.uuid4())
-    distribution_jobs[job_id] = {
-        "status": "running",
+    # 4. Create the job and start background task
+    tracker = await JobTracker.start(JOB_KIND, {
         "holiday": holiday,
         "total_users": len(users),
-        "processed": 0,
-        "successful": 0,
-        "failed": 0,
-        "started_at": datetime.now().isoformat(),
-        "results": []
-    }
+        "encoding_profile": encoding_profile or DEFAULT_ENCODING_PROFILE,
+    })
+    job_id = tracker.job_id
 
     # Start background task
     background_tasks.add_task(
         _process_distribution,
-        job_id,
+        tracker,
         users,
         generated_base_image,
-        caption
+        caption,
+        encoding_profile
     )
 
     return {
@@ -145,55 +172,52 @@ async def distribute_holiday_post(background_tasks: BackgroundTasks):
     }
 
 
-async def _process_distribution(job_id: str, users: list, base_image, caption: str):
-    """Background task to process the distribution with staggered delays."""
-    job = distribution_jobs[job_id]
+async def _process_distribution(
+    tracker: JobTracker, users: list, base_image, caption: str, encoding_profile: str = None
+):
+    """Background task to process the distribution, paced by the send scheduler."""
+    job_id = tracker.job_id
 
-    for index, user in enumerate(users):
+    for user in users:
         try:
-            # Custom footer: "Phone | Mail | Website"
-            footer = f"{user.get('phone', '')}   |   {user.get('mail', '').upper()}   |   {user.get('website', '').upper()}"
-
-            # Overlay specific logo and footer
-            custom_image = overlay_images(
-                base_image,
-                logo_data=user.get("logo"),
-                footer_text=footer
-            )
-
-            # Send
-            image_b64 = image_to_base64(custom_image)
-
-            # Wait for a random time before sending (except first user)
-            if index > 0:
-                delay_seconds = random.randint(30, 300)
-                print(f"[Job {job_id}] Waiting {delay_seconds}s before sending to {user.get('phone')}...")
-                await asyncio.sleep(delay_seconds)
-
-            api_res = await send_to_whatsapp(image_b64, caption, phone=user.get("phone"))
-
-            job["results"].append({
+            # Overlay the user's pre-rendered brand layer (logo + overlay + footer)
+            def render(user=user):
+                custom_image = overlay_images(
+                    base_image,
+                    logo_data=user.get("logo"),
+                    footer_text=user_footer_text(user),
+                    user_id=str(user["_id"])
+                )
+                return encode_image(custom_image, encoding_profile)
+
+            # Send (background job: waits for a slot instead of being rejected)
+            image_data = await run_image_work("distribution", render, reject_when_full=False)
+
+            # Wait for the sender's next slot (shared with every other job)
+            print(f"[Job {job_id}] Waiting for a send slot for {user.get('phone')}...")
+            await tracker.wait(acquire_send_slot("bulk", job_id=job_id))
+
+            api_res = await send_to_whatsapp(image_data, caption, phone=user.get("phone"))
+
+            result = {
                 "user_id": str(user["_id"]),
                 "phone": user.get("phone"),
                 "success": True,
                 "api_response": api_res
-            })
-            job["successful"] += 1
+            }
 
         except Exception as e:
-            job["results"].append({
+            result = {
                 "user_id": str(user["_id"]),
                 "phone": user.get("phone"),
                 "success": False,
                 "error": str(e)
-            })
-            job["failed"] += 1
+            }
 
-        job["processed"] += 1
+        await tracker.record(result)
 
-    job["status"] = "completed"
-    job["completed_at"] = datetime.now().isoformat()
-    print(f"[Job {job_id}] Distribution completed: {job['successful']} successful, {job['failed']} failed")
+    await tracker.complete()
+    print(f"[Job {job_id}] Distribution completed: {tracker.successful} successful, {tracker.failed} failed")
 
 
 @router.get("/distribution-status/{job_id}")
@@ -201,7 +225,8 @@ async def get_distribution_status(job_id: str):
     """
     Check the status of a distribution job.
     """
-    if job_id not in distribution_jobs:
+    job = await JobRepository.get(job_id, kind=JOB_KIND)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    return distribution_jobs[job_id]
+    return job
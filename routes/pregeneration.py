@@ -0,0 +1,28 @@
+"""
+Pre-generation endpoints - inspect and trigger look-ahead asset generation.
+"""
+from fastapi import APIRouter, BackgroundTasks, Query
+from services import run_pregeneration, get_pregeneration_status
+
+router = APIRouter(prefix="/pregeneration", tags=["Pregeneration"])
+
+
+@router.get("/status")
+async def pregeneration_status():
+    """Get the pre-generation scheduler state and the last run summary."""
+    return await get_pregeneration_status()
+
+
+@router.post("/run")
+async def trigger_pregeneration(
+    background_tasks: BackgroundTasks,
+    days: int = Query(None, ge=0, description="Look-ahead window in days (defaults to PREGENERATION_LOOKAHEAD_DAYS)"),
+):
+    """
+    Pre-generate prompt, caption and base image for upcoming holidays now.
+
+    Runs in the background. Use /pregeneration/status or the holiday's
+    "assets" field to check readiness.
+    """
+    background_tasks.add_task(run_pregeneration, days)
+    return {"status": "started", "message": "Pre-generation started"}
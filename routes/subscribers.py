@@ -1,30 +1,44 @@
 """
 Subscriber management endpoints.
 """
-import io
-import base64
-import random
 import asyncio
-import uuid
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, File, UploadFile, Form, BackgroundTasks
-from PIL import Image
-from config import MONGO_URI
-from database import SubscriberRepository, HolidayRepository
+from typing import AsyncIterable, AsyncIterator, Union
+from bson import ObjectId
+from fastapi import APIRouter, HTTPException, File, UploadFile, Form, BackgroundTasks, Query, Response
+from config import MONGO_URI, DEFAULT_ENCODING_PROFILE
+from database import SubscriberRepository, HolidayRepository, JobRepository, DeliveryRepository
 from models.schemas import SendFestivalRequest
 from services import (
     get_holiday_with_description_for_today,
     generate_structured_output,
-    generate_image,
+    get_base_image,
+    holiday_image_key,
     overlay_subscriber_image,
-    image_to_base64,
+    load_subscriber_overlay,
+    load_subscriber_overlay_bytes,
+    get_render_engine,
+    encode_image,
+    base_image_bytes,
+    process_overlay,
+    get_encoding_profile,
+    read_upload,
+    run_image_work,
     send_to_whatsapp,
+    acquire_send_slot,
+    check_send_slot,
+    JobTracker,
+    parse_window,
+    plan_window,
+    default_plan,
+    window_spacing,
+    seconds_until_open,
+    project_finish,
 )
 
 router = APIRouter(prefix="/subscriber", tags=["Subscribers"])
 
-# In-memory job tracker for subscriber distributions
-subscriber_distribution_jobs = {}
+JOB_KIND = "subscriber_distribution"
 
 
 @router.post("")
@@ -38,28 +52,20 @@ async def create_subscriber(
         raise HTTPException(status_code=500, detail="MONGO_URI not configured")
 
     try:
-        # Read and validate the overlay image
-        overlay_content = await overlay.read()
+        # Read, validate and normalize the overlay image (IMAGE_SIZE, optimized PNG)
+        overlay_content = await read_upload(overlay)
         try:
-            # Validate it's a valid image
-            img = Image.open(io.BytesIO(overlay_content))
-            if img.mode != "RGBA":
-                img = img.convert("RGBA")
-            # Save back to bytes
-            output = io.BytesIO()
-            img.save(output, format="PNG")
-            overlay_bytes = output.getvalue()
+            processed_overlay = await run_image_work("process_overlay", process_overlay, overlay_content)
+        except HTTPException:
+            raise
         except Exception as img_err:
             raise HTTPException(
                 status_code=400, detail=f"Invalid image file: {str(img_err)}"
             )
 
-        # Convert to base64 for storage
-        overlay_base64 = base64.b64encode(overlay_bytes).decode("utf-8")
-
         subscriber_id = await SubscriberRepository.create(
             phone=phone,
-            overlay_base64=overlay_base64,
+            overlay=processed_overlay,
             name=name,
         )
 
@@ -86,6 +92,26 @@ async def get_subscriber(subscriber_id: str):
     return await SubscriberRepository.get_by_id(subscriber_id)
 
 
+@router.get("/{subscriber_id}/overlay-coverage")
+async def get_subscriber_overlay_coverage(subscriber_id: str):
+    """Get the alpha coverage of a subscriber's overlay (kind, visible/opaque fractions, dirty rectangles)."""
+    subscriber = await SubscriberRepository.get_by_id(subscriber_id, include_overlay=False)
+    overlay = await load_subscriber_overlay(subscriber_id, subscriber)
+    if overlay is None:
+        raise HTTPException(status_code=404, detail="Subscriber overlay could not be loaded")
+    return {"subscriber_id": subscriber_id, **overlay.coverage()}
+
+
+@router.get("/{subscriber_id}/overlay-thumbnail")
+async def get_subscriber_overlay_thumbnail(subscriber_id: str):
+    """Get a small PNG thumbnail of a subscriber's overlay."""
+    subscriber = await SubscriberRepository.get_by_id(subscriber_id, include_overlay=False)
+    if not subscriber.get("overlay_hash"):
+        raise HTTPException(status_code=404, detail="Subscriber overlay has no thumbnail")
+    thumbnail = await SubscriberRepository.get_overlay_thumbnail(subscriber["overlay_hash"])
+    return Response(content=thumbnail, media_type="image/png")
+
+
 @router.put("/{subscriber_id}")
 async def update_subscriber(
     subscriber_id: str,
@@ -95,27 +121,24 @@ async def update_subscriber(
 ):
     """Update subscriber details."""
     update_data = {}
+    processed_overlay = None
     if phone:
         update_data["phone"] = phone
     if name:
         update_data["name"] = name
 
     if overlay:
+        overlay_content = await read_upload(overlay)
         try:
-            overlay_content = await overlay.read()
-            img = Image.open(io.BytesIO(overlay_content))
-            if img.mode != "RGBA":
-                img = img.convert("RGBA")
-            output = io.BytesIO()
-            img.save(output, format="PNG")
-            overlay_bytes = output.getvalue()
-            update_data["overlay"] = base64.b64encode(overlay_bytes).decode("utf-8")
+            processed_overlay = await run_image_work("process_overlay", process_overlay, overlay_content)
+        except HTTPException:
+            raise
         except Exception as img_err:
             raise HTTPException(
                 status_code=400, detail=f"Invalid image file: {str(img_err)}"
             )
 
-    return await SubscriberRepository.update(subscriber_id, update_data)
+    return await SubscriberRepository.update(subscriber_id, update_data, overlay=processed_overlay)
 
 
 @router.delete("/{subscriber_id}")
@@ -125,72 +148,139 @@ async def delete_subscriber(subscriber_id: str):
 
 
 @router.post("/distribute")
-async def distribute_to_subscribers(background_tasks: BackgroundTasks):
+async def distribute_to_subscribers(
+    background_tasks: BackgroundTasks,
+    force_refresh: bool = Query(False, description="Regenerate instead of using the cached prompt/caption"),
+    regenerate_image: bool = Query(False, description="Generate a new base image instead of reusing the stored one"),
+    encoding_profile: str = Query(None, description="Output encoding profile (e.g. png, jpeg, webp-small; defaults to DEFAULT_ENCODING_PROFILE)"),
+    window_start: str = Query(None, description="Delivery window start, local HH:MM (defaults to now)"),
+    window_end: str = Query(None, description="Delivery window end, local HH:MM; sends are spread to finish by then"),
+):
     """
     Generate a holiday post and send it to all subscribers with their custom overlays.
 
+    With a delivery window the sends are spread over the window instead of
+    the default pacing; the response warns when the window is too short for
+    the audience at the safe spacing.
+
     Returns immediately with a job_id. Use /subscriber/distribution-status/{job_id} to check progress.
     """
+    get_encoding_profile(encoding_profile)
+    try:
+        window = parse_window(window_start, window_end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     # 1. Get Today's Holiday with description
     holiday_data = await get_holiday_with_description_for_today()
     if not holiday_data:
         return {"status": "error", "message": "No holiday found for today"}
 
     holiday = holiday_data.get("prompt")
-    holiday_description = holiday_data.get("description")
 
-    # 2. Get All Subscribers
-    subscribers = await SubscriberRepository.get_all_raw()
+    # 2. Fix the audience (size and last id); the roster itself is paged in by the job
+    roster = await SubscriberRepository.get_roster_snapshot()
 
-    if not subscribers:
+    if not roster["total"]:
         return {"status": "error", "message": "No subscribers found in database"}
 
-    # 3. Create a job ID and start background task immediately
-    job_id = str(uuid.uuid4())
-    subscriber_distribution_jobs[job_id] = {
-        "status": "running",
-        "holiday": holiday,
-        "total_subscribers": len(subscribers),
-        "processed": 0,
-        "successful": 0,
-        "failed": 0,
-        "started_at": datetime.now().isoformat(),
-        "results": []
-    }
+    # 3. Plan the pacing, create the job and start background task immediately
+    pacing = plan_window(window, roster["total"]) if window else default_plan()
+    tracker = await JobTracker.start(
+        JOB_KIND,
+        {
+            "holiday": holiday,
+            "total_subscribers": roster["total"],
+            "encoding_profile": encoding_profile or DEFAULT_ENCODING_PROFILE,
+            "pacing": pacing,
+        },
+        params=_job_params(holiday_data, encoding_profile, roster_last_id=roster["last_id"], window=window),
+    )
+    job_id = tracker.job_id
 
     # Start background task (image generation happens inside)
     background_tasks.add_task(
         _process_subscriber_distribution,
-        job_id,
-        subscribers,
-        holiday,
-        holiday_description
+        tracker,
+        roster["total"],
+        SubscriberRepository.iter_roster(last_id=roster["last_id"]),
+        force_refresh,
+        regenerate_image,
     )
 
     return {
         "status": "started",
         "job_id": job_id,
         "holiday": holiday,
-        "total_subscribers": len(subscribers),
-        "message": f"Distribution started for {len(subscribers)} subscribers. Check status at /subscriber/distribution-status/{job_id}"
+        "total_subscribers": roster["total"],
+        "pacing": pacing,
+        "message": f"Distribution started for {roster['total']} subscribers. Check status at /subscriber/distribution-status/{job_id}"
     }
 
 
-async def _process_subscriber_distribution(job_id: str, subscribers: list, holiday: str, holiday_description: str = None):
-    """Background task to process the subscriber distribution with staggered delays."""
-    job = subscriber_distribution_jobs[job_id]
+def _job_params(
+    holiday_data: dict,
+    encoding_profile: str = None,
+    roster_last_id=None,
+    subscriber_id: str = None,
+    window: dict = None,
+) -> dict:
+    """Parameters stored with a distribution job, enough to resume it."""
+    return {
+        "holiday_id": holiday_data.get("id"),
+        "holiday": holiday_data.get("prompt"),
+        "holiday_description": holiday_data.get("description"),
+        "encoding_profile": encoding_profile,
+        # Delivery ledger day: a job resumed after midnight still skips who got this post
+        "date": datetime.now().strftime("%d-%m-%Y"),
+        "roster_last_id": str(roster_last_id) if roster_last_id else None,
+        "subscriber_id": subscriber_id,
+        "window": window,
+    }
+
+
+def _ledger_key(params: dict, phone: str) -> tuple:
+    """Delivery ledger key (holiday, date, phone) of a recipient in a job."""
+    return (params.get("holiday_id") or params.get("holiday"), params["date"], phone)
+
+
+async def _process_subscriber_distribution(
+    tracker: JobTracker,
+    total: int,
+    subscribers: Union[list, AsyncIterable],
+    force_refresh: bool = False,
+    regenerate_image: bool = False,
+):
+    """Background task to process the subscriber distribution, paced by the send scheduler.
+
+    subscribers is a list or an async iterable of compact roster records;
+    overlays are fetched just in time by the render engine. Recipients the
+    delivery ledger already has for this holiday and day are skipped without
+    rendering. Each recipient is claimed as queued before waiting for its
+    send slot and marked sending once the slot is granted, so reruns and
+    resumed jobs never send the same post twice, and recipients left queued
+    by a job that died while waiting are sent by the next run.
+    """
+    job_id = tracker.job_id
+    params = tracker.params
+    holiday = params.get("holiday")
+    holiday_description = params.get("holiday_description")
+    encoding_profile = params.get("encoding_profile")
 
     print(f"\n{'='*60}")
-    print(f"[Job {job_id}] STARTING DISTRIBUTION")
+    print(f"[Job {job_id}] {'RESUMING' if tracker.processed else 'STARTING'} DISTRIBUTION")
     print(f"[Job {job_id}] Holiday: {holiday}")
     print(f"[Job {job_id}] Description: {holiday_description}")
-    print(f"[Job {job_id}] Total subscribers: {len(subscribers)}")
+    print(f"[Job {job_id}] Total subscribers: {total} (already processed: {tracker.processed})")
     print(f"{'='*60}\n")
 
     try:
-        # Generate Base Image (Once) - now happens in background
+        # Generate Base Image (Once) - now happens in background, with heartbeats so
+        # slow generation and its retries never make the job look stale
         print(f"[Job {job_id}] Generating structured output...")
-        structured_output = generate_structured_output(holiday, holiday_description)
+        structured_output = await tracker.wait(generate_structured_output(
+            holiday, holiday_description, force_refresh=force_refresh
+        ))
         image_prompt = structured_output.get("prompt", "")
         caption = structured_output.get("caption", "")
 
@@ -198,133 +288,210 @@ async def _process_subscriber_distribution(job_id: str, subscribers: list, holid
         print(f"[Job {job_id}] Prompt: {image_prompt[:100]}...")
 
         if not image_prompt:
-            job["status"] = "failed"
-            job["error"] = "Failed to generate image prompt"
+            await tracker.fail("Failed to generate image prompt")
             print(f"[Job {job_id}] ERROR: Failed to generate image prompt")
             return
 
-        print(f"[Job {job_id}] Generating base image via Gemini...")
-        base_image = generate_image(image_prompt)
-        print(f"[Job {job_id}] Base image generated successfully: {base_image.size}")
+        print(f"[Job {job_id}] Loading base image (generating via Gemini if not stored)...")
+        base = await tracker.wait(get_base_image(
+            holiday_image_key(params.get("holiday_id"), holiday), image_prompt, regenerate=regenerate_image
+        ))
+        base_image = base["image"]
+        print(f"[Job {job_id}] Base image ready (reused from store: {base['cached']}): {base_image.size}")
     except Exception as e:
-        job["status"] = "failed"
-        job["error"] = f"Image generation failed: {str(e)}"
+        await tracker.fail(f"Image generation failed: {str(e)}")
         print(f"[Job {job_id}] ERROR: Image generation failed: {str(e)}")
         return
 
-    for index, subscriber in enumerate(subscribers):
+    def skipped_result(subscriber: dict, reason: str) -> dict:
+        return {
+            "subscriber_id": str(subscriber["_id"]),
+            "name": subscriber.get("name", "Unknown"),
+            "phone": subscriber.get("phone", "No phone"),
+            "success": True,
+            "skipped": reason,
+        }
+
+    async def check_ledger(records):
+        """Mark the recipients the ledger already has; they pass through in order, unrendered."""
+        async for subscriber in _as_async(records):
+            entry = await DeliveryRepository.get(*_ledger_key(params, subscriber.get("phone")))
+            if entry and entry["status"] in ("sent", "sending"):
+                reason = "already sent" if entry["status"] == "sent" else "send interrupted, not retried"
+                subscriber = {**subscriber, "skip_reason": reason}
+            yield subscriber
+
+    # With a delivery window, wait for it to open (rendering starts once it does)
+    window = params.get("window")
+    if window and seconds_until_open(window) > 0:
+        print(f"[Job {job_id}] Waiting for the delivery window to open at {window['start']}...")
+        await tracker.wait(asyncio.sleep(seconds_until_open(window)))
+
+    # Composite and encode on the render workers, a chunk ahead of the sends
+    async def load_overlay(subscriber):
+        if subscriber.get("skip_reason"):
+            return None
+        return await load_subscriber_overlay_bytes(str(subscriber["_id"]), subscriber)
+
+    rendered = get_render_engine().render_payloads(
+        base_image, check_ledger(subscribers), load_overlay, profile=encoding_profile, base_data=base["data"]
+    )
+    # One-off jobs jump ahead of bulk distributions on the sender
+    lane = "priority" if params.get("subscriber_id") else "bulk"
+    sent_in_run = 0
+    async for subscriber, image_data, render_error in rendered:
         sub_name = subscriber.get("name", "Unknown")
         sub_phone = subscriber.get("phone", "No phone")
         sub_id = str(subscriber["_id"])
+        ledger_key = _ledger_key(params, sub_phone)
 
-        print(f"\n[Job {job_id}] --- Subscriber {index + 1}/{len(subscribers)} ---")
+        if subscriber.get("skip_reason"):
+            print(f"[Job {job_id}] Skipping {sub_name} ({sub_phone}): {subscriber['skip_reason']}")
+            await tracker.record(skipped_result(subscriber, subscriber["skip_reason"]), checkpoint=sub_id)
+            continue
+
+        print(f"\n[Job {job_id}] --- Subscriber {tracker.processed + 1}/{total} ---")
         print(f"[Job {job_id}] Name: {sub_name}")
         print(f"[Job {job_id}] Phone: {sub_phone}")
         print(f"[Job {job_id}] ID: {sub_id}")
 
+        claimed = False
         try:
-            # Decode overlay from base64
-            overlay_base64 = subscriber.get("overlay", "")
-            overlay_bytes = base64.b64decode(overlay_base64)
-            print(f"[Job {job_id}] Overlay decoded: {len(overlay_bytes)} bytes")
-
-            # Composite the overlay on the generated image
-            custom_image = overlay_subscriber_image(base_image, overlay_bytes)
-            print(f"[Job {job_id}] Image composited: {custom_image.size}")
-
-            # Convert to base64 for sending
-            image_b64 = image_to_base64(custom_image)
-
-            # Wait for a random time before sending (except first subscriber)
-            if index > 0:
-                delay_seconds = random.randint(240, 480)  # 4-8 minutes
-                delay_mins = delay_seconds / 60
-                print(f"[Job {job_id}] ⏳ Waiting {delay_mins:.1f} mins ({delay_seconds}s) before sending to {sub_name} ({sub_phone})...")
-                await asyncio.sleep(delay_seconds)
-
-            api_res = await send_to_whatsapp(image_b64, caption, phone=sub_phone)
+            if render_error:
+                raise RuntimeError(f"Rendering failed: {render_error}")
+            print(f"[Job {job_id}] Image rendered: {len(image_data)} bytes")
+
+            # Spread what is left over the rest of the window (the first send of a run goes out right away)
+            spacing = None
+            if window:
+                remaining = total - tracker.processed
+                spacing = window_spacing(window, remaining - 1 if not sent_in_run else remaining)
+                tracker.note({"pacing.spacing_seconds": round(spacing, 1)})
+
+            # Queue the recipient before waiting for a slot (another run may have got there first)
+            claimed = await DeliveryRepository.claim(*ledger_key, job_id)
+            if not claimed:
+                print(f"[Job {job_id}] Skipping {sub_phone}: claimed by another run")
+                await tracker.record(skipped_result(subscriber, "claimed by another run"), checkpoint=sub_id)
+                continue
+
+            # Wait for the sender's next slot (shared with every other job and request)
+            print(f"[Job {job_id}] ⏳ Waiting for a send slot for {sub_name} ({sub_phone})...")
+            try:
+                await tracker.wait(acquire_send_slot(lane, job_id=job_id, spacing=spacing))
+            except asyncio.CancelledError:
+                # Nothing was sent; leave the recipient to a resumed or later run
+                await DeliveryRepository.release(*ledger_key, job_id)
+                raise
+
+            # Mark the recipient sending right before the send (a resumed run may have taken it over)
+            if not await DeliveryRepository.mark_sending(*ledger_key, job_id):
+                claimed = False
+                print(f"[Job {job_id}] Skipping {sub_phone}: claimed by another run")
+                await tracker.record(skipped_result(subscriber, "claimed by another run"), checkpoint=sub_id)
+                continue
+
+            sent_in_run += 1
+            api_res = await send_to_whatsapp(image_data, caption, phone=sub_phone)
             print(f"[Job {job_id}] WhatsApp API Response: {api_res}")
+            await DeliveryRepository.mark_sent(*ledger_key)
 
-            job["results"].append({
+            result = {
                 "subscriber_id": sub_id,
                 "name": sub_name,
                 "phone": sub_phone,
                 "success": True,
                 "api_response": api_res
-            })
-            job["successful"] += 1
+            }
             print(f"[Job {job_id}] SUCCESS: Message sent to {sub_name} ({sub_phone})")
 
         except Exception as e:
             print(f"[Job {job_id}] ERROR for {sub_name} ({sub_phone}): {str(e)}")
-            job["results"].append({
+            if claimed:
+                await DeliveryRepository.mark_failed(*ledger_key, str(e), job_id=job_id)
+            result = {
                 "subscriber_id": sub_id,
                 "name": sub_name,
                 "phone": sub_phone,
                 "success": False,
                 "error": str(e)
-            })
-            job["failed"] += 1
+            }
 
-        job["processed"] += 1
+        await tracker.record(result, checkpoint=sub_id)
 
-    job["status"] = "completed"
-    job["completed_at"] = datetime.now().isoformat()
+    await tracker.complete()
     print(f"\n{'='*60}")
     print(f"[Job {job_id}] DISTRIBUTION COMPLETED")
-    print(f"[Job {job_id}] Successful: {job['successful']}")
-    print(f"[Job {job_id}] Failed: {job['failed']}")
+    print(f"[Job {job_id}] Successful: {tracker.successful}")
+    print(f"[Job {job_id}] Failed: {tracker.failed}")
+    print(f"[Job {job_id}] Skipped (already delivered): {tracker.skipped}")
     print(f"{'='*60}\n")
 
 
+async def _as_async(items: Union[list, AsyncIterable]) -> AsyncIterator:
+    """Iterate a list or an async iterable asynchronously."""
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
 @router.post("/distribute/{subscriber_id}")
-async def distribute_to_single_subscriber(subscriber_id: str, background_tasks: BackgroundTasks):
+async def distribute_to_single_subscriber(
+    subscriber_id: str,
+    background_tasks: BackgroundTasks,
+    force_refresh: bool = Query(False, description="Regenerate instead of using the cached prompt/caption"),
+    regenerate_image: bool = Query(False, description="Generate a new base image instead of reusing the stored one"),
+    encoding_profile: str = Query(None, description="Output encoding profile (e.g. png, jpeg, webp-small; defaults to DEFAULT_ENCODING_PROFILE)"),
+):
     """
     Generate a holiday post and send it to a specific subscriber by ID.
 
     Returns immediately with a job_id. Use /subscriber/distribution-status/{job_id} to check progress.
     """
+    get_encoding_profile(encoding_profile)
+
     # 1. Get Today's Holiday with description
     holiday_data = await get_holiday_with_description_for_today()
     if not holiday_data:
         return {"status": "error", "message": "No holiday found for today"}
 
     holiday = holiday_data.get("prompt")
-    holiday_description = holiday_data.get("description")
 
     # 2. Get the specific subscriber
-    subscriber = await SubscriberRepository.get_by_id(subscriber_id)
+    subscriber = await SubscriberRepository.get_by_id(subscriber_id, include_overlay=False)
     if not subscriber:
         raise HTTPException(status_code=404, detail="Subscriber not found")
 
-    # Convert to raw format for processing (need to get with overlay)
-    from bson import ObjectId
-    from database import get_subscribers_collection
-    raw_subscriber = await get_subscribers_collection().find_one({"_id": ObjectId(subscriber_id)})
+    # Compact record for processing (the overlay is fetched when rendering)
+    roster_record = await SubscriberRepository.get_roster_record(subscriber_id)
 
-    if not raw_subscriber:
+    if not roster_record:
         raise HTTPException(status_code=404, detail="Subscriber not found")
 
-    # 3. Create a job ID and start background task immediately
-    job_id = str(uuid.uuid4())
-    subscriber_distribution_jobs[job_id] = {
-        "status": "running",
-        "holiday": holiday,
-        "total_subscribers": 1,
-        "processed": 0,
-        "successful": 0,
-        "failed": 0,
-        "started_at": datetime.now().isoformat(),
-        "results": []
-    }
+    # 3. Create the job and start background task immediately
+    tracker = await JobTracker.start(
+        JOB_KIND,
+        {
+            "holiday": holiday,
+            "total_subscribers": 1,
+            "encoding_profile": encoding_profile or DEFAULT_ENCODING_PROFILE,
+            "pacing": default_plan(),
+        },
+        params=_job_params(holiday_data, encoding_profile, subscriber_id=subscriber_id),
+    )
+    job_id = tracker.job_id
 
     # Start background task (image generation happens inside)
     background_tasks.add_task(
         _process_subscriber_distribution,
-        job_id,
-        [raw_subscriber],
-        holiday,
-        holiday_description
+        tracker,
+        1,
+        [roster_record],
+        force_refresh,
+        regenerate_image,
     )
 
     return {
@@ -340,11 +507,68 @@ async def distribute_to_single_subscriber(subscriber_id: str, background_tasks:
 async def get_subscriber_distribution_status(job_id: str):
     """
     Check the status of a subscriber distribution job.
+
+    Running jobs include a live projection: remaining recipients, eta_seconds
+    and projected_finish_at, plus on_schedule (and a warning when behind)
+    for jobs with a delivery window. "deliveries" counts the job's delivery
+    ledger entries per status (sending, sent, failed).
     """
-    if job_id not in subscriber_distribution_jobs:
+    job = await JobRepository.get(job_id, kind=JOB_KIND)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    return subscriber_distribution_jobs[job_id]
+    job.pop("params", None)
+    job.pop("checkpoint", None)
+    job["deliveries"] = await DeliveryRepository.count_by_status(job_id)
+    if job["status"] == "running":
+        job["projection"] = project_finish(job)
+    return job
+
+
+@router.post("/distribution/{job_id}/resume")
+async def resume_subscriber_distribution(job_id: str, background_tasks: BackgroundTasks):
+    """
+    Resume an interrupted subscriber distribution job.
+
+    A job can be resumed when it failed, or when it is still marked running
+    but has not made progress for JOB_STALE_SECONDS (its process went away).
+    It continues after the last recipient it recorded; anyone the delivery
+    ledger already has for the holiday and day is skipped.
+    """
+    tracker = await JobTracker.resume(job_id, JOB_KIND)
+    if tracker is None:
+        job = await JobRepository.get(job_id, kind=JOB_KIND, include_results=False)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(
+            status_code=409,
+            detail=f"Job is {job['status']} and cannot be resumed (last update {job.get('updated_at')})",
+        )
+
+    params = tracker.params
+    if params.get("subscriber_id"):
+        roster_record = await SubscriberRepository.get_roster_record(params["subscriber_id"])
+        recipients = [roster_record] if roster_record else []
+        total = 1
+    else:
+        last_id = params.get("roster_last_id")
+        recipients = SubscriberRepository.iter_roster(
+            last_id=ObjectId(last_id) if last_id else None,
+            after=ObjectId(tracker.checkpoint) if tracker.checkpoint else None,
+        )
+        job = await JobRepository.get(job_id, kind=JOB_KIND, include_results=False)
+        total = job["total_subscribers"]
+
+    background_tasks.add_task(_process_subscriber_distribution, tracker, total, recipients)
+
+    return {
+        "status": "resumed",
+        "job_id": job_id,
+        "holiday": params.get("holiday"),
+        "already_processed": tracker.processed,
+        "resume_after": tracker.checkpoint,
+        "message": f"Distribution resumed after {tracker.processed} recipients. Check status at /subscriber/distribution-status/{job_id}"
+    }
 
 
 @router.post("/send-festival")
@@ -352,8 +576,10 @@ async def send_festival_to_subscriber(request: SendFestivalRequest):
     """
     Send a specific festival post to a specific subscriber.
     """
+    get_encoding_profile(request.encoding_profile)
+
     # 1. Validate Subscriber
-    subscriber = await SubscriberRepository.get_by_id(request.subscriber_id)
+    subscriber = await SubscriberRepository.get_by_id(request.subscriber_id, include_overlay=False)
     if not subscriber:
         raise HTTPException(status_code=404, detail="Subscriber not found")
 
@@ -365,8 +591,10 @@ async def send_festival_to_subscriber(request: SendFestivalRequest):
     holiday_name = holiday_data.get("prompt")
     holiday_description = holiday_data.get("description")
 
+    # Refuse before generating anything when the sender is busy (e.g. a distribution is running)
+    check_send_slot()
+
     # 3. Get Raw Subscriber (for overlay)
-    from bson import ObjectId
     from database import get_subscribers_collection
     raw_subscriber = await get_subscribers_collection().find_one({"_id": ObjectId(request.subscriber_id)})
 
@@ -376,31 +604,41 @@ async def send_festival_to_subscriber(request: SendFestivalRequest):
     try:
         # 4. Generate Content
         print(f"Generating content for {holiday_name}...")
-        structured_output = generate_structured_output(holiday_name, holiday_description)
+        structured_output = await generate_structured_output(
+            holiday_name, holiday_description, force_refresh=request.force_refresh
+        )
         image_prompt = structured_output.get("prompt", "")
         caption = structured_output.get("caption", "")
 
         if not image_prompt:
             raise HTTPException(status_code=500, detail="Failed to generate image prompt")
 
-        # 5. Generate Image via Gemini
-        print(f"Generating image via Gemini with prompt: {image_prompt[:50]}...")
-        base_image = generate_image(image_prompt)
+        # 5. Get Base Image (reused from the store unless regeneration is requested)
+        print(f"Loading base image for prompt: {image_prompt[:50]}...")
+        base = await get_base_image(
+            holiday_image_key(request.festival_id, holiday_name),
+            image_prompt,
+            regenerate=request.regenerate_image,
+        )
+        base_image = base["image"]
 
         # 6. Apply Overlay
-        overlay_base64 = raw_subscriber.get("overlay", "")
-        if overlay_base64:
-            overlay_bytes = base64.b64decode(overlay_base64)
-            final_image = overlay_subscriber_image(base_image, overlay_bytes)
+        if raw_subscriber.get("overlay_hash") or raw_subscriber.get("overlay"):
+            overlay = await load_subscriber_overlay(request.subscriber_id, raw_subscriber)
+            image_data = await run_image_work(
+                "send_festival",
+                lambda: encode_image(overlay_subscriber_image(base_image, overlay), request.encoding_profile),
+            )
         else:
-            final_image = base_image
+            # Unmodified: send the generated bytes as they are when the profile allows
+            image_data = await run_image_work("send_festival", base_image_bytes, base, request.encoding_profile)
 
         # 7. Send via WhatsApp
-        image_b64 = image_to_base64(final_image)
         phone = subscriber.get("phone")
 
         print(f"Sending to {phone}...")
-        api_res = await send_to_whatsapp(image_b64, caption, phone=phone)
+        await acquire_send_slot("priority")
+        api_res = await send_to_whatsapp(image_data, caption, phone=phone)
 
         return {
             "status": "success",
@@ -411,5 +649,7 @@ async def send_festival_to_subscriber(request: SendFestivalRequest):
         }
 
     except Exception as e:
+        if isinstance(e, HTTPException) and e.status_code == 503:
+            raise  # Image work or sender at capacity: let the client retry
         print(f"Error sending festival post: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to send post: {str(e)}")
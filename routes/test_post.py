@@ -15,10 +15,17 @@ from database import SubscriberRepository
 from services import (
     get_holiday_with_description_for_today,
     generate_structured_output,
-    generate_image,
+    get_base_image,
+    holiday_image_key,
     overlay_subscriber_image,
-    image_to_base64,
+    load_subscriber_overlay,
+    encode_image,
+    base_image_bytes,
+    get_encoding_profile,
+    run_image_work,
     send_to_whatsapp,
+    acquire_send_slot,
+    check_send_slot,
 )
 
 router = APIRouter(prefix="/test", tags=["Test"])
@@ -27,6 +34,9 @@ router = APIRouter(prefix="/test", tags=["Test"])
 @router.post("/generate-post-by-subscriber", response_model=GeneratePostResponse)
 async def generate_post_by_subscriber(
     subscriber_id: str = Query(..., description="Subscriber ID from database"),
+    force_refresh: bool = Query(False, description="Regenerate instead of using the cached prompt/caption"),
+    regenerate_image: bool = Query(False, description="Generate a new base image instead of reusing the stored one"),
+    encoding_profile: str = Query(None, description="Output encoding profile (e.g. png, jpeg, webp-small; defaults to DEFAULT_ENCODING_PROFILE)"),
 ):
     """
     Generate and send a holiday post for a specific subscriber.
@@ -41,6 +51,9 @@ async def generate_post_by_subscriber(
     """
 
     print(f"\n[TEST] Starting post generation for subscriber_id: {subscriber_id}")
+    get_encoding_profile(encoding_profile)
+    # Refuse before generating anything when the sender is busy (e.g. a distribution is running)
+    check_send_slot()
 
     # Step 1: Get today's holiday from database
     print("[TEST] Step 1: Fetching today's holiday from database...")
@@ -61,7 +74,7 @@ async def generate_post_by_subscriber(
     # Step 2: Get subscriber details
     print(f"\n[TEST] Step 2: Fetching subscriber details for ID: {subscriber_id}...")
     try:
-        subscriber = await SubscriberRepository.get_by_id(subscriber_id)
+        subscriber = await SubscriberRepository.get_by_id(subscriber_id, include_overlay=False)
         print(f"[TEST]   Subscriber found!")
     except HTTPException as e:
         print(f"[TEST]   HTTPException: {e.detail}")
@@ -77,15 +90,17 @@ async def generate_post_by_subscriber(
 
     subscriber_phone = subscriber.get("phone", "")
     subscriber_name = subscriber.get("name", "")
-    subscriber_overlay = subscriber.get("overlay", None)
+    subscriber_overlay = subscriber.get("overlay_hash") or subscriber.get("overlay")
 
     print(f"[TEST] Subscriber name: {subscriber_name}")
     print(f"[TEST] Subscriber phone: {subscriber_phone}")
-    print(f"[TEST] Subscriber has overlay: {subscriber_overlay is not None}")
+    print(f"[TEST] Subscriber has overlay: {bool(subscriber_overlay)}")
 
     # Step 3: Generate structured output (AI prompt + caption)
     print(f"\n[TEST] Step 3: Generating AI prompt and caption...")
-    structured_output = generate_structured_output(holiday_prompt, holiday_description)
+    structured_output = await generate_structured_output(
+        holiday_prompt, holiday_description, force_refresh=force_refresh
+    )
     image_prompt = structured_output.get("prompt", "")
     caption = structured_output.get("caption", "")
 
@@ -103,8 +118,13 @@ async def generate_post_by_subscriber(
     print(f"[TEST] Sending prompt to Gemini...")
 
     try:
-        generated_image = generate_image(image_prompt)
-        print(f"[TEST]   Image generated successfully! Size: {generated_image.size}")
+        base = await get_base_image(
+            holiday_image_key(holiday_data.get("id"), holiday_prompt),
+            image_prompt,
+            regenerate=regenerate_image,
+        )
+        generated_image = base["image"]
+        print(f"[TEST]   Image ready (reused from store: {base['cached']})! Size: {generated_image.size}")
     except Exception as e:
         print(f"[TEST]   Gemini image generation failed: {str(e)}")
         raise HTTPException(
@@ -117,15 +137,15 @@ async def generate_post_by_subscriber(
 
     if not subscriber_overlay:
         print(f"[TEST] ⚠️ No custom overlay found for subscriber, using generated image as-is")
-        final_image = generated_image
+        final_image = None
     else:
-        print(f"[TEST] Applying custom overlay (base64 length: {len(subscriber_overlay)} chars)")
+        print(f"[TEST] Applying custom overlay ({subscriber.get('overlay_size', 'legacy base64')} bytes)")
         try:
-            import base64
-
-            overlay_bytes = base64.b64decode(subscriber_overlay)
-            final_image = overlay_subscriber_image(generated_image, overlay_bytes)
+            overlay = await load_subscriber_overlay(subscriber_id, subscriber)
+            final_image = await run_image_work("test_post", overlay_subscriber_image, generated_image, overlay)
             print(f"[TEST] ✅ Overlay applied successfully!")
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"[TEST] ❌ Overlay application failed: {str(e)}")
             import traceback
@@ -135,14 +155,20 @@ async def generate_post_by_subscriber(
                 detail=f"Overlay application failed: {str(e)}"
             )
 
-    # Step 6: Convert to base64 and send to WhatsApp
-    print(f"\n[TEST] Step 6: Converting to base64 and sending to WhatsApp...")
-    image_base64 = image_to_base64(final_image)
-    print(f"[TEST] Image converted to base64 (length: {len(image_base64)} chars)")
+    # Step 6: Encode and send to WhatsApp
+    print(f"\n[TEST] Step 6: Encoding and sending to WhatsApp...")
+    if final_image is None:
+        image_data = await run_image_work("test_post", base_image_bytes, base, encoding_profile)
+    else:
+        image_data = await run_image_work("test_post", encode_image, final_image, encoding_profile)
+    print(f"[TEST] Image encoded ({len(image_data)} bytes)")
+
+    # Test sends use the same sender budget
+    await acquire_send_slot("priority")
 
     try:
         print(f"[TEST] Sending to WhatsApp number: {subscriber_phone}")
-        whatsapp_response = await send_to_whatsapp(image_base64, caption, phone=subscriber_phone)
+        whatsapp_response = await send_to_whatsapp(image_data, caption, phone=subscriber_phone)
         print(f"[TEST] WhatsApp API response: {whatsapp_response}")
 
         return GeneratePostResponse(
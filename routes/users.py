@@ -1,12 +1,10 @@
 """
 User management endpoints.
 """
-import io
 from fastapi import APIRouter, HTTPException, File, UploadFile, Form
-from PIL import Image
 from config import MONGO_URI
 from database import UserRepository
-from services import process_logo
+from services import process_logo, prepare_user_brand_layer, read_upload, run_image_work
 
 router = APIRouter(prefix="/user", tags=["Users"])
 
@@ -23,9 +21,11 @@ async def create_user(
         raise HTTPException(status_code=500, detail="MONGO_URI not configured")
 
     try:
-        logo_content = await logo.read()
+        logo_content = await read_upload(logo)
         try:
-            logo_content = process_logo(logo_content)
+            logo_content = await run_image_work("process_logo", process_logo, logo_content)
+        except HTTPException:
+            raise
         except Exception as img_err:
             raise HTTPException(
                 status_code=400, detail=f"Invalid image file: {str(img_err)}"
@@ -38,6 +38,7 @@ async def create_user(
             logo_content=logo_content,
             logo_filename=logo.filename,
         )
+        await _prepare_brand_layer(user_id)
 
         return {
             "status": "success",
@@ -80,16 +81,30 @@ async def update_user(
         update_data["website"] = website
 
     if logo:
+        logo_content = await read_upload(logo)
         try:
-            logo_content = await logo.read()
-            update_data["logo"] = process_logo(logo_content)
+            update_data["logo"] = await run_image_work("process_logo", process_logo, logo_content)
             update_data["logo_filename"] = logo.filename
+        except HTTPException:
+            raise
         except Exception as img_err:
             raise HTTPException(
                 status_code=400, detail=f"Invalid image file: {str(img_err)}"
             )
 
-    return await UserRepository.update(user_id, update_data)
+    result = await UserRepository.update(user_id, update_data)
+    await _prepare_brand_layer(user_id)
+    return result
+
+
+async def _prepare_brand_layer(user_id: str):
+    """Pre-render the user's brand layer so the next send only composites it."""
+    try:
+        user = await UserRepository.get_raw_by_id(user_id)
+        if user:
+            await run_image_work("brand_layer", prepare_user_brand_layer, user, reject_when_full=False)
+    except Exception as e:
+        print(f"Warning: Could not pre-render brand layer for user {user_id}: {e}")
 
 
 @router.delete("/{user_id}")
@@ -1,18 +1,110 @@
 """Postify Services Package"""
-from .ai_service import generate_structured_output, generate_image
-from .image_service import overlay_images, image_to_base64, process_logo, overlay_subscriber_image
-from .whatsapp_service import send_to_whatsapp
+from .ai_service import generate_structured_output, generate_image, invalidate_structured_output, get_base_image
+from .image_store import get_image_store, holiday_image_key
+from .ai_backends import get_ai_backend, set_ai_backend, AIBackend, GeminiBackend, FakeBackend
+from .asset_registry import load_assets, get_assets
+from .overlay_cache import (
+    load_subscriber_overlay,
+    load_subscriber_overlay_bytes,
+    invalidate_subscriber_overlay,
+    get_overlay_cache_stats,
+)
+from .image_service import (
+    overlay_images,
+    image_to_base64,
+    base_image_to_base64,
+    encode_image,
+    base_image_bytes,
+    get_encoding_profile,
+    process_logo,
+    process_overlay,
+    overlay_subscriber_image,
+)
+from .brand_layer import user_footer_text, prepare_user_brand_layer, get_brand_layer_stats
+from .render_engine import get_render_engine, stop_render_engine, get_render_stats
+from .image_executor import run_image_work, read_upload, UploadLimitMiddleware, stop_image_executor, get_image_executor_stats
+from .whatsapp_service import send_to_whatsapp, get_transport
+from .send_scheduler import (
+    acquire_send_slot,
+    check_send_slot,
+    get_send_scheduler,
+    stop_send_schedulers,
+    get_send_scheduler_stats,
+)
+from .job_tracker import JobTracker
+from .pacing import parse_window, plan_window, default_plan, window_spacing, seconds_until_open, project_finish
 from .csv_service import parse_csv_for_today  # Legacy - will be deprecated
+from .single_flight import get_single_flight_stats
+from .rate_limiter import get_rate_limit_stats
+from .metrics import get_metrics_snapshot, estimate_cost
 from .holiday_service import get_holiday_with_description_for_today
+from .pregeneration_service import (
+    run_pregeneration,
+    get_pregeneration_status,
+    start_pregeneration,
+    stop_pregeneration,
+)
 
 __all__ = [
     "generate_structured_output",
     "generate_image",
+    "invalidate_structured_output",
+    "get_base_image",
+    "get_image_store",
+    "holiday_image_key",
+    "get_ai_backend",
+    "set_ai_backend",
+    "AIBackend",
+    "GeminiBackend",
+    "FakeBackend",
     "overlay_images",
     "image_to_base64",
+    "base_image_to_base64",
+    "encode_image",
+    "base_image_bytes",
+    "get_encoding_profile",
     "process_logo",
+    "process_overlay",
     "overlay_subscriber_image",
+    "load_assets",
+    "get_assets",
+    "load_subscriber_overlay",
+    "invalidate_subscriber_overlay",
+    "get_overlay_cache_stats",
+    "load_subscriber_overlay_bytes",
+    "user_footer_text",
+    "prepare_user_brand_layer",
+    "get_brand_layer_stats",
+    "get_render_engine",
+    "stop_render_engine",
+    "get_render_stats",
+    "run_image_work",
+    "read_upload",
+    "UploadLimitMiddleware",
+    "stop_image_executor",
+    "get_image_executor_stats",
     "send_to_whatsapp",
+    "get_transport",
+    "acquire_send_slot",
+    "check_send_slot",
+    "get_send_scheduler",
+    "stop_send_schedulers",
+    "get_send_scheduler_stats",
+    "JobTracker",
+    "parse_window",
+    "plan_window",
+    "default_plan",
+    "window_spacing",
+    "seconds_until_open",
+    "project_finish",
     "parse_csv_for_today",  # Legacy
+    "get_single_flight_stats",
+    "get_rate_limit_stats",
+    "get_metrics_snapshot",
+    "estimate_cost",
     "get_holiday_with_description_for_today",
+    "run_pregeneration",
+    "get_pregeneration_status",
+    "start_pregeneration",
+    "stop_pregeneration",
 ]
@@ -0,0 +1,213 @@
+"""
+AI Backends - Model providers behind the AI service.
+
+The active backend is selected with AI_BACKEND:
+- "gemini": Google Gemini via the async genai client (production)
+- "fake": deterministic local stand-in for offline benchmarks and soak tests.
+  It returns stable JSON and synthetic IMAGE_SIZE x IMAGE_SIZE PNGs after a
+  log-normal latency, and can inject transient failures to exercise retries.
+
+Backends return plain dicts: text calls give {"text", "usage"} and image
+calls give {"data", "mime_type", "usage"}, where usage holds input/output
+token counts.
+"""
+import io
+import re
+import random
+import asyncio
+import hashlib
+import json
+from typing import Optional
+from PIL import Image, ImageDraw, ImageOps
+from google import genai
+from google.genai import types
+from fastapi import HTTPException
+from config import (
+    AI_BACKEND,
+    GEMINI_API_KEY,
+    IMAGE_SIZE,
+    FAKE_AI_TEXT_LATENCY_SECONDS,
+    FAKE_AI_IMAGE_LATENCY_SECONDS,
+    FAKE_AI_LATENCY_SIGMA,
+    FAKE_AI_ERROR_RATE,
+)
+
+
+class TransientAIError(Exception):
+    """Retryable backend failure (e.g. quota exhausted or model overloaded)."""
+
+    def __init__(self, code: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.retry_after = retry_after
+
+
+class AIBackend:
+    """Interface for text and image generation backends."""
+
+    name = "base"
+
+    def model_tag(self, model: str) -> str:
+        """Identify the model in cache keys and metadata."""
+        return model
+
+    async def generate_text(self, model: str, prompt: str) -> dict:
+        """Generate a JSON text response for a prompt."""
+        raise NotImplementedError
+
+    async def generate_image(self, model: str, prompt: str) -> dict:
+        """Generate a square image for a prompt."""
+        raise NotImplementedError
+
+
+class GeminiBackend(AIBackend):
+    """Google Gemini backend using the async genai client."""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self._client = None
+
+    @property
+    def client(self):
+        """Create the genai client on first use rather than at import time."""
+        if self._client is None:
+            self._client = genai.Client(api_key=self.api_key)
+        return self._client
+
+    @staticmethod
+    def _usage(response) -> dict:
+        """Token counts from the response usage metadata."""
+        usage = getattr(response, "usage_metadata", None)
+        return {
+            "input_tokens": getattr(usage, "prompt_token_count", None) or 0,
+            "output_tokens": getattr(usage, "candidates_token_count", None) or 0,
+        }
+
+    async def generate_text(self, model: str, prompt: str) -> dict:
+        response = await self.client.aio.models.generate_content(
+            model=model,
+            contents=prompt,
+            config=types.GenerateContentConfig(response_mime_type="application/json"),
+        )
+        return {"text": response.text, "usage": self._usage(response)}
+
+    async def generate_image(self, model: str, prompt: str) -> dict:
+        response = await self.client.aio.models.generate_content(
+            model=model,
+            contents=[prompt],
+            config=types.GenerateContentConfig(
+                response_modalities=["IMAGE", "TEXT"],
+                image_config=types.ImageConfig(
+                    aspect_ratio="1:1",
+                    image_size="1K",
+                )
+            )
+        )
+
+        # Extract the generated image from response
+        for part in response.candidates[0].content.parts:
+            if part.inline_data is not None:
+                return {
+                    "data": part.inline_data.data,
+                    "mime_type": part.inline_data.mime_type or "image/png",
+                    "usage": self._usage(response),
+                }
+
+        raise HTTPException(status_code=500, detail="No image generated by Gemini")
+
+
+class FakeBackend(AIBackend):
+    """Deterministic offline backend with realistic, configurable latency."""
+
+    name = "fake"
+
+    def __init__(
+        self,
+        text_latency: float = FAKE_AI_TEXT_LATENCY_SECONDS,
+        image_latency: float = FAKE_AI_IMAGE_LATENCY_SECONDS,
+        sigma: float = FAKE_AI_LATENCY_SIGMA,
+        error_rate: float = FAKE_AI_ERROR_RATE,
+    ):
+        self.text_latency = text_latency
+        self.image_latency = image_latency
+        self.sigma = sigma
+        self.error_rate = error_rate
+
+    def model_tag(self, model: str) -> str:
+        return f"fake/{model}"
+
+    async def _simulate_call(self, median_seconds: float):
+        """Sleep for a log-normal latency and occasionally fail like a busy API."""
+        if median_seconds > 0:
+            await asyncio.sleep(random.lognormvariate(0, self.sigma) * median_seconds)
+        if self.error_rate and random.random() < self.error_rate:
+            raise TransientAIError(503, "Fake backend overloaded", retry_after=1.0)
+
+    async def generate_text(self, model: str, prompt: str) -> dict:
+        await self._simulate_call(self.text_latency)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        match = re.search(r'For the holiday "(.*?)"', prompt)
+        holiday = match.group(1).split(". Context:")[0] if match else "the holiday"
+        text = json.dumps({
+            "prompt": (
+                f"A graphic flat illustration celebrating {holiday} with calligraphic greeting "
+                f"on the left and symbolic still-life on the right, palette {digest[:6]} "
+                "(full-bleed gallery image, no borders, no margins, no white space around edges)"
+            ),
+            "caption": f"Wishing you a joyful {holiday}! ✨ #{digest[:6]}",
+        })
+        return {
+            "text": text,
+            "usage": {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4},
+        }
+
+    async def generate_image(self, model: str, prompt: str) -> dict:
+        await self._simulate_call(self.image_latency)
+        data = await asyncio.to_thread(self._render, prompt)
+        return {
+            "data": data,
+            "mime_type": "image/png",
+            "usage": {"input_tokens": len(prompt) // 4, "output_tokens": 1290},
+        }
+
+    @staticmethod
+    def _render(prompt: str) -> bytes:
+        """Render a deterministic synthetic image for a prompt."""
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        dark = tuple(digest[0:3])
+        light = tuple(128 + value // 2 for value in digest[3:6])
+        gradient = Image.linear_gradient("L").resize((IMAGE_SIZE, IMAGE_SIZE))
+        image = ImageOps.colorize(gradient, dark, light)
+        draw = ImageDraw.Draw(image)
+        for index in range(6):
+            x, y, radius = digest[6 + index * 3: 9 + index * 3]
+            x, y = x * IMAGE_SIZE // 256, y * IMAGE_SIZE // 256
+            radius = 40 + radius
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=tuple(digest[20 + index: 23 + index]))
+        output = io.BytesIO()
+        image.save(output, format="PNG")
+        return output.getvalue()
+
+
+_backend = None
+
+
+def get_ai_backend() -> AIBackend:
+    """Get or create the configured AI backend."""
+    global _backend
+    if _backend is None:
+        if AI_BACKEND == "gemini":
+            _backend = GeminiBackend(GEMINI_API_KEY)
+        elif AI_BACKEND == "fake":
+            _backend = FakeBackend()
+        else:
+            raise ValueError(f"Unknown AI_BACKEND: {AI_BACKEND}")
+    return _backend
+
+
+def set_ai_backend(backend: AIBackend):
+    """Replace the active backend (for benchmarks and load tests)."""
+    global _backend
+    _backend = backend
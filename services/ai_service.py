@@ -1,25 +1,185 @@
 """
 AI Service - Gemini text and image generation.
+
+All calls go through the configured async AI backend (see ai_backends) so a
+slow generation never blocks the event loop; a semaphore bounds how many calls one worker keeps
+in flight at the same time. Every call is rate limited per model and
+retried on transient failures (see rate_limiter). Structured outputs are
+cached per holiday in an in-process LRU backed by a MongoDB collection with
+a TTL, and generated base images are kept in the image store so every send
+path can reuse them.
 """
+import asyncio
+import hashlib
 import json
 import io
+import time
+from cachetools import TTLCache
 from PIL import Image
-from google import genai
-from google.genai import types
 from fastapi import HTTPException
-from config import GEMINI_API_KEY, GEMINI_TEXT_MODEL, GEMINI_IMAGE_MODEL, STRUCTURED_OUTPUT_PROMPT
+from config import (
+    GEMINI_TEXT_MODEL,
+    GEMINI_IMAGE_MODEL,
+    STRUCTURED_OUTPUT_PROMPT,
+    AI_MAX_CONCURRENT_REQUESTS,
+    GEMINI_TEXT_TIMEOUT_SECONDS,
+    GEMINI_IMAGE_TIMEOUT_SECONDS,
+    STRUCTURED_OUTPUT_CACHE_TTL_SECONDS,
+    STRUCTURED_OUTPUT_LRU_SIZE,
+)
+from database import StructuredOutputRepository
+from .image_store import load_stored_image, save_generated_image, prompt_hash
+from .single_flight import structured_output_flight, image_flight
+from .rate_limiter import call_with_retry
+from .ai_backends import get_ai_backend
+from .metrics import record_ai_call
+
+# Bounds concurrent Gemini calls (created lazily on the running loop)
+_semaphore = None
+
+# In-process LRU in front of the Mongo structured output cache
+_structured_output_lru = TTLCache(
+    maxsize=STRUCTURED_OUTPUT_LRU_SIZE, ttl=STRUCTURED_OUTPUT_CACHE_TTL_SECONDS
+)
+_TEMPLATE_HASH = hashlib.sha256(STRUCTURED_OUTPUT_PROMPT.encode("utf-8")).hexdigest()[:16]
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """Get or create the semaphore limiting in-flight Gemini calls."""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(AI_MAX_CONCURRENT_REQUESTS)
+    return _semaphore
+
+
+async def _backend_call(method: str, model: str, prompt: str) -> dict:
+    """Single backend call (call_with_retry holds an in-flight slot around it, after the rate limit token)."""
+    return await getattr(get_ai_backend(), method)(model, prompt)
+
+
+async def _instrumented_call(kind: str, method: str, model: str, timeout: float, prompt: str) -> dict:
+    """Run a rate-limited, retried backend call and record its metrics.
+
+    Duration covers the whole call as the caller sees it, including rate
+    limit waits and retry backoff.
+    """
+    model_tag = get_ai_backend().model_tag(model)
+    attempts = 0
 
-# Initialize Gemini client
-client = genai.Client(api_key=GEMINI_API_KEY)
+    async def _attempt():
+        nonlocal attempts
+        attempts += 1
+        return await _backend_call(method, model, prompt)
 
+    started = time.perf_counter()
+    try:
+        response = await call_with_retry(model, timeout, _attempt, slots=_get_semaphore())
+    except Exception as e:
+        await record_ai_call(
+            kind, model_tag, time.perf_counter() - started,
+            outcome=type(e).__name__, retries=max(0, attempts - 1),
+        )
+        raise
+
+    usage = response.get("usage") or {}
+    await record_ai_call(
+        kind, model_tag, time.perf_counter() - started,
+        outcome="success",
+        retries=attempts - 1,
+        input_tokens=usage.get("input_tokens", 0),
+        output_tokens=usage.get("output_tokens", 0),
+        image_bytes=len(response.get("data") or b""),
+    )
+    return response
+
+
+def structured_output_cache_key(holiday: str, description: str = None) -> str:
+    """Build the cache key for a holiday's structured output.
 
-def generate_structured_output(holiday: str, description: str = None) -> dict:
+    The key covers the holiday, its description, the prompt template and the
+    text model, so changing any of them produces a fresh generation.
+    """
+    raw = json.dumps(
+        [
+            (holiday or "").strip(),
+            (description or "").strip(),
+            _TEMPLATE_HASH,
+            get_ai_backend().model_tag(GEMINI_TEXT_MODEL),
+        ]
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def generate_structured_output(
+    holiday: str,
+    description: str = None,
+    force_refresh: bool = False,
+) -> dict:
     """Generate structured output with prompt and caption using Gemini Flash.
 
+    Results are cached in-process and in MongoDB, so a preview and the later
+    distribution of the same holiday share one text-model call. Concurrent
+    identical requests share a single in-flight call.
+
     Args:
         holiday: The holiday name/prompt
         description: Optional detailed description of the holiday for better context
+        force_refresh: Skip the cache and regenerate (the new result replaces the cached one)
     """
+    cache_key = structured_output_cache_key(holiday, description)
+    result = await structured_output_flight.do(
+        f"{cache_key}:{force_refresh}",
+        _cached_structured_output,
+        cache_key,
+        holiday,
+        description,
+        force_refresh,
+    )
+    return dict(result)
+
+
+async def _cached_structured_output(
+    cache_key: str,
+    holiday: str,
+    description: str,
+    force_refresh: bool,
+) -> dict:
+    """Serve a structured output from the caches, generating it on a miss."""
+    if not force_refresh:
+        cached = _structured_output_lru.get(cache_key)
+        if cached is not None:
+            return cached["result"]
+        try:
+            result = await StructuredOutputRepository.get(cache_key)
+        except Exception as e:
+            print(f"[AI Cache] Lookup failed, generating fresh output: {e}")
+            result = None
+        if result is not None:
+            _structured_output_lru[cache_key] = {"holiday": holiday, "result": result}
+            return result
+
+    result = await _generate_structured_output(holiday, description)
+
+    _structured_output_lru[cache_key] = {"holiday": holiday, "result": result}
+    try:
+        await StructuredOutputRepository.set(
+            cache_key, holiday, description, get_ai_backend().model_tag(GEMINI_TEXT_MODEL), result
+        )
+    except Exception as e:
+        print(f"[AI Cache] Failed to persist structured output: {e}")
+    return result
+
+
+async def invalidate_structured_output(holiday: str) -> int:
+    """Drop every cached structured output for a holiday name."""
+    for key, entry in list(_structured_output_lru.items()):
+        if entry["holiday"] == holiday:
+            _structured_output_lru.pop(key, None)
+    return await StructuredOutputRepository.delete_for_holiday(holiday)
+
+
+async def _generate_structured_output(holiday: str, description: str = None) -> dict:
+    """Call Gemini Flash for a holiday's prompt and caption (uncached)."""
     # Build the prompt with description if available
     if description:
         holiday_context = f"{holiday}. Context: {description}"
@@ -28,14 +188,12 @@ def generate_structured_output(holiday: str, description: str = None) -> dict:
 
     prompt = STRUCTURED_OUTPUT_PROMPT.format(holiday=holiday_context)
 
-    response = client.models.generate_content(
-        model=GEMINI_TEXT_MODEL,
-        contents=prompt,
-        config=types.GenerateContentConfig(response_mime_type="application/json"),
+    response = await _instrumented_call(
+        "text", "generate_text", GEMINI_TEXT_MODEL, GEMINI_TEXT_TIMEOUT_SECONDS, prompt
     )
 
     try:
-        result = json.loads(response.text)
+        result = json.loads(response["text"])
         return result
     except json.JSONDecodeError:
         raise HTTPException(
@@ -43,24 +201,57 @@ def generate_structured_output(holiday: str, description: str = None) -> dict:
         )
 
 
-def generate_image(prompt: str) -> Image.Image:
+async def generate_image_bytes(prompt: str) -> tuple:
+    """Generate an image using Gemini image model and return (bytes, mime_type)."""
+    response = await _instrumented_call(
+        "image", "generate_image", GEMINI_IMAGE_MODEL, GEMINI_IMAGE_TIMEOUT_SECONDS, prompt
+    )
+    return response["data"], response["mime_type"]
+
+
+async def generate_image(prompt: str) -> Image.Image:
     """Generate an image using Gemini image model."""
-    response = client.models.generate_content(
-        model=GEMINI_IMAGE_MODEL,
-        contents=[prompt],
-        config=types.GenerateContentConfig(
-            response_modalities=["IMAGE", "TEXT"],
-            image_config=types.ImageConfig(
-                aspect_ratio="1:1",
-                image_size="1K",
-            )
-        )
+    image_data, _ = await generate_image_bytes(prompt)
+    return Image.open(io.BytesIO(image_data))
+
+
+async def get_base_image(
+    holiday_key: str,
+    prompt: str,
+    regenerate: bool = False,
+) -> dict:
+    """Get the stored base image for a holiday and prompt, generating it if needed.
+
+    Concurrent requests for the same holiday and prompt share one lookup or
+    generation. Returns a dict with the decoded "image", the raw Gemini
+    "data" bytes, the stored "metadata" and whether it was served from the
+    store ("cached").
+    """
+    stored = await image_flight.do(
+        f"{holiday_key}:{prompt_hash(prompt)}:{regenerate}",
+        _load_or_generate_image,
+        holiday_key,
+        prompt,
+        regenerate,
     )
+    return {
+        "image": Image.open(io.BytesIO(stored["data"])),
+        **stored,
+    }
+
 
-    # Extract the generated image from response
-    for part in response.candidates[0].content.parts:
-        if part.inline_data is not None:
-            image_data = part.inline_data.data
-            return Image.open(io.BytesIO(image_data))
+async def _load_or_generate_image(holiday_key: str, prompt: str, regenerate: bool) -> dict:
+    """Load a base image from the store, generating and storing it on a miss."""
+    stored = None if regenerate else await load_stored_image(holiday_key, prompt)
+    if stored is not None:
+        return {"data": stored["data"], "metadata": stored["metadata"], "cached": True}
 
-    raise HTTPException(status_code=500, detail="No image generated by Gemini")
+    image_data, mime_type = await generate_image_bytes(prompt)
+    try:
+        metadata = await save_generated_image(
+            holiday_key, prompt, image_data, mime_type, get_ai_backend().model_tag(GEMINI_IMAGE_MODEL)
+        )
+    except Exception as e:
+        print(f"[Image Store] Failed to store generated image: {e}")
+        metadata = {"holiday_key": holiday_key, "mime_type": mime_type, "size_bytes": len(image_data)}
+    return {"data": image_data, "metadata": metadata, "cached": False}
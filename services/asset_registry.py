@@ -0,0 +1,112 @@
+"""
+Asset Registry - Preloaded static assets for post compositing.
+
+overlay.png, the default logo and the footer font are decoded once, converted
+to RGBA and stored at their final size (IMAGE_SIZE / LOGO_SIZE). The files'
+modification times are checked at most every ASSET_RELOAD_CHECK_SECONDS and
+changed assets are reloaded, bumping the registry version. The fingerprint
+(a hash of the asset files) identifies the asset content in cache keys.
+"""
+import os
+import time
+import hashlib
+import threading
+from typing import Optional
+from PIL import Image, ImageFont
+from config import (
+    IMAGE_SIZE,
+    OVERLAY_IMAGE_PATH,
+    LOGO_IMAGE_PATH,
+    LOGO_SIZE,
+    FONT_PATH,
+    FOOTER_FONT_SIZE,
+    ASSET_RELOAD_CHECK_SECONDS,
+)
+
+
+def _mtime(path: str) -> Optional[float]:
+    """File modification time, or None when the file is missing."""
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class AssetRegistry:
+    """Holds the decoded, pre-sized compositing assets and reloads them on change."""
+
+    def __init__(self):
+        self.overlay = None
+        self.logo = None
+        self.font = None
+        self.version = 0
+        self.fingerprint = None
+        self._mtimes = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current_mtimes(self) -> tuple:
+        return (_mtime(OVERLAY_IMAGE_PATH), _mtime(LOGO_IMAGE_PATH), _mtime(FONT_PATH))
+
+    def _load(self, mtimes: tuple):
+        """Decode every asset at its final size."""
+        overlay = Image.open(OVERLAY_IMAGE_PATH).convert("RGBA")
+        if overlay.size != (IMAGE_SIZE, IMAGE_SIZE):
+            overlay = overlay.resize((IMAGE_SIZE, IMAGE_SIZE), Image.Resampling.LANCZOS)
+
+        logo = None
+        try:
+            logo = Image.open(LOGO_IMAGE_PATH).convert("RGBA")
+            if logo.size != (LOGO_SIZE, LOGO_SIZE):
+                logo = logo.resize((LOGO_SIZE, LOGO_SIZE), Image.Resampling.LANCZOS)
+        except Exception:
+            pass
+
+        try:
+            font = ImageFont.truetype(FONT_PATH, FOOTER_FONT_SIZE)
+        except (IOError, OSError):
+            print(f"Warning: Could not load {FONT_PATH}, falling back to default")
+            font = ImageFont.load_default()
+
+        digest = hashlib.sha256()
+        for path in (OVERLAY_IMAGE_PATH, LOGO_IMAGE_PATH, FONT_PATH):
+            try:
+                with open(path, "rb") as file:
+                    digest.update(file.read())
+            except OSError:
+                digest.update(b"missing")
+
+        self.overlay, self.logo, self.font = overlay, logo, font
+        self.fingerprint = digest.hexdigest()[:16]
+        self._mtimes = mtimes
+        self.version += 1
+        print(f"[Assets] Loaded compositing assets (version {self.version})")
+
+    def refresh(self, force: bool = False):
+        """Reload the assets if any file changed since the last load."""
+        now = time.monotonic()
+        if not force and self._mtimes is not None and now - self._checked_at < ASSET_RELOAD_CHECK_SECONDS:
+            return
+        with self._lock:
+            self._checked_at = now
+            mtimes = self._current_mtimes()
+            if force or mtimes != self._mtimes:
+                self._load(mtimes)
+
+    def get(self) -> "AssetRegistry":
+        """Get the registry with up-to-date assets."""
+        self.refresh()
+        return self
+
+
+assets = AssetRegistry()
+
+
+def load_assets():
+    """Load the compositing assets (called once at startup)."""
+    assets.refresh(force=True)
+
+
+def get_assets() -> AssetRegistry:
+    """Get the compositing assets, reloading any that changed on disk."""
+    return assets.get()
@@ -0,0 +1,116 @@
+"""
+Brand Layer - Pre-rendered per-user branding for legacy user posts.
+
+overlay.png, the user's logo and footer text do not depend on the holiday,
+so they are flattened once into a single transparent IMAGE_SIZE "brand
+layer". Sending a post then takes one alpha composite (of the layer's dirty
+rectangles, see overlay_coverage) instead of compositing the overlay,
+resizing the logo and measuring and drawing the footer every time.
+
+Layers are cached in a byte-bounded LRU keyed by user id and a hash of the
+logo, footer text and asset fingerprint, so a changed logo, footer or asset
+file yields a new layer. Layers are built when a user is created or updated
+and on the first send otherwise.
+"""
+import io
+import hashlib
+from typing import Optional
+from PIL import Image, ImageDraw
+from config import (
+    IMAGE_SIZE,
+    LOGO_SIZE,
+    LOGO_PADDING,
+    DEFAULT_FOOTER_TEXT,
+    FOOTER_ELEVATION,
+    FOOTER_TEXT_COLOR,
+    BRAND_LAYER_CACHE_MAX_MB,
+)
+from .asset_registry import get_assets
+from .overlay_cache import OverlayCache
+from .overlay_coverage import PreparedOverlay
+
+DEFAULT_BRAND_OWNER = "default"
+
+brand_layer_cache = OverlayCache(BRAND_LAYER_CACHE_MAX_MB * 1024 * 1024)
+
+
+def user_footer_text(user: dict) -> str:
+    """Footer for a legacy user: "Phone | Mail | Website"."""
+    return f"{user.get('phone', '')}   |   {user.get('mail', '').upper()}   |   {user.get('website', '').upper()}"
+
+
+def brand_layer_key(logo_data: Optional[bytes], footer_text: str) -> str:
+    """Hash the inputs of a brand layer, including the current asset files."""
+    digest = hashlib.sha256()
+    digest.update(get_assets().fingerprint.encode("ascii"))
+    digest.update(hashlib.sha256(logo_data or b"").digest())
+    digest.update(footer_text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def build_brand_layer(logo_data: Optional[bytes] = None, footer_text: str = DEFAULT_FOOTER_TEXT) -> Image.Image:
+    """Flatten overlay.png, the logo and the footer text into one RGBA layer."""
+    registry = get_assets()
+
+    # Layer 2: overlay.png (preloaded at IMAGE_SIZE)
+    layer = registry.overlay.copy()
+
+    # Layer 3: logo on the top-left with padding
+    if logo_data:
+        logo = Image.open(io.BytesIO(logo_data)).convert("RGBA")
+        logo = logo.resize((LOGO_SIZE, LOGO_SIZE), Image.Resampling.LANCZOS)
+    else:
+        # Fallback to the preloaded default logo if available
+        logo = registry.logo
+
+    if logo:
+        layer.alpha_composite(logo, dest=(LOGO_PADDING, LOGO_PADDING))
+
+    # Layer 4: footer text, centered horizontally. Drawn as a coverage mask and
+    # composited, so anti-aliased edges keep the text colour on a transparent layer.
+    font = registry.font
+    text_mask = Image.new("L", (IMAGE_SIZE, IMAGE_SIZE), 0)
+    draw = ImageDraw.Draw(text_mask)
+    text_bbox = draw.textbbox((0, 0), footer_text, font=font)
+    text_width = text_bbox[2] - text_bbox[0]
+    text_height = text_bbox[3] - text_bbox[1]
+    x = (IMAGE_SIZE - text_width) // 2
+    y = IMAGE_SIZE - FOOTER_ELEVATION - text_height
+    draw.text((x, y), footer_text, font=font, fill=255)
+
+    text_layer = Image.new("RGBA", (IMAGE_SIZE, IMAGE_SIZE), FOOTER_TEXT_COLOR + (0,))
+    text_layer.putalpha(text_mask)
+    layer.alpha_composite(text_layer)
+    return layer
+
+
+def get_brand_layer(
+    owner_id: Optional[str] = None,
+    logo_data: Optional[bytes] = None,
+    footer_text: str = DEFAULT_FOOTER_TEXT,
+) -> PreparedOverlay:
+    """Get a brand layer from the cache, building it on a miss."""
+    owner_id = owner_id or DEFAULT_BRAND_OWNER
+    key = brand_layer_key(logo_data, footer_text)
+    layer = brand_layer_cache.get(owner_id, key)
+    if layer is None:
+        layer = PreparedOverlay(build_brand_layer(logo_data, footer_text))
+        brand_layer_cache.put(owner_id, key, layer)
+    return layer
+
+
+def prepare_user_brand_layer(user: dict) -> PreparedOverlay:
+    """Drop a user's cached brand layers and build the current one (on create/update)."""
+    user_id = str(user["_id"])
+    brand_layer_cache.invalidate(user_id)
+    return get_brand_layer(user_id, user.get("logo"), user_footer_text(user))
+
+
+def invalidate_user_brand_layer(user_id: str) -> int:
+    """Drop a user's cached brand layers."""
+    return brand_layer_cache.invalidate(str(user_id))
+
+
+def get_brand_layer_stats() -> dict:
+    """Get the brand layer cache statistics."""
+    return brand_layer_cache.stats()
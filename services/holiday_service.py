@@ -11,7 +11,7 @@ from database import HolidayRepository
 async def get_holiday_with_description_for_today() -> Optional[dict]:
     """
     Get today's holiday with full details (prompt and description).
-    Returns dict with prompt and description if found, None otherwise.
+    Returns dict with id, prompt and description if found, None otherwise.
     """
     today = (datetime.now() + timedelta(days=1)).strftime("%d-%m-%Y")
 
@@ -19,6 +19,7 @@ async def get_holiday_with_description_for_today() -> Optional[dict]:
         holiday = await HolidayRepository.get_by_date(today)
         if holiday:
             return {
+                "id": holiday.get("id"),
                 "prompt": holiday.get("prompt"),
                 "description": holiday.get("description")
             }
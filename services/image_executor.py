@@ -0,0 +1,237 @@
+"""
+Image Executor - Bounded thread pool for request-path Pillow work.
+
+Decoding, resizing, compositing and encoding images are CPU-bound and must
+not run on the event loop, where one large upload would stall every other
+request. Request handlers submit that work to a shared pool with a fixed
+number of threads (Pillow releases the GIL for most of it) and a bounded
+queue. Once IMAGE_WORK_MAX_QUEUE jobs are waiting, new requests are rejected
+with 503 and a Retry-After hint instead of piling up; background jobs wait
+for a slot instead.
+
+Request bodies are limited by UploadLimitMiddleware while they are
+received: a Content-Length over UPLOAD_MAX_BODY_BYTES is refused with 413
+before any of the body is read, and a body that grows past it (chunked, or
+lying about its length) is cut off as soon as it does. read_upload then
+checks the file's byte size and its pixel count from the image header, so
+oversized files and decompression bombs are refused before they are decoded.
+"""
+import io
+import time
+import asyncio
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from PIL import Image
+from config import (
+    IMAGE_WORK_THREADS,
+    IMAGE_WORK_MAX_QUEUE,
+    UPLOAD_MAX_BYTES,
+    UPLOAD_MAX_BODY_BYTES,
+    UPLOAD_MAX_PIXELS,
+    UPLOAD_CHUNK_SIZE,
+)
+from .metrics import observe, increment, BYTES_BUCKETS
+
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+WORK_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64)
+HEADER_PROBE_BYTES = 256 * 1024  # Stop looking for the dimensions in the partial upload past this
+
+
+class ImageExecutor:
+    """Thread pool with a bounded wait queue and queue depth metrics."""
+
+    def __init__(self, threads: int, max_queue: int):
+        self.threads = max(1, threads)
+        self.max_queue = max(0, max_queue)
+        self._pool = None
+        self._slots = None
+        self.running = 0
+        self.queued = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="image-work")
+        return self._pool
+
+    async def run(self, name: str, fn, *args, reject_when_full: bool = True):
+        """Run fn(*args) on the pool, or raise 503 when the queue is full and reject_when_full."""
+        if reject_when_full and self.queued >= self.max_queue and self.running >= self.threads:
+            self.rejected += 1
+            increment("image_work_rejected_total", {"task": name})
+            raise HTTPException(
+                status_code=503,
+                detail="Image processing is at capacity, try again later",
+                headers={"Retry-After": "2"},
+            )
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.threads)
+
+        self.submitted += 1
+        observe("image_work_queue_depth", {}, self.queued, DEPTH_BUCKETS)
+        queued_at = time.monotonic()
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        observe("image_work_wait_seconds", {"task": name}, time.monotonic() - queued_at, WAIT_BUCKETS)
+
+        self.running += 1
+        started_at = time.monotonic()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._get_pool(), fn, *args)
+            self.completed += 1
+            increment("image_work_total", {"task": name, "outcome": "success"})
+            return result
+        except Exception:
+            self.failed += 1
+            increment("image_work_total", {"task": name, "outcome": "error"})
+            raise
+        finally:
+            self.running -= 1
+            self._slots.release()
+            observe("image_work_duration_seconds", {"task": name}, time.monotonic() - started_at, WORK_BUCKETS)
+
+    def stats(self) -> dict:
+        """Get the pool size, queue depth and job counters."""
+        return {
+            "threads": self.threads,
+            "running": self.running,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        """Stop the worker threads."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+image_executor = ImageExecutor(IMAGE_WORK_THREADS, IMAGE_WORK_MAX_QUEUE)
+
+
+async def run_image_work(name: str, fn, *args, reject_when_full: bool = True):
+    """Run CPU-bound image work on the shared bounded pool."""
+    return await image_executor.run(name, fn, *args, reject_when_full=reject_when_full)
+
+
+def _image_dimensions(data: bytes) -> Optional[tuple]:
+    """Read an image's dimensions from its header, or None if the header is incomplete."""
+    try:
+        with warnings.catch_warnings():
+            # The pixel limit is checked here instead of by Pillow's bomb warning
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(data)) as image:
+                return image.size
+    except Image.DecompressionBombError as e:
+        raise HTTPException(status_code=413, detail=f"Image has too many pixels: {e}")
+    except Exception:
+        return None
+
+
+def _check_pixels(size: tuple, max_pixels: int):
+    width, height = size
+    if width * height > max_pixels:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image is {width}x{height}; at most {max_pixels} pixels are allowed",
+        )
+
+
+async def read_upload(
+    upload: UploadFile,
+    max_bytes: int = UPLOAD_MAX_BYTES,
+    max_pixels: int = UPLOAD_MAX_PIXELS,
+) -> bytes:
+    """Read a received upload in chunks, enforcing the byte and pixel limits before it is decoded.
+
+    The request body has already been received (within UPLOAD_MAX_BODY_BYTES,
+    see UploadLimitMiddleware) and spooled by the time this runs.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {max_bytes} bytes")
+
+    chunks, received, size = [], 0, None
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        received += len(chunk)
+        if received > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds {max_bytes} bytes")
+        chunks.append(chunk)
+        if size is None and received <= HEADER_PROBE_BYTES:
+            # The dimensions are in the header, normally within the first chunk
+            size = _image_dimensions(b"".join(chunks))
+            if size is not None:
+                _check_pixels(size, max_pixels)
+
+    data = b"".join(chunks)
+    if size is None:
+        size = _image_dimensions(data)
+        if size is not None:
+            _check_pixels(size, max_pixels)
+    increment("uploads_total", {})
+    observe("upload_bytes", {}, received, BYTES_BUCKETS)
+    return data
+
+
+class UploadLimitMiddleware:
+    """ASGI middleware refusing request bodies over max_bytes with 413 while they are received."""
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_BODY_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body exceeds {self.max_bytes} bytes"
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Stops the body parser; FastAPI turns it into the 413 response
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def stop_image_executor():
+    """Shut down the image work pool (called on application shutdown)."""
+    image_executor.shutdown()
+
+
+def get_image_executor_stats() -> dict:
+    """Get the image work pool state and limits."""
+    return {
+        **image_executor.stats(),
+        "upload_max_bytes": UPLOAD_MAX_BYTES,
+        "upload_max_pixels": UPLOAD_MAX_PIXELS,
+    }
@@ -3,20 +3,21 @@ Image Service - Image processing and overlay operations.
 """
 import io
 import base64
-from PIL import Image, ImageDraw, ImageFont
+from typing import Optional, Union
+import numpy as np
+from PIL import Image
+from fastapi import HTTPException
 from config import (
     IMAGE_SIZE,
-    OVERLAY_IMAGE_PATH,
-    LOGO_IMAGE_PATH,
-    LOGO_SIZE,
-    LOGO_PADDING,
     USER_LOGO_SIZE,
+    OVERLAY_THUMBNAIL_SIZE,
     DEFAULT_FOOTER_TEXT,
-    FOOTER_ELEVATION,
-    FOOTER_FONT_SIZE,
-    FOOTER_TEXT_COLOR,
-    FONT_PATH,
+    ENCODING_PROFILES,
+    DEFAULT_ENCODING_PROFILE,
 )
+from .overlay_cache import get_subscriber_overlay, decode_overlay
+from .overlay_coverage import PreparedOverlay
+from .brand_layer import get_brand_layer
 
 
 def process_logo(logo_content: bytes) -> bytes:
@@ -30,96 +31,174 @@ def process_logo(logo_content: bytes) -> bytes:
     return output.getvalue()
 
 
+def _lossless_palette(image: Image.Image) -> Optional[Image.Image]:
+    """Convert an RGBA image to palette mode when it has at most 256 colours, else None."""
+    pixels = np.asarray(image).view(np.uint32).reshape(-1)
+    colors, indices = np.unique(pixels, return_inverse=True)
+    if len(colors) > 256:
+        return None
+    palette_image = Image.fromarray(indices.astype(np.uint8).reshape(image.height, image.width), "P")
+    palette_image.putpalette(colors.view(np.uint8).tobytes(), rawmode="RGBA")
+    return palette_image
+
+
+def process_overlay(overlay_content: bytes) -> dict:
+    """Normalize an uploaded subscriber overlay for storage.
+
+    The overlay is converted to RGBA, resized to IMAGE_SIZE (so sends never
+    resize) and saved as an optimized PNG, palette-quantized when that is
+    lossless. Returns the PNG "data", a small PNG "thumbnail" and the
+    normalized and original dimensions.
+    """
+    img = Image.open(io.BytesIO(overlay_content))
+    original_width, original_height = img.size
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+    if img.size != (IMAGE_SIZE, IMAGE_SIZE):
+        img = img.resize((IMAGE_SIZE, IMAGE_SIZE), Image.Resampling.LANCZOS)
+
+    output = io.BytesIO()
+    (_lossless_palette(img) or img).save(output, format="PNG", optimize=True)
+
+    thumbnail = img.copy()
+    thumbnail.thumbnail((OVERLAY_THUMBNAIL_SIZE, OVERLAY_THUMBNAIL_SIZE), Image.Resampling.LANCZOS)
+    thumbnail_output = io.BytesIO()
+    thumbnail.save(thumbnail_output, format="PNG", optimize=True)
+
+    return {
+        "data": output.getvalue(),
+        "thumbnail": thumbnail_output.getvalue(),
+        "width": img.width,
+        "height": img.height,
+        "original_width": original_width,
+        "original_height": original_height,
+    }
+
+
 def overlay_images(
     generated_image: Image.Image,
     logo_data: bytes = None,
     footer_text: str = DEFAULT_FOOTER_TEXT,
+    user_id: str = None,
 ) -> Image.Image:
-    """Overlay the overlay.png and a logo on top of the generated image."""
+    """Overlay the overlay.png, a logo and the footer text on top of the generated image.
+
+    The three layers are pre-rendered into a cached brand layer (per user_id
+    when given), so this is a single alpha composite.
+    """
     # Ensure the generated image is in RGBA mode
     if generated_image.mode != "RGBA":
         generated_image = generated_image.convert("RGBA")
 
-    # Create a copy to work with
-    final_image = generated_image.copy()
-
-    # Layer 2: Overlay the overlay.png
-    overlay = Image.open(OVERLAY_IMAGE_PATH).convert("RGBA")
-    if overlay.size != (IMAGE_SIZE, IMAGE_SIZE):
-        overlay = overlay.resize((IMAGE_SIZE, IMAGE_SIZE), Image.Resampling.LANCZOS)
-    final_image = Image.alpha_composite(final_image, overlay)
-
-    # Layer 3: Paste the logo on top-left with padding
-    logo = None
-    if logo_data:
-        logo = Image.open(io.BytesIO(logo_data)).convert("RGBA")
-    else:
-        # Fallback to local default logo if available
-        try:
-            logo = Image.open(LOGO_IMAGE_PATH).convert("RGBA")
-        except Exception:
-            pass
-
-    if logo:
-        logo = logo.resize((LOGO_SIZE, LOGO_SIZE), Image.Resampling.LANCZOS)
-        final_image.paste(logo, (LOGO_PADDING, LOGO_PADDING), logo)
-
-    # Layer 4: Add footer text
-    draw = ImageDraw.Draw(final_image)
-
-    try:
-        font = ImageFont.truetype(FONT_PATH, FOOTER_FONT_SIZE)
-    except (IOError, OSError):
-        print(f"Warning: Could not load {FONT_PATH}, falling back to default")
-        font = ImageFont.load_default()
-
-    # Calculate text position (centered horizontally)
-    text_bbox = draw.textbbox((0, 0), footer_text, font=font)
-    text_width = text_bbox[2] - text_bbox[0]
-    text_height = text_bbox[3] - text_bbox[1]
-    x = (IMAGE_SIZE - text_width) // 2
-    y = IMAGE_SIZE - FOOTER_ELEVATION - text_height
-
-    # Draw the footer text
-    draw.text((x, y), footer_text, font=font, fill=FOOTER_TEXT_COLOR)
-
-    return final_image
+    layer = get_brand_layer(user_id, logo_data, footer_text)
+    return layer.composite_onto(generated_image)
 
 
 def overlay_subscriber_image(
     generated_image: Image.Image,
-    overlay_data: bytes,
+    overlay_data: Union[PreparedOverlay, Image.Image, bytes, str, None],
+    subscriber_id: str = None,
+    content_hash: str = None,
 ) -> Image.Image:
-    """Overlay a subscriber's custom overlay on top of the generated image."""
+    """Overlay a subscriber's custom overlay on top of the generated image.
+
+    overlay_data may be a prepared overlay (see load_subscriber_overlay), a
+    decoded image, raw PNG bytes or a base64 string. For bytes/strings with
+    a subscriber_id, the prepared overlay is served from the overlay cache.
+    Prepared overlays blend only their dirty rectangles; anything else is a
+    one-off composite, where the coverage analysis would cost more than it
+    saves, and goes through Image.alpha_composite.
+    """
     # Ensure the generated image is in RGBA mode
     if generated_image.mode != "RGBA":
         generated_image = generated_image.convert("RGBA")
 
-    # Create a copy to work with
-    final_image = generated_image.copy()
+    if overlay_data is None:
+        return generated_image.copy()
 
     # Load and overlay the subscriber's custom overlay
     try:
-        overlay = Image.open(io.BytesIO(overlay_data)).convert("RGBA")
-        # Resize overlay to match the image size if needed
-        if overlay.size != final_image.size:
-            overlay = overlay.resize(final_image.size, Image.Resampling.LANCZOS)
-        final_image = Image.alpha_composite(final_image, overlay)
+        if isinstance(overlay_data, PreparedOverlay):
+            overlay = overlay_data
+        elif isinstance(overlay_data, Image.Image):
+            overlay = overlay_data.convert("RGBA") if overlay_data.mode != "RGBA" else overlay_data
+        elif subscriber_id:
+            overlay = get_subscriber_overlay(str(subscriber_id), overlay_data, content_hash)
+        else:
+            overlay = decode_overlay(overlay_data)
+
+        if isinstance(overlay, PreparedOverlay) and overlay.size == generated_image.size:
+            return overlay.composite_onto(generated_image)
+        # One-off composite (or a base of another size than the cached IMAGE_SIZE overlay)
+        image = overlay.image if isinstance(overlay, PreparedOverlay) else overlay
+        if image.size != generated_image.size:
+            image = image.resize(generated_image.size, Image.Resampling.LANCZOS)
+        return Image.alpha_composite(generated_image, image)
     except Exception as e:
         print(f"Warning: Could not apply subscriber overlay: {e}")
 
-    return final_image
+    return generated_image.copy()
+
+
+def get_encoding_profile(profile: str = None) -> dict:
+    """Get the settings of a named encoding profile (DEFAULT_ENCODING_PROFILE when None)."""
+    name = profile or DEFAULT_ENCODING_PROFILE
+    if name not in ENCODING_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown encoding profile '{name}'. Available: {', '.join(ENCODING_PROFILES)}",
+        )
+    return ENCODING_PROFILES[name]
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    """Flatten an image onto white, skipping the composite when alpha is fully opaque."""
+    if image.mode == "RGB":
+        return image
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    alpha = image.getchannel("A")
+    if alpha.getextrema() == (255, 255):
+        return image.convert("RGB")
+    background = Image.new("RGB", image.size, (255, 255, 255))
+    background.paste(image, mask=alpha)
+    return background
+
+
+def encode_image(image: Image.Image, profile: str = None) -> bytes:
+    """Encode an image with a named encoding profile."""
+    settings = dict(get_encoding_profile(profile))
+    image_format = settings.pop("format")
+    max_dimension = settings.pop("max_dimension", None)
+
+    image = _flatten(image)
+    if max_dimension and max(image.size) > max_dimension:
+        scale = max_dimension / max(image.size)
+        size = (round(image.width * scale), round(image.height * scale))
+        image = image.resize(size, Image.Resampling.LANCZOS)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **settings)
+    return buffer.getvalue()
 
 
-def image_to_base64(image: Image.Image) -> str:
-    """Convert PIL Image to base64 string."""
-    # Convert to RGB if needed (for PNG compatibility with alpha)
-    if image.mode == "RGBA":
-        background = Image.new("RGB", image.size, (255, 255, 255))
-        background.paste(image, mask=image.split()[3])
-        image = background
+def image_to_base64(image: Image.Image, profile: str = None) -> str:
+    """Convert PIL Image to a base64 string encoded with the given profile."""
+    return base64.b64encode(encode_image(image, profile)).decode("utf-8")
 
-    buffer = io.BytesIO()
-    image.save(buffer, format="PNG")
-    buffer.seek(0)
-    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+def base_image_bytes(base: dict, profile: str = None) -> bytes:
+    """Get the encoded bytes of an unmodified base image (from get_base_image).
+
+    The stored generated bytes are passed through untouched unless the
+    profile has to downsize them.
+    """
+    max_dimension = get_encoding_profile(profile).get("max_dimension")
+    if not max_dimension or max(base["image"].size) <= max_dimension:
+        return base["data"]
+    return encode_image(base["image"], profile)
+
+
+def base_image_to_base64(base: dict, profile: str = None) -> str:
+    """Convert an unmodified base image (from get_base_image) to base64."""
+    return base64.b64encode(base_image_bytes(base, profile)).decode("utf-8")
\ No newline at end of file
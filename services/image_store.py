@@ -0,0 +1,206 @@
+"""
+Image Store - Content-addressed storage for generated base images.
+
+Raw Gemini image bytes are stored once per content hash, and a small
+reference record maps (holiday key, prompt hash) to that content together
+with its metadata. A blob is removed once the last reference to it is
+deleted or replaced. Backends are pluggable; the active one is selected
+with IMAGE_STORE_BACKEND.
+"""
+import os
+import json
+import hashlib
+import asyncio
+import threading
+from datetime import datetime
+from typing import Optional
+from config import IMAGE_STORE_BACKEND, IMAGE_STORE_DIR
+
+
+def prompt_hash(prompt: str) -> str:
+    """Hash an image-generation prompt for use as a store key."""
+    return hashlib.sha256(prompt.strip().encode("utf-8")).hexdigest()
+
+
+def holiday_image_key(holiday_id: Optional[str], holiday_name: str) -> str:
+    """Key generated images by holiday id, or by holiday name for ad-hoc holidays."""
+    if holiday_id:
+        return str(holiday_id)
+    name_hash = hashlib.sha256((holiday_name or "").strip().lower().encode("utf-8")).hexdigest()
+    return f"name-{name_hash[:16]}"
+
+
+class ImageStoreBackend:
+    """Interface for generated image storage backends."""
+
+    def get(self, holiday_key: str, prompt_key: str) -> Optional[dict]:
+        """Return {"data": bytes, "metadata": dict} or None when not stored."""
+        raise NotImplementedError
+
+    def put(self, holiday_key: str, prompt_key: str, data: bytes, metadata: dict) -> dict:
+        """Store image bytes and return the stored metadata."""
+        raise NotImplementedError
+
+    def delete(self, holiday_key: str) -> int:
+        """Delete every reference stored for a holiday key (and the blobs left unreferenced)."""
+        raise NotImplementedError
+
+
+class MemoryImageStore(ImageStoreBackend):
+    """Process-local backend, useful for development and load tests."""
+
+    def __init__(self):
+        self._blobs = {}
+        self._refs = {}
+
+    def get(self, holiday_key: str, prompt_key: str) -> Optional[dict]:
+        metadata = self._refs.get((holiday_key, prompt_key))
+        if not metadata or metadata["sha256"] not in self._blobs:
+            return None
+        return {"data": self._blobs[metadata["sha256"]], "metadata": dict(metadata)}
+
+    def _drop_unreferenced(self, hashes: set):
+        referenced = {metadata["sha256"] for metadata in self._refs.values()}
+        for sha256 in hashes - referenced:
+            self._blobs.pop(sha256, None)
+
+    def put(self, holiday_key: str, prompt_key: str, data: bytes, metadata: dict) -> dict:
+        previous = self._refs.get((holiday_key, prompt_key))
+        self._blobs[metadata["sha256"]] = data
+        self._refs[(holiday_key, prompt_key)] = dict(metadata)
+        if previous:
+            self._drop_unreferenced({previous["sha256"]})
+        return dict(metadata)
+
+    def delete(self, holiday_key: str) -> int:
+        keys = [key for key in self._refs if key[0] == holiday_key]
+        hashes = {self._refs.pop(key)["sha256"] for key in keys}
+        self._drop_unreferenced(hashes)
+        return len(keys)
+
+
+class LocalDiskImageStore(ImageStoreBackend):
+    """Backend storing blobs under <root>/blobs and references under <root>/refs."""
+
+    def __init__(self, root: str):
+        self.root = root
+        # Keeps a blob from being removed between a put's blob and ref writes
+        self._lock = threading.Lock()
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, "blobs", sha256[:2], sha256)
+
+    def _ref_path(self, holiday_key: str, prompt_key: str) -> str:
+        return os.path.join(self.root, "refs", holiday_key, f"{prompt_key}.json")
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, holiday_key: str, prompt_key: str) -> Optional[dict]:
+        try:
+            with open(self._ref_path(holiday_key, prompt_key), "r", encoding="utf-8") as file:
+                metadata = json.load(file)
+            with open(self._blob_path(metadata["sha256"]), "rb") as file:
+                data = file.read()
+        except (FileNotFoundError, KeyError, json.JSONDecodeError):
+            return None
+        return {"data": data, "metadata": metadata}
+
+    @staticmethod
+    def _read_sha256(ref_path: str) -> Optional[str]:
+        try:
+            with open(ref_path, "r", encoding="utf-8") as file:
+                return json.load(file).get("sha256")
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _drop_unreferenced(self, hashes: set):
+        """Remove the blobs among hashes that no reference points to any more."""
+        refs_root = os.path.join(self.root, "refs")
+        for directory, _, names in os.walk(refs_root):
+            if not hashes:
+                return
+            for name in names:
+                if name.endswith(".json"):
+                    hashes.discard(self._read_sha256(os.path.join(directory, name)))
+        for sha256 in hashes:
+            try:
+                os.remove(self._blob_path(sha256))
+            except FileNotFoundError:
+                pass
+
+    def put(self, holiday_key: str, prompt_key: str, data: bytes, metadata: dict) -> dict:
+        ref_path = self._ref_path(holiday_key, prompt_key)
+        with self._lock:
+            previous = self._read_sha256(ref_path)
+            blob_path = self._blob_path(metadata["sha256"])
+            if not os.path.exists(blob_path):
+                self._atomic_write(blob_path, data)
+            self._atomic_write(ref_path, json.dumps(metadata).encode("utf-8"))
+            if previous and previous != metadata["sha256"]:
+                self._drop_unreferenced({previous})
+        return dict(metadata)
+
+    def delete(self, holiday_key: str) -> int:
+        ref_dir = os.path.join(self.root, "refs", holiday_key)
+        if not os.path.isdir(ref_dir):
+            return 0
+        removed, hashes = 0, set()
+        with self._lock:
+            for name in os.listdir(ref_dir):
+                ref_path = os.path.join(ref_dir, name)
+                hashes.add(self._read_sha256(ref_path))
+                os.remove(ref_path)
+                removed += 1
+            hashes.discard(None)
+            self._drop_unreferenced(hashes)
+        return removed
+
+
+_store = None
+
+
+def get_image_store() -> ImageStoreBackend:
+    """Get or create the configured image store backend."""
+    global _store
+    if _store is None:
+        if IMAGE_STORE_BACKEND == "memory":
+            _store = MemoryImageStore()
+        elif IMAGE_STORE_BACKEND == "local":
+            _store = LocalDiskImageStore(IMAGE_STORE_DIR)
+        else:
+            raise ValueError(f"Unknown IMAGE_STORE_BACKEND: {IMAGE_STORE_BACKEND}")
+    return _store
+
+
+async def load_stored_image(holiday_key: str, prompt: str) -> Optional[dict]:
+    """Load a stored image for a holiday and prompt without blocking the loop."""
+    return await asyncio.to_thread(get_image_store().get, holiday_key, prompt_hash(prompt))
+
+
+async def save_generated_image(
+    holiday_key: str,
+    prompt: str,
+    data: bytes,
+    mime_type: str,
+    model: str,
+) -> dict:
+    """Store raw generated image bytes with their metadata."""
+    metadata = {
+        "holiday_key": holiday_key,
+        "prompt_hash": prompt_hash(prompt),
+        "prompt": prompt,
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "mime_type": mime_type,
+        "size_bytes": len(data),
+        "model": model,
+        "created_at": datetime.now().isoformat(),
+    }
+    return await asyncio.to_thread(
+        get_image_store().put, holiday_key, metadata["prompt_hash"], data, metadata
+    )
@@ -0,0 +1,149 @@
+"""
+Job Tracker - Buffered progress reporting for distribution jobs.
+
+A distribution records one result per recipient. Results and counter
+increments are buffered and written to the jobs collection in batches
+(every JOB_PROGRESS_FLUSH_ITEMS results or JOB_PROGRESS_FLUSH_SECONDS,
+whichever comes first). Distributions also flush before waiting for a send
+slot, so status polls on any worker never miss more than a few seconds of
+progress and bursts of fast results do not cost a write each. While a job
+waits (for a send slot, its delivery window, or base image generation and
+its retries), wait() touches its document every JOB_HEARTBEAT_SECONDS so a
+long wait is not mistaken for a dead job.
+
+Each flush also stores a checkpoint (the last recipient recorded). A job
+whose process went away can be taken over with resume(), which continues
+its counters and results from what was written.
+"""
+import time
+import uuid
+import asyncio
+from datetime import datetime, timezone
+from typing import Optional
+from database import JobRepository
+from config import JOB_PROGRESS_FLUSH_ITEMS, JOB_PROGRESS_FLUSH_SECONDS, JOB_STALE_SECONDS, JOB_HEARTBEAT_SECONDS
+
+
+class JobTracker:
+    """Tracks one distribution job's progress in the jobs collection."""
+
+    def __init__(self, job_id: str, params: dict = None):
+        self.job_id = job_id
+        self.params = params or {}
+        self.processed = 0
+        self.successful = 0
+        self.failed = 0
+        self.skipped = 0
+        self._results = []
+        self._counters = {}
+        self._checkpoint = None
+        self._fields = {}
+        self._flushed_seq = 0
+        self._flushed_at = time.monotonic()
+
+    @classmethod
+    async def start(cls, kind: str, fields: dict, params: dict = None) -> "JobTracker":
+        """Create a running job of the given kind and return its tracker.
+
+        params are stored with the job and given back by resume().
+        """
+        tracker = cls(str(uuid.uuid4()), params)
+        await JobRepository.create(tracker.job_id, kind, {**fields, "params": tracker.params})
+        return tracker
+
+    @classmethod
+    async def resume(cls, job_id: str, kind: str) -> Optional["JobTracker"]:
+        """Take over an interrupted job, or None when it cannot be resumed."""
+        job = await JobRepository.claim_resume(job_id, kind, JOB_STALE_SECONDS)
+        if job is None:
+            return None
+        tracker = cls(job_id, job.get("params"))
+        tracker.processed = job.get("processed", 0)
+        tracker.successful = job.get("successful", 0)
+        tracker.failed = job.get("failed", 0)
+        tracker.skipped = job.get("skipped", 0)
+        tracker._checkpoint = job.get("checkpoint")
+        tracker._flushed_seq = await JobRepository.count_results(job_id)
+        return tracker
+
+    @property
+    def checkpoint(self):
+        """The last recipient recorded (as given to record())."""
+        return self._checkpoint
+
+    def note(self, fields: dict):
+        """Stage job fields (e.g. the current pacing) to be written with the next flush."""
+        self._fields.update(fields)
+
+    async def record(self, result: dict, checkpoint=None):
+        """Record one recipient's result.
+
+        result["skipped"] or result["success"] says which counter it counts
+        toward; checkpoint (e.g. the recipient id) is stored with the next
+        flush so a resumed job continues after it.
+        """
+        if result.get("skipped"):
+            counter = "skipped"
+        else:
+            counter = "successful" if result.get("success") else "failed"
+        self.processed += 1
+        setattr(self, counter, getattr(self, counter) + 1)
+        self._results.append(result)
+        for name in ("processed", counter):
+            self._counters[name] = self._counters.get(name, 0) + 1
+        if checkpoint is not None:
+            self._checkpoint = checkpoint
+
+        if (
+            len(self._results) >= JOB_PROGRESS_FLUSH_ITEMS
+            or time.monotonic() - self._flushed_at >= JOB_PROGRESS_FLUSH_SECONDS
+        ):
+            await self.flush()
+
+    async def flush(self):
+        """Write the buffered results and counters."""
+        if not self._results and not self._counters and not self._fields:
+            return
+        fields = dict(self._fields)
+        if self._checkpoint is not None:
+            fields["checkpoint"] = self._checkpoint
+        try:
+            await JobRepository.record_progress(
+                self.job_id, self._counters, self._results, self._flushed_seq, fields
+            )
+        except Exception as e:
+            # Keep the batch buffered and retry on the next flush rather than stopping the send loop
+            print(f"[Job {self.job_id}] Warning: could not write progress: {e}")
+            return
+        self._flushed_seq += len(self._results)
+        self._results, self._counters, self._fields = [], {}, {}
+        self._flushed_at = time.monotonic()
+
+    async def wait(self, awaitable):
+        """Flush, then await a (possibly long) wait such as a send slot or image generation, sending heartbeats meanwhile."""
+        await self.flush()
+        task = asyncio.ensure_future(awaitable)
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=JOB_HEARTBEAT_SECONDS)
+                if done:
+                    return task.result()
+                try:
+                    await JobRepository.update(self.job_id, {})
+                except Exception as e:
+                    print(f"[Job {self.job_id}] Warning: could not write heartbeat: {e}")
+        finally:
+            task.cancel()
+
+    async def update(self, fields: dict):
+        """Set job fields, flushing buffered progress first."""
+        await self.flush()
+        await JobRepository.update(self.job_id, fields)
+
+    async def fail(self, error: str):
+        """Mark the job failed with an error message."""
+        await self.update({"status": "failed", "error": error})
+
+    async def complete(self):
+        """Mark the job completed."""
+        await self.update({"status": "completed", "completed_at": datetime.now(timezone.utc)})
@@ -0,0 +1,150 @@
+"""
+Metrics - In-process counters and histograms, plus AI call instrumentation.
+
+Every AI call is recorded with its duration, model, token usage, image size,
+retry count and outcome. Histograms and counters live in this process;
+per-day usage and cost estimates are also accumulated in MongoDB so they
+survive restarts and cover every worker.
+"""
+import bisect
+from datetime import datetime
+from database import AIUsageRepository
+from config import AI_PRICING
+
+DURATION_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300)
+BYTES_BUCKETS = (100_000, 250_000, 500_000, 1_000_000, 2_000_000, 4_000_000, 8_000_000)
+TOKEN_BUCKETS = (100, 500, 1_000, 2_000, 5_000, 10_000, 50_000)
+
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum and min/max."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        """Record one observation."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float):
+        """Estimate a quantile as the upper bound of the bucket containing it."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        """Get the histogram as a JSON-serializable dict (cumulative buckets)."""
+        cumulative, running = {}, 0
+        for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            running += bucket_count
+            cumulative[str(bound)] = running
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "avg": round(self.total / self.count, 3) if self.count else None,
+            "min": round(self.min, 3) if self.min is not None else None,
+            "max": round(self.max, 3) if self.max is not None else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": cumulative,
+        }
+
+
+_histograms = {}
+_counters = {}
+
+
+def observe(name: str, labels: dict, value: float, buckets: tuple = DURATION_BUCKETS):
+    """Record a value in the histogram identified by name and labels."""
+    key = (name, tuple(sorted(labels.items())))
+    if key not in _histograms:
+        _histograms[key] = Histogram(buckets)
+    _histograms[key].observe(value)
+
+
+def increment(name: str, labels: dict, value: float = 1):
+    """Increment the counter identified by name and labels."""
+    key = (name, tuple(sorted(labels.items())))
+    _counters[key] = _counters.get(key, 0) + value
+
+
+def get_metrics_snapshot() -> dict:
+    """Get every histogram and counter recorded in this process."""
+    return {
+        "histograms": [
+            {"name": name, "labels": dict(labels), **histogram.snapshot()}
+            for (name, labels), histogram in sorted(_histograms.items())
+        ],
+        "counters": [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(_counters.items())
+        ],
+    }
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """Estimate the USD cost of a call from the AI_PRICING table."""
+    pricing = AI_PRICING.get(model)
+    if not pricing:
+        return 0.0
+    return (
+        input_tokens * pricing["input_per_million"]
+        + output_tokens * pricing["output_per_million"]
+    ) / 1_000_000
+
+
+async def record_ai_call(
+    kind: str,
+    model: str,
+    duration_seconds: float,
+    outcome: str,
+    retries: int = 0,
+    input_tokens: int = 0,
+    output_tokens: int = 0,
+    image_bytes: int = 0,
+):
+    """Record one AI call in the histograms, counters and the daily usage totals."""
+    labels = {"kind": kind, "model": model}
+    observe("ai_call_duration_seconds", {**labels, "outcome": outcome}, duration_seconds)
+    increment("ai_calls_total", {**labels, "outcome": outcome})
+    increment("ai_retries_total", labels, retries)
+    increment("ai_input_tokens_total", labels, input_tokens)
+    increment("ai_output_tokens_total", labels, output_tokens)
+    if input_tokens or output_tokens:
+        observe("ai_output_tokens", labels, output_tokens, TOKEN_BUCKETS)
+    if image_bytes:
+        observe("ai_image_bytes", labels, image_bytes, BYTES_BUCKETS)
+
+    cost = estimate_cost(model, input_tokens, output_tokens) if outcome == "success" else 0.0
+    try:
+        await AIUsageRepository.record(
+            datetime.now().strftime("%d-%m-%Y"),
+            model,
+            {
+                "calls": 1,
+                "failures": 0 if outcome == "success" else 1,
+                "retries": retries,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "image_bytes": image_bytes,
+                "duration_seconds": duration_seconds,
+                "cost_usd": cost,
+            },
+        )
+    except Exception as e:
+        print(f"[Metrics] Failed to record AI usage: {e}")
@@ -0,0 +1,172 @@
+"""
+Overlay Cache - Decoded, ready-to-composite subscriber overlays.
+
+Keeps RGBA overlays already resized to IMAGE_SIZE, together with their alpha
+coverage analysis (see overlay_coverage), in a byte-bounded LRU keyed by
+subscriber id and overlay content hash, so daily distributions to an
+unchanged roster skip the base64/PNG decode, convert, resize and analysis.
+Entries for a subscriber are dropped when the subscriber is updated.
+"""
+import io
+import base64
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Union
+from PIL import Image
+from database import SubscriberRepository
+from .overlay_coverage import PreparedOverlay, get_composite_stats
+from config import IMAGE_SIZE, OVERLAY_CACHE_MAX_MB
+
+
+def overlay_content_hash(overlay: Union[str, bytes]) -> str:
+    """Hash stored overlay content (base64 string or raw bytes)."""
+    if isinstance(overlay, str):
+        overlay = overlay.encode("ascii")
+    return hashlib.sha256(overlay).hexdigest()
+
+
+def decode_overlay(overlay: Union[str, bytes]) -> Image.Image:
+    """Decode stored overlay content into an RGBA image at IMAGE_SIZE."""
+    overlay_bytes = base64.b64decode(overlay) if isinstance(overlay, str) else overlay
+    image = Image.open(io.BytesIO(overlay_bytes)).convert("RGBA")
+    if image.size != (IMAGE_SIZE, IMAGE_SIZE):
+        image = image.resize((IMAGE_SIZE, IMAGE_SIZE), Image.Resampling.LANCZOS)
+    return image
+
+
+class OverlayCache:
+    """Byte-bounded LRU of decoded overlays."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(overlay: PreparedOverlay) -> int:
+        """Decoded size of an overlay (image plus its cropped dirty regions) in bytes."""
+        image = overlay.image
+        region_pixels = overlay.dirty_pixels if overlay.regions else 0
+        return (image.width * image.height + region_pixels) * len(image.getbands())
+
+    def get(self, subscriber_id: str, content_hash: str) -> Optional[PreparedOverlay]:
+        """Get a cached overlay, marking it most recently used."""
+        key = (subscriber_id, content_hash)
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, subscriber_id: str, content_hash: str, image: PreparedOverlay):
+        """Add an overlay, evicting least recently used entries over the budget."""
+        size = self._entry_size(image)
+        if size > self.max_bytes:
+            return
+        key = (subscriber_id, content_hash)
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entry_size(self._entries.pop(key))
+            self._entries[key] = image
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= self._entry_size(evicted)
+                self.evictions += 1
+
+    def invalidate(self, subscriber_id: str) -> int:
+        """Drop every cached overlay of a subscriber."""
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == subscriber_id]
+            for key in keys:
+                self.bytes -= self._entry_size(self._entries.pop(key))
+            return len(keys)
+
+    def stats(self) -> dict:
+        """Get size, budget and hit rate."""
+        lookups = self.hits + self.misses
+        with self._lock:
+            kinds = {}
+            for overlay in self._entries.values():
+                kinds[overlay.kind] = kinds.get(overlay.kind, 0) + 1
+        return {
+            "entries": len(self._entries),
+            "entries_by_kind": kinds,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+overlay_cache = OverlayCache(OVERLAY_CACHE_MAX_MB * 1024 * 1024)
+
+
+def get_subscriber_overlay(
+    subscriber_id: str,
+    overlay: Union[str, bytes],
+    content_hash: str = None,
+) -> PreparedOverlay:
+    """Get a subscriber's overlay ready to composite, decoding it on a cache miss.
+
+    The returned image is shared; callers must not modify it in place.
+    """
+    content_hash = content_hash or overlay_content_hash(overlay)
+    image = overlay_cache.get(subscriber_id, content_hash)
+    if image is None:
+        image = PreparedOverlay(decode_overlay(overlay))
+        overlay_cache.put(subscriber_id, content_hash, image)
+    return image
+
+
+async def load_subscriber_overlay(subscriber_id: str, subscriber: dict) -> Optional[PreparedOverlay]:
+    """Get a subscriber's overlay ready to composite, or None when it cannot be loaded.
+
+    The stored overlay bytes are only fetched from MongoDB on a cache miss.
+    Subscribers not yet migrated fall back to their legacy base64 overlay.
+    """
+    subscriber_id = str(subscriber_id)
+    try:
+        content_hash = subscriber.get("overlay_hash")
+        if not content_hash:
+            return get_subscriber_overlay(subscriber_id, subscriber.get("overlay", ""))
+
+        image = overlay_cache.get(subscriber_id, content_hash)
+        if image is None:
+            overlay_bytes = await SubscriberRepository.get_overlay(content_hash)
+            image = await asyncio.to_thread(lambda: PreparedOverlay(decode_overlay(overlay_bytes)))
+            overlay_cache.put(subscriber_id, content_hash, image)
+        return image
+    except Exception as e:
+        print(f"Warning: Could not load overlay for subscriber {subscriber_id}: {e}")
+        return None
+
+
+async def load_subscriber_overlay_bytes(subscriber_id: str, subscriber: dict) -> Optional[bytes]:
+    """Get a subscriber's stored overlay PNG bytes, or None when they cannot be loaded."""
+    try:
+        return await SubscriberRepository.get_overlay_bytes(subscriber)
+    except Exception as e:
+        print(f"Warning: Could not load overlay for subscriber {subscriber_id}: {e}")
+        return None
+
+
+def invalidate_subscriber_overlay(subscriber_id: str) -> int:
+    """Drop a subscriber's cached overlays (called when the subscriber changes)."""
+    return overlay_cache.invalidate(str(subscriber_id))
+
+
+def get_overlay_cache_stats() -> dict:
+    """Get the overlay cache statistics and how overlays were composited in this process."""
+    return {**overlay_cache.stats(), "composites": get_composite_stats()}
@@ -0,0 +1,149 @@
+"""
+Overlay Coverage - Alpha coverage analysis and dirty-rectangle compositing.
+
+Subscriber overlays are mostly transparent (frames, logos, footers). Each
+overlay is analyzed once when it is decoded into the overlay cache: its alpha
+channel is scanned in OVERLAY_TILE_SIZE tiles and the tiles holding any
+non-transparent pixel are merged into a few dirty rectangles. Compositing
+then blends only those rectangles onto a copy of the base, which gives the
+same pixels as a full Image.alpha_composite since fully transparent source
+pixels leave the destination untouched.
+
+Fully transparent overlays return the base as is and fully opaque overlays
+replace it, without blending at all. Per-rectangle blending only beats a
+plain alpha_composite when the dirty area is small (it pays for a copy of
+the base plus a crop and paste per rectangle), so overlays dirtier than
+OVERLAY_DIRTY_MAX_FRACTION are blended in one alpha_composite.
+
+The analysis costs more than one composite, so it only pays off for
+overlays that stay prepared in the overlay cache; one-off composites use
+Image.alpha_composite directly.
+"""
+from typing import List, Tuple
+import numpy as np
+from PIL import Image
+from .metrics import increment
+from config import OVERLAY_DIRTY_MAX_FRACTION
+
+OVERLAY_TILE_SIZE = 64
+
+_composite_stats = {
+    "composites": 0,
+    "transparent": 0,
+    "opaque": 0,
+    "partial": 0,
+    "pixels_total": 0,
+    "pixels_blended": 0,
+}
+
+
+def _dirty_rects(visible: np.ndarray, tile: int) -> List[Tuple[int, int, int, int]]:
+    """Merge the tiles holding visible pixels into (left, top, right, bottom) rectangles."""
+    height, width = visible.shape
+    row_starts = np.arange(0, height, tile)
+    col_starts = np.arange(0, width, tile)
+    tiles = np.logical_or.reduceat(np.logical_or.reduceat(visible, row_starts, axis=0), col_starts, axis=1)
+
+    rects = []
+    open_rects = {}  # (first tile column, end tile column) -> index in rects, for the previous tile row
+    for tile_row, row in enumerate(tiles):
+        top, bottom = tile_row * tile, min(height, (tile_row + 1) * tile)
+        runs, col = [], 0
+        while col < len(row):
+            if row[col]:
+                start = col
+                while col < len(row) and row[col]:
+                    col += 1
+                runs.append((start, col))
+            else:
+                col += 1
+
+        next_open = {}
+        for run in runs:
+            if run in open_rects:
+                # Same columns as the rectangle right above: extend it downwards
+                index = open_rects[run]
+                left, top_edge, right, _ = rects[index]
+                rects[index] = (left, top_edge, right, bottom)
+            else:
+                index = len(rects)
+                rects.append((run[0] * tile, top, min(width, run[1] * tile), bottom))
+            next_open[run] = index
+        open_rects = next_open
+    return rects
+
+
+class PreparedOverlay:
+    """A decoded RGBA overlay with its alpha coverage analysis."""
+
+    def __init__(self, image: Image.Image, tile: int = OVERLAY_TILE_SIZE):
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+        self.image = image
+        alpha = np.asarray(image.getchannel("A"))
+        visible = alpha > 0
+        self.pixels = alpha.size
+        self.visible_pixels = int(np.count_nonzero(visible))
+        self.opaque_pixels = int(np.count_nonzero(alpha == 255))
+
+        if self.visible_pixels == 0:
+            self.kind = "transparent"
+            self.rects = []
+        elif self.opaque_pixels == self.pixels:
+            self.kind = "opaque"
+            self.rects = [(0, 0, image.width, image.height)]
+        else:
+            self.kind = "partial"
+            self.rects = _dirty_rects(visible, tile)
+        self.dirty_pixels = sum((right - left) * (bottom - top) for left, top, right, bottom in self.rects)
+        # Overlay pixels of each dirty rectangle, cropped once (only when blending them is worth it)
+        self.blend_regions = self.kind == "partial" and self.dirty_pixels <= OVERLAY_DIRTY_MAX_FRACTION * self.pixels
+        self.regions = [(rect, image.crop(rect)) for rect in self.rects] if self.blend_regions else []
+
+    @property
+    def size(self) -> tuple:
+        """Overlay dimensions."""
+        return self.image.size
+
+    def coverage(self) -> dict:
+        """Get the coverage statistics of the overlay."""
+        return {
+            "kind": self.kind,
+            "size": list(self.image.size),
+            "visible_fraction": round(self.visible_pixels / self.pixels, 4),
+            "opaque_fraction": round(self.opaque_pixels / self.pixels, 4),
+            "dirty_fraction": round(self.dirty_pixels / self.pixels, 4),
+            "bbox": list(self.image.getchannel("A").getbbox() or ()),
+            "dirty_rects": [list(rect) for rect in self.rects],
+        }
+
+    def composite_onto(self, base_image: Image.Image) -> Image.Image:
+        """Composite onto an RGBA base of the same size, blending only the dirty rectangles."""
+        _composite_stats["composites"] += 1
+        _composite_stats[self.kind] += 1
+        _composite_stats["pixels_total"] += self.pixels
+        if self.kind == "partial":
+            _composite_stats["pixels_blended"] += self.dirty_pixels if self.blend_regions else self.pixels
+        increment("overlay_composites_total", {"kind": self.kind})
+
+        if self.kind == "transparent":
+            return base_image.copy()
+        if self.kind == "opaque":
+            # Opaque source pixels replace the destination exactly
+            return self.image.copy()
+
+        if not self.blend_regions:
+            return Image.alpha_composite(base_image, self.image)
+
+        result = base_image.copy()
+        for rect, region in self.regions:
+            result.paste(Image.alpha_composite(result.crop(rect), region), rect[:2])
+        return result
+
+
+def get_composite_stats() -> dict:
+    """Get how overlays were composited (fast paths and fraction of pixels blended)."""
+    stats = dict(_composite_stats)
+    total = stats["pixels_total"]
+    stats["blended_fraction"] = round(stats["pixels_blended"] / total, 4) if total else None
+    return stats
@@ -0,0 +1,145 @@
+"""
+Pacing - Delivery windows and finish-time projection for distributions.
+
+A distribution can be given a delivery window ("07:00" to "10:00", local
+time). The job waits for the window to open, then spreads the recipients it
+has left evenly over what is left of the window, recomputing the spacing
+before every send so it catches up after delays or slows down after skips.
+The spacing stays within safe bounds: never below
+SEND_MIN_SAFE_SPACING_SECONDS (or what SEND_HOURLY_CAP allows) and never
+above DEADLINE_MAX_SPACING_SECONDS.
+
+A window too short for the audience at the safe spacing is still accepted,
+with a warning and the projected finish time. Jobs without a window are
+projected at the send scheduler's average spacing.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+from config import (
+    SEND_MIN_SAFE_SPACING_SECONDS,
+    SEND_HOURLY_CAP,
+    SEND_DAILY_CAP,
+    DEADLINE_MAX_SPACING_SECONDS,
+)
+from .send_scheduler import get_send_scheduler
+
+
+def _parse_time(value: str, now: datetime) -> datetime:
+    try:
+        parsed = datetime.strptime(value.strip(), "%H:%M")
+    except ValueError:
+        raise ValueError(f"Invalid time '{value}', expected HH:MM")
+    return now.replace(hour=parsed.hour, minute=parsed.minute, second=0, microsecond=0)
+
+
+def parse_window(start: Optional[str], end: Optional[str], now: datetime = None) -> Optional[dict]:
+    """Parse a delivery window of local HH:MM times into {"start", "end"} ISO datetimes.
+
+    The window is the next occurrence of the times that has not ended yet:
+    - an end at or before the start spans midnight (22:00 to 02:00), and at
+      01:00 that is the window that opened yesterday at 22:00;
+    - a window that is already over today (09:00 to 17:00 at 18:00) is
+      tomorrow's;
+    - without a start the window opens now and ends at the next end time.
+    Returns None without an end, and raises ValueError for malformed times.
+    """
+    if not end:
+        if start:
+            raise ValueError("A delivery window needs an end time")
+        return None
+    now = now or datetime.now()
+    if not start:
+        window_end = _parse_time(end, now)
+        if window_end <= now:
+            window_end += timedelta(days=1)
+        return {"start": now.isoformat(), "end": window_end.isoformat()}
+
+    window_start = _parse_time(start, now)
+    window_end = _parse_time(end, now)
+    if window_end <= window_start:
+        # Spans midnight: start with the occurrence that opened yesterday
+        window_start -= timedelta(days=1)
+    while window_end <= now:
+        window_start += timedelta(days=1)
+        window_end += timedelta(days=1)
+    return {"start": window_start.isoformat(), "end": window_end.isoformat()}
+
+
+def min_safe_spacing() -> float:
+    """The closest spacing the sender's budget allows over a sustained run."""
+    spacing = SEND_MIN_SAFE_SPACING_SECONDS
+    if SEND_HOURLY_CAP:
+        spacing = max(spacing, 3600 / SEND_HOURLY_CAP)
+    return spacing
+
+
+def seconds_until_open(window: dict, now: datetime = None) -> float:
+    """Seconds until the window opens (0 once it is open)."""
+    now = now or datetime.now()
+    return max(0.0, (datetime.fromisoformat(window["start"]) - now).total_seconds())
+
+
+def window_spacing(window: dict, gaps: int, now: datetime = None) -> float:
+    """Spacing that fits the given number of gaps between sends into the rest of the window, within safe bounds."""
+    now = now or datetime.now()
+    opens_at = max(now, datetime.fromisoformat(window["start"]))
+    available = (datetime.fromisoformat(window["end"]) - opens_at).total_seconds()
+    return min(max(available / max(1, gaps), min_safe_spacing()), DEADLINE_MAX_SPACING_SECONDS)
+
+
+def plan_window(window: dict, recipients: int, now: datetime = None) -> dict:
+    """Plan a distribution over a window: its spacing, projected finish and feasibility."""
+    now = now or datetime.now()
+    # The first send goes out when the window opens, the rest are spaced over the remainder
+    spacing = window_spacing(window, recipients - 1, now)
+    opens_at = max(now, datetime.fromisoformat(window["start"]))
+    finish = opens_at + timedelta(seconds=spacing * max(0, recipients - 1))
+    window_end = datetime.fromisoformat(window["end"])
+    plan = {
+        "window_start": window["start"],
+        "window_end": window["end"],
+        "spacing_seconds": round(spacing, 1),
+        "projected_finish_at": finish.isoformat(),
+        "feasible": finish <= window_end,
+    }
+    if SEND_DAILY_CAP and recipients > SEND_DAILY_CAP and window_end - opens_at <= timedelta(days=1):
+        plan["feasible"] = False
+        plan["warning"] = (
+            f"{recipients} recipients exceed the sender's daily cap of {SEND_DAILY_CAP}; "
+            f"the rest will go out after the window"
+        )
+    elif not plan["feasible"]:
+        needed = timedelta(seconds=int(min_safe_spacing() * max(0, recipients - 1)))
+        plan["warning"] = (
+            f"{recipients} recipients need at least {needed} at the safe spacing of "
+            f"{min_safe_spacing():.0f}s; the window ends at {window_end.strftime('%H:%M')}, "
+            f"projected finish is {finish.strftime('%Y-%m-%d %H:%M')}"
+        )
+    return plan
+
+
+def default_plan() -> dict:
+    """Pacing of a distribution without a window (the send scheduler's default spacing)."""
+    return {"spacing_seconds": round(get_send_scheduler().average_spacing, 1)}
+
+
+def project_finish(job: dict, now: datetime = None) -> dict:
+    """Project the remaining time and finish of a running job from its progress and pacing."""
+    now = now or datetime.now()
+    pacing = job.get("pacing") or default_plan()
+    remaining = max(0, job.get("total_subscribers", 0) - job.get("processed", 0))
+    starts_in = seconds_until_open({"start": pacing["window_start"]}, now) if pacing.get("window_start") else 0.0
+    # Before the first send nothing needs to be waited out; afterwards every send waits its spacing
+    gaps = remaining - 1 if remaining and (starts_in or not job.get("processed")) else remaining
+    eta = starts_in + pacing["spacing_seconds"] * gaps
+    finish = now + timedelta(seconds=eta)
+    projection = {
+        "remaining": remaining,
+        "eta_seconds": int(eta),
+        "projected_finish_at": finish.isoformat(),
+    }
+    if pacing.get("window_end"):
+        projection["on_schedule"] = finish <= datetime.fromisoformat(pacing["window_end"])
+        if not projection["on_schedule"]:
+            projection["warning"] = "Projected to finish after the delivery window ends"
+    return projection
@@ -0,0 +1,163 @@
+"""
+Pre-generation Service - Produce holiday assets ahead of the send window.
+
+Walks the holidays of the next PREGENERATION_LOOKAHEAD_DAYS days and
+generates the prompt, caption and base image for each one, so that a
+distribution starts from stored assets instead of waiting on Gemini.
+Readiness is recorded on the holiday document under "assets".
+
+The daily image budget is a counter in MongoDB shared by every worker, and
+the scheduled loop only runs on the worker holding the "pregeneration"
+lease, renewed before each run and expiring PREGENERATION_LEASE_SECONDS
+after it, so another worker takes over when the holder goes away.
+"""
+import os
+import uuid
+import socket
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+from database import HolidayRepository, PregenerationRepository
+from config import (
+    PREGENERATION_LOOKAHEAD_DAYS,
+    PREGENERATION_CONCURRENCY,
+    PREGENERATION_DAILY_BUDGET,
+    PREGENERATION_INTERVAL_SECONDS,
+    PREGENERATION_LEASE_SECONDS,
+)
+from .ai_service import generate_structured_output, get_base_image
+from .image_store import load_stored_image, holiday_image_key
+
+LEASE_NAME = "pregeneration"
+# Identifies this worker as the lease holder
+_owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_last_run = None
+_task = None
+
+
+def _today() -> str:
+    """Today's date in DD-MM-YYYY format."""
+    return datetime.now().strftime("%d-%m-%Y")
+
+
+def _lookahead_dates(days: int) -> list:
+    """Dates (DD-MM-YYYY) from today through today + days."""
+    now = datetime.now()
+    return [(now + timedelta(days=offset)).strftime("%d-%m-%Y") for offset in range(days + 1)]
+
+
+async def _reserve_budget() -> bool:
+    """Reserve one image generation from today's budget (shared by all workers)."""
+    return await PregenerationRepository.reserve_budget(_today(), PREGENERATION_DAILY_BUDGET)
+
+
+async def pregenerate_holiday(holiday: dict) -> dict:
+    """Generate (or verify) the stored assets of one holiday and record readiness."""
+    holiday_id = holiday["id"]
+    name = holiday.get("prompt")
+    description = holiday.get("description")
+
+    try:
+        structured_output = await generate_structured_output(name, description)
+        image_prompt = structured_output.get("prompt", "")
+        if not image_prompt:
+            raise ValueError("Failed to generate image prompt")
+
+        image_key = holiday_image_key(holiday_id, name)
+        stored = await load_stored_image(image_key, image_prompt)
+        if stored is None:
+            if not await _reserve_budget():
+                assets = {"status": "deferred", "reason": "daily budget exhausted"}
+                await HolidayRepository.set_assets(holiday_id, assets)
+                return {"id": holiday_id, "date": holiday.get("date"), **assets}
+            await HolidayRepository.set_assets(holiday_id, {"status": "generating"})
+            base = await get_base_image(image_key, image_prompt)
+            metadata = base["metadata"]
+        else:
+            metadata = stored["metadata"]
+
+        assets = {
+            "status": "ready",
+            "prompt_hash": metadata.get("prompt_hash"),
+            "image_sha256": metadata.get("sha256"),
+            "caption": structured_output.get("caption", ""),
+            "ready_at": datetime.now().isoformat(),
+        }
+    except Exception as e:
+        print(f"[Pregeneration] Failed for {name} ({holiday.get('date')}): {e}")
+        assets = {"status": "failed", "error": str(e), "failed_at": datetime.now().isoformat()}
+
+    await HolidayRepository.set_assets(holiday_id, assets)
+    return {"id": holiday_id, "date": holiday.get("date"), **assets}
+
+
+async def run_pregeneration(days: Optional[int] = None) -> dict:
+    """Pre-generate assets for every holiday in the look-ahead window."""
+    global _last_run
+    days = PREGENERATION_LOOKAHEAD_DAYS if days is None else days
+    holidays = await HolidayRepository.get_by_dates(_lookahead_dates(days))
+    print(f"[Pregeneration] {len(holidays)} holidays in the next {days} days")
+
+    semaphore = asyncio.Semaphore(PREGENERATION_CONCURRENCY)
+
+    async def _run_one(holiday: dict) -> dict:
+        async with semaphore:
+            return await pregenerate_holiday(holiday)
+
+    results = await asyncio.gather(*[_run_one(holiday) for holiday in holidays])
+    _last_run = {
+        "finished_at": datetime.now().isoformat(),
+        "lookahead_days": days,
+        "results": results,
+    }
+    return _last_run
+
+
+async def get_pregeneration_status() -> dict:
+    """Get the scheduler state, today's budget usage and the last run summary."""
+    lease = await PregenerationRepository.get_lease(LEASE_NAME)
+    return {
+        "running": _task is not None and not _task.done(),
+        "leader": lease.get("owner") if lease else None,
+        "is_leader": bool(lease) and lease.get("owner") == _owner,
+        "lookahead_days": PREGENERATION_LOOKAHEAD_DAYS,
+        "concurrency": PREGENERATION_CONCURRENCY,
+        "daily_budget": PREGENERATION_DAILY_BUDGET,
+        "budget_spent_today": await PregenerationRepository.get_budget_spent(_today()),
+        "interval_seconds": PREGENERATION_INTERVAL_SECONDS,
+        "last_run": _last_run,
+    }
+
+
+async def _pregeneration_loop():
+    """Run pre-generation every PREGENERATION_INTERVAL_SECONDS on the worker holding the lease."""
+    while True:
+        try:
+            if await PregenerationRepository.acquire_lease(LEASE_NAME, _owner, PREGENERATION_LEASE_SECONDS):
+                await run_pregeneration()
+        except Exception as e:
+            print(f"[Pregeneration] Run failed: {e}")
+        await asyncio.sleep(PREGENERATION_INTERVAL_SECONDS)
+
+
+def start_pregeneration():
+    """Start the background pre-generation scheduler."""
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_pregeneration_loop())
+
+
+async def stop_pregeneration():
+    """Stop the background pre-generation scheduler."""
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+        try:
+            await PregenerationRepository.release_lease(LEASE_NAME, _owner)
+        except Exception as e:
+            print(f"[Pregeneration] Failed to release the lease: {e}")
@@ -0,0 +1,209 @@
+"""
+Rate Limiter - Per-model token buckets and adaptive retry for Gemini calls.
+
+Each model gets a token bucket refilled at its per-minute quota. Callers
+queue on the bucket in FIFO order; once the queue is full new callers are
+rejected with 503 so backpressure reaches the client instead of piling up
+requests. Retryable failures (429/5xx/timeouts) are retried with jittered
+exponential backoff, honoring the server's Retry-After / retryDelay hint
+(capped at AI_RETRY_MAX_SECONDS), which also pauses the whole bucket so
+other callers back off too.
+"""
+import re
+import time
+import contextlib
+import random
+import asyncio
+from typing import Optional
+import httpx
+from fastapi import HTTPException
+from google.genai import errors as genai_errors
+from .ai_backends import TransientAIError
+from config import (
+    GEMINI_TEXT_MODEL,
+    GEMINI_IMAGE_MODEL,
+    GEMINI_TEXT_RPM,
+    GEMINI_IMAGE_RPM,
+    AI_RATE_LIMIT_MAX_WAITERS,
+    AI_MAX_RETRIES,
+    AI_RETRY_BASE_SECONDS,
+    AI_RETRY_MAX_SECONDS,
+)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Async token bucket with a bounded FIFO wait queue."""
+
+    def __init__(self, name: str, rate_per_minute: int, max_waiters: int):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, rate_per_minute)
+        self.max_waiters = max_waiters
+        self.tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = None
+        self.waiters = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.throttled = 0
+
+    def _refill(self):
+        """Add the tokens accrued since the last refill."""
+        now = time.monotonic()
+        if now > self._updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+
+    async def acquire(self):
+        """Wait for a token, or raise 503 when the wait queue is full."""
+        if self.waiters >= self.max_waiters:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail=f"Too many queued requests for {self.name}, try again later",
+                headers={"Retry-After": str(max(1, int(1 / self.rate)))},
+            )
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        self.waiters += 1
+        try:
+            # asyncio.Lock wakes waiters in FIFO order
+            async with self._lock:
+                while True:
+                    pause = self._paused_until - time.monotonic()
+                    if pause > 0:
+                        self.throttled += 1
+                        await asyncio.sleep(pause)
+                        continue
+                    self._refill()
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.acquired += 1
+                        return
+                    self.throttled += 1
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+        finally:
+            self.waiters -= 1
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for the given number of seconds."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # Let a single probe through when the pause ends rather than a burst
+        self._refill()
+        self.tokens = min(self.tokens, 1.0)
+        self._updated_at = self._paused_until
+
+    def stats(self) -> dict:
+        """Get the bucket's current state and counters."""
+        self._refill()
+        return {
+            "rate_per_minute": round(self.rate * 60),
+            "tokens": round(self.tokens, 2),
+            "waiters": self.waiters,
+            "max_waiters": self.max_waiters,
+            "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 1),
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "rejected": self.rejected,
+        }
+
+
+_buckets = {
+    GEMINI_TEXT_MODEL: TokenBucket(GEMINI_TEXT_MODEL, GEMINI_TEXT_RPM, AI_RATE_LIMIT_MAX_WAITERS),
+    GEMINI_IMAGE_MODEL: TokenBucket(GEMINI_IMAGE_MODEL, GEMINI_IMAGE_RPM, AI_RATE_LIMIT_MAX_WAITERS),
+}
+
+
+def get_bucket(model: str) -> TokenBucket:
+    """Get the token bucket for a model (created with the text quota if unknown)."""
+    if model not in _buckets:
+        _buckets[model] = TokenBucket(model, GEMINI_TEXT_RPM, AI_RATE_LIMIT_MAX_WAITERS)
+    return _buckets[model]
+
+
+def get_rate_limit_stats() -> dict:
+    """Get the state of every model's token bucket."""
+    return {model: bucket.stats() for model, bucket in _buckets.items()}
+
+
+def _parse_seconds(value) -> Optional[float]:
+    """Parse a Retry-After header or a "17s" / "1.5s" retryDelay value."""
+    if value is None:
+        return None
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*s?\s*$", str(value))
+    return float(match.group(1)) if match else None
+
+
+def retry_after_seconds(exc: Exception) -> Optional[float]:
+    """Extract the server's suggested retry delay from a Gemini error, if any."""
+    if isinstance(exc, TransientAIError):
+        return exc.retry_after
+
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        delay = _parse_seconds(headers.get("retry-after"))
+        if delay is not None:
+            return delay
+
+    details = getattr(exc, "details", None)
+    if isinstance(details, dict):
+        for detail in details.get("error", {}).get("details", []) or []:
+            if isinstance(detail, dict) and "retryDelay" in detail:
+                return _parse_seconds(detail["retryDelay"])
+    return None
+
+
+def is_retryable(exc: Exception) -> bool:
+    """Whether a failed Gemini call is worth retrying."""
+    if isinstance(exc, TransientAIError):
+        return True
+    if isinstance(exc, genai_errors.APIError):
+        return exc.code in RETRYABLE_STATUS_CODES
+    return isinstance(exc, (asyncio.TimeoutError, httpx.TimeoutException, httpx.TransportError))
+
+
+def backoff_seconds(attempt: int) -> float:
+    """Exponential backoff with equal jitter for the given retry attempt (0-based)."""
+    ceiling = min(AI_RETRY_MAX_SECONDS, AI_RETRY_BASE_SECONDS * (2 ** attempt))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+async def call_with_retry(
+    model: str, timeout: float, fn, *args, slots: Optional[asyncio.Semaphore] = None, **kwargs
+):
+    """Call a Gemini coroutine function under the model's rate limit with retries.
+
+    Each attempt first takes a rate limit token (queueing on, or rejected
+    by, the model's bucket), then one of the in-flight slots (if given),
+    which is held only around the call itself. A backlog for one model thus
+    never holds slots another model's callers could use, and only the call
+    runs under the timeout, so time spent queueing never counts against it.
+    """
+    bucket = get_bucket(model)
+    for attempt in range(AI_MAX_RETRIES + 1):
+        try:
+            await bucket.acquire()
+            async with (slots or contextlib.nullcontext()):
+                return await asyncio.wait_for(fn(*args, **kwargs), timeout=timeout)
+        except Exception as e:
+            if attempt >= AI_MAX_RETRIES or not is_retryable(e):
+                raise
+            retry_after = retry_after_seconds(e)
+            if retry_after is not None:
+                # Never let a server hint stall the bucket longer than our own backoff ceiling
+                retry_after = min(retry_after, AI_RETRY_MAX_SECONDS)
+                bucket.pause(retry_after)
+                delay = retry_after
+            else:
+                delay = backoff_seconds(attempt)
+            print(
+                f"[AI Retry] {model} attempt {attempt + 1} failed ({type(e).__name__}: {e}); "
+                f"retrying in {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
@@ -0,0 +1,291 @@
+"""
+Render Engine - Multi-core compositing and encoding for distributions.
+
+Subscriber overlays are composited onto the day's base image and encoded in
+a pool of RENDER_WORKERS processes, so fan-out to thousands of subscribers
+scales across cores and never blocks the event loop. The base image is put
+in shared memory once per distribution and copied into each worker on first
+use; tasks only carry the shared memory name plus a batch of overlay PNGs
+(RENDER_BATCH_SIZE per task) and return the encoded images ready to send.
+
+Each worker keeps the overlays it has decoded and analyzed (see
+overlay_coverage) in its own LRU keyed by content hash, bounded by
+RENDER_OVERLAY_CACHE_MAX_MB. An overlay is prepared once per worker, then
+reused for every subscriber sharing it and by later distributions, since
+the pool outlives them.
+
+With RENDER_WORKERS=0 batches are rendered in a thread instead.
+"""
+import time
+import asyncio
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, List, Optional, Union
+from PIL import Image
+from .image_service import overlay_subscriber_image, encode_image, base_image_bytes
+from .overlay_cache import OverlayCache, decode_overlay, overlay_content_hash
+from .overlay_coverage import PreparedOverlay
+from .metrics import observe, increment
+from config import RENDER_WORKERS, RENDER_BATCH_SIZE, RENDER_OVERLAY_CACHE_MAX_MB
+
+# Base images kept per worker process (one per concurrent distribution)
+_WORKER_BASE_LIMIT = 4
+_worker_bases = OrderedDict()
+# Prepared overlays of this process (a render worker, or the app in thread mode)
+_worker_overlays = OverlayCache(RENDER_OVERLAY_CACHE_MAX_MB * 1024 * 1024)
+
+
+class SharedBase:
+    """A base image published in shared memory for the render workers."""
+
+    def __init__(self, image: Image.Image):
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+        data = image.tobytes()
+        self.size = image.size
+        self._shm = shared_memory.SharedMemory(create=True, size=len(data))
+        self._shm.buf[:len(data)] = data
+        self.name = self._shm.name
+
+    def close(self):
+        """Release the shared memory (workers keep their own copy)."""
+        self._shm.close()
+        self._shm.unlink()
+
+
+def _attach_base(name: str, size: tuple) -> Image.Image:
+    """Get a shared base image in this worker, copying it out of shared memory once."""
+    image = _worker_bases.get(name)
+    if image is not None:
+        _worker_bases.move_to_end(name)
+        return image
+
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        image = Image.frombytes("RGBA", size, bytes(shm.buf[: size[0] * size[1] * 4]))
+    finally:
+        shm.close()
+    _worker_bases[name] = image
+    while len(_worker_bases) > _WORKER_BASE_LIMIT:
+        _worker_bases.popitem(last=False)
+    return image
+
+
+def _prepared_overlay(overlay_bytes: bytes) -> PreparedOverlay:
+    """Get an overlay decoded and analyzed, preparing it only on a cache miss."""
+    content_hash = overlay_content_hash(overlay_bytes)
+    overlay = _worker_overlays.get("", content_hash)
+    if overlay is None:
+        overlay = PreparedOverlay(decode_overlay(overlay_bytes))
+        _worker_overlays.put("", content_hash, overlay)
+    return overlay
+
+
+def _render_overlays(
+    base_image: Image.Image, overlays: List[Optional[bytes]], profile: str = None
+) -> List[tuple]:
+    """Composite and encode each overlay; returns ("ok", image bytes) or ("error", message) per item."""
+    results = []
+    for overlay_bytes in overlays:
+        try:
+            overlay = _prepared_overlay(overlay_bytes) if overlay_bytes else None
+            results.append(("ok", encode_image(overlay_subscriber_image(base_image, overlay), profile)))
+        except Exception as e:
+            results.append(("error", f"{type(e).__name__}: {e}"))
+    return results
+
+
+def _render_batch(
+    base_name: str, base_size: tuple, overlays: List[Optional[bytes]], profile: str = None
+) -> List[tuple]:
+    """Worker entry point: render a batch of overlays on a shared base image."""
+    return _render_overlays(_attach_base(base_name, base_size), overlays, profile)
+
+
+async def _chunked(items: Union[Iterable, AsyncIterable], size: int) -> AsyncIterator[list]:
+    """Group a sync or async iterable into lists of up to size items, consuming it lazily."""
+    chunk = []
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    else:
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+class RenderEngine:
+    """Process pool rendering batches of subscriber images on a shared base."""
+
+    def __init__(self, workers: int = RENDER_WORKERS, batch_size: int = RENDER_BATCH_SIZE):
+        self.workers = max(0, workers)
+        self.batch_size = max(1, batch_size)
+        self._pool = None
+        self.batches = 0
+        self.items = 0
+        self.failures = 0
+        self.in_flight = 0
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        """Start the worker processes on first use."""
+        if self.workers and self._pool is None:
+            # spawn: forking a process that already runs threads (motor, asyncio) is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    @contextmanager
+    def share_base(self, image: Image.Image):
+        """Publish a base image to the workers for the duration of a distribution."""
+        if not self.workers:
+            yield image if image.mode == "RGBA" else image.convert("RGBA")
+            return
+        shared = SharedBase(image)
+        try:
+            yield shared
+        finally:
+            shared.close()
+
+    async def render_batch(self, base, overlays: List[Optional[bytes]], profile: str = None) -> List[tuple]:
+        """Render one batch of overlays on a base from share_base()."""
+        start = time.monotonic()
+        self.in_flight += 1
+        try:
+            pool = self._get_pool()
+            if pool is None:
+                results = await asyncio.to_thread(_render_overlays, base, overlays, profile)
+            else:
+                loop = asyncio.get_running_loop()
+                results = await loop.run_in_executor(
+                    pool, _render_batch, base.name, base.size, overlays, profile
+                )
+        finally:
+            self.in_flight -= 1
+
+        failures = sum(1 for status, _ in results if status != "ok")
+        self.batches += 1
+        self.items += len(results)
+        self.failures += failures
+        observe("render_batch_seconds", {"workers": str(self.workers)}, time.monotonic() - start)
+        increment("render_items_total", {"outcome": "success"}, len(results) - failures)
+        increment("render_items_total", {"outcome": "error"}, failures)
+        return results
+
+    async def render(self, base, overlays: List[Optional[bytes]], profile: str = None) -> List[tuple]:
+        """Render any number of overlays, spreading batches across the workers."""
+        batches = [overlays[i:i + self.batch_size] for i in range(0, len(overlays), self.batch_size)]
+        rendered = await asyncio.gather(*(self.render_batch(base, batch, profile) for batch in batches))
+        return [result for batch in rendered for result in batch]
+
+    async def render_payloads(
+        self,
+        base_image: Image.Image,
+        items: Union[Iterable, AsyncIterable],
+        load_overlay: Callable[[object], Awaitable[Optional[bytes]]],
+        profile: str = None,
+        base_data: bytes = None,
+    ) -> AsyncIterator[tuple]:
+        """Yield (item, encoded image bytes, error) in order, rendering ahead of the consumer.
+
+        Items (a list or an async iterable such as a roster cursor) are read,
+        their overlays loaded and rendered one chunk (batch_size x max(1,
+        workers) items) ahead, so sending can proceed while the next chunk
+        renders and at most two chunks of items and payloads are held in
+        memory. Items without an overlay get the unmodified base image,
+        passing base_data through when it is given.
+        """
+        chunk_size = self.batch_size * max(1, self.workers)
+        unmodified = []
+
+        async def unmodified_payload():
+            """Encode the base image once for the items without an overlay."""
+            if not unmodified:
+                if base_data:
+                    payload = await asyncio.to_thread(
+                        base_image_bytes, {"image": base_image, "data": base_data}, profile
+                    )
+                    unmodified.append(("ok", payload))
+                else:
+                    unmodified.append((await self.render(base, [None], profile))[0])
+            return unmodified[0]
+
+        async def render_chunk(chunk):
+            overlays = await asyncio.gather(*(load_overlay(item) for item in chunk))
+            to_render = [overlay for overlay in overlays if overlay]
+            rendered = iter(await self.render(base, to_render, profile) if to_render else [])
+            return [next(rendered) if overlay else await unmodified_payload() for overlay in overlays]
+
+        with self.share_base(base_image) as base:
+            pending = []
+            try:
+                async for chunk in _chunked(items, chunk_size):
+                    pending.append((chunk, asyncio.ensure_future(render_chunk(chunk))))
+                    if len(pending) > 1:
+                        async for result in self._drain(*pending.pop(0)):
+                            yield result
+                while pending:
+                    async for result in self._drain(*pending.pop(0)):
+                        yield result
+            finally:
+                # Consumer stopped early: don't leave renders running on a released base
+                for _, task in pending:
+                    task.cancel()
+
+    @staticmethod
+    async def _drain(chunk: list, task: asyncio.Future) -> AsyncIterator[tuple]:
+        """Yield the rendered results of a chunk."""
+        for item, (status, value) in zip(chunk, await task):
+            yield (item, value, None) if status == "ok" else (item, None, value)
+
+    def stats(self) -> dict:
+        """Get the engine configuration and counters."""
+        return {
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+            "started": self._pool is not None,
+            "in_flight_batches": self.in_flight,
+            "batches": self.batches,
+            "items": self.items,
+            "failures": self.failures,
+            # Meaningful in thread mode only; each worker process has its own cache
+            "overlay_cache": _worker_overlays.stats() if not self.workers else None,
+        }
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_engine = None
+
+
+def get_render_engine() -> RenderEngine:
+    """Get or create the render engine."""
+    global _engine
+    if _engine is None:
+        _engine = RenderEngine()
+    return _engine
+
+
+def stop_render_engine():
+    """Shut down the render engine's worker processes (called on application shutdown)."""
+    if _engine is not None:
+        _engine.shutdown()
+
+
+def get_render_stats() -> dict:
+    """Get the render engine statistics."""
+    return get_render_engine().stats()
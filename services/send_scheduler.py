@@ -0,0 +1,284 @@
+"""
+Send Scheduler - One pacing budget per WhatsApp sender endpoint.
+
+All sends through a sender (SEND_MEDIA_URL) share its budget, however many
+distribution jobs and one-off requests are running: consecutive sends are
+at least SEND_MIN_SPACING_SECONDS apart plus up to SEND_JITTER_SECONDS of
+random jitter, and no more than SEND_HOURLY_CAP / SEND_DAILY_CAP sends go
+out in any rolling hour / day.
+
+Callers wait for a slot right before sending. Waiting senders are queued by
+lane (SEND_LANES, highest priority first) so one-off sends jump ahead of
+bulk distributions, and within a lane the jobs take turns, so concurrent
+distributions are interleaved instead of each keeping its own pace.
+Request-path sends call check_send_slot() before doing any generation
+work and are rejected with 503 and a Retry-After hint when the sender's
+next priority slot is more than SEND_REQUEST_MAX_WAIT_SECONDS away; once
+past the check they wait for their slot like any other sender.
+
+A job pacing itself to a delivery window passes its own spacing instead of
+the default spacing and jitter; it is jittered by DEADLINE_JITTER_FRACTION
+and never goes below SEND_MIN_SAFE_SPACING_SECONDS.
+
+Every grant also reserves the slot in the sender's budget in MongoDB (see
+SendBudgetRepository), shared by all workers: the spacing and the hourly
+and daily caps (per clock hour and UTC day there) hold for the sender as a
+whole however many workers send through it. Queueing, lanes and the wait
+estimates behind the 503 check stay per worker. When the shared budget
+cannot be reached, nothing is sent until it can.
+"""
+import time
+import uuid
+import random
+import asyncio
+from collections import OrderedDict, deque
+from typing import Optional
+from fastapi import HTTPException
+from database import SendBudgetRepository
+from config import (
+    SEND_MEDIA_URL,
+    SEND_MIN_SPACING_SECONDS,
+    SEND_JITTER_SECONDS,
+    SEND_HOURLY_CAP,
+    SEND_DAILY_CAP,
+    SEND_LANES,
+    SEND_REQUEST_MAX_WAIT_SECONDS,
+    SEND_MIN_SAFE_SPACING_SECONDS,
+    DEADLINE_JITTER_FRACTION,
+)
+from .metrics import observe, increment
+
+SLOT_WAIT_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+HOUR_SECONDS = 3600
+DAY_SECONDS = 24 * 3600
+BUDGET_RETRY_SECONDS = 5  # Wait before retrying an unreachable shared budget
+
+
+class SendScheduler:
+    """Paces the sends to one sender endpoint across all jobs and requests."""
+
+    def __init__(
+        self,
+        name: str,
+        min_spacing: float = SEND_MIN_SPACING_SECONDS,
+        jitter: float = SEND_JITTER_SECONDS,
+        hourly_cap: int = SEND_HOURLY_CAP,
+        daily_cap: int = SEND_DAILY_CAP,
+    ):
+        self.name = name
+        self.min_spacing = max(0.0, min_spacing)
+        self.jitter = max(0.0, jitter)
+        self.hourly_cap = max(0, hourly_cap)
+        self.daily_cap = max(0, daily_cap)
+        # lane -> job key -> waiting (future, spacing); a job moves to the back of its lane after each grant
+        self._lanes = {lane: OrderedDict() for lane in SEND_LANES}
+        self._sent_times = deque()  # Grant times within the last day
+        self._last_sent_at = None
+        self._wakeup = None
+        self._dispatcher = None
+        self.granted = 0
+        self.rejected = 0
+
+    def _prune(self, now: float):
+        while self._sent_times and now - self._sent_times[0] >= DAY_SECONDS:
+            self._sent_times.popleft()
+
+    def _sent_within(self, now: float, seconds: float) -> int:
+        return sum(1 for sent_at in self._sent_times if now - sent_at < seconds)
+
+    def _gap(self, spacing: float = None) -> float:
+        """Draw the spacing a send needs after the previous one."""
+        if spacing is None:
+            return self.min_spacing + random.uniform(0, self.jitter)
+        jittered = spacing * random.uniform(1 - DEADLINE_JITTER_FRACTION, 1 + DEADLINE_JITTER_FRACTION)
+        return max(SEND_MIN_SAFE_SPACING_SECONDS, jittered)
+
+    @property
+    def average_spacing(self) -> float:
+        """Average spacing between default-paced sends."""
+        return self.min_spacing + self.jitter / 2
+
+    def _slot_in(self, now: float, gap: float) -> float:
+        """Seconds until the budget allows a send needing gap seconds since the previous one."""
+        self._prune(now)
+        wait = self._last_sent_at + gap - now if self._last_sent_at is not None else 0.0
+        if self.hourly_cap:
+            recent = [sent_at for sent_at in self._sent_times if now - sent_at < HOUR_SECONDS]
+            if len(recent) >= self.hourly_cap:
+                wait = max(wait, recent[-self.hourly_cap] + HOUR_SECONDS - now)
+        if self.daily_cap and len(self._sent_times) >= self.daily_cap:
+            wait = max(wait, self._sent_times[-self.daily_cap] + DAY_SECONDS - now)
+        return max(0.0, wait)
+
+    def _waiting(self, lanes=None) -> int:
+        return sum(
+            sum(1 for future, _ in queue if not future.done())
+            for lane in (lanes or SEND_LANES)
+            for queue in self._lanes[lane].values()
+        )
+
+    def estimate_wait(self, lane: str) -> float:
+        """Estimate how long a new sender in the lane would wait for its slot."""
+        ahead = self._waiting(SEND_LANES[:SEND_LANES.index(lane) + 1])
+        return self._slot_in(time.monotonic(), self.average_spacing) + ahead * self.average_spacing
+
+    def _next_waiter(self) -> Optional[tuple]:
+        """Find the next waiter: the highest lane with waiters, its jobs in turn. Returns (lane, key, entry)."""
+        for lane in SEND_LANES:
+            queues = self._lanes[lane]
+            for key in list(queues):
+                queue = queues[key]
+                while queue and queue[0][0].done():
+                    queue.popleft()  # Cancelled while waiting
+                if queue:
+                    return lane, key, queue[0]
+                del queues[key]
+        return None
+
+    async def _dispatch(self):
+        """Grant slots to the waiters as the budget allows."""
+        while True:
+            self._wakeup.clear()
+            head = self._next_waiter()
+            if head is None:
+                await self._wakeup.wait()
+                continue
+            lane, key, (waiter, gap) = head
+            delay = self._slot_in(time.monotonic(), gap)
+            if delay <= 0:
+                # Other workers send through the same sender: reserve the slot in the shared budget
+                try:
+                    delay = await SendBudgetRepository.reserve(self.name, gap, self.hourly_cap, self.daily_cap)
+                except Exception as e:
+                    print(f"[Send Scheduler] Warning: could not reserve a send slot: {e}")
+                    delay = BUDGET_RETRY_SECONDS
+            if delay > 0:
+                # Look again when the slot opens or a sender arrives (it may have priority)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            head = self._next_waiter()
+            if head is None:
+                continue  # Everyone waiting gave up while the slot was reserved
+            lane, key, (waiter, _) = head
+            queues = self._lanes[lane]
+            queue = queues.pop(key)
+            queue.popleft()
+            if queue:
+                queues[key] = queue
+            now = time.monotonic()
+            self._sent_times.append(now)
+            self._last_sent_at = now
+            self.granted += 1
+            waiter.set_result(None)
+
+    def check(self, lane: str, max_wait: float):
+        """Raise 503 (with Retry-After) when a new sender in the lane would wait longer than max_wait."""
+        if lane not in self._lanes:
+            raise ValueError(f"Unknown send lane '{lane}', expected one of {SEND_LANES}")
+        estimate = self.estimate_wait(lane)
+        if estimate > max_wait:
+            self.rejected += 1
+            increment("send_slots_rejected_total", {"lane": lane})
+            raise HTTPException(
+                status_code=503,
+                detail=f"The WhatsApp sender is busy, next send slot in about {int(estimate)}s",
+                headers={"Retry-After": str(max(1, int(estimate)))},
+            )
+
+    async def acquire(self, lane: str = "bulk", job_id: str = None, max_wait: float = None, spacing: float = None):
+        """Wait for the next send slot in a lane.
+
+        job_id groups a job's sends so jobs in the same lane take turns. With
+        max_wait, raise 503 instead of waiting when the slot is further away.
+        spacing overrides the default spacing and jitter for this send.
+        """
+        if max_wait is not None:
+            self.check(lane, max_wait)
+        elif lane not in self._lanes:
+            raise ValueError(f"Unknown send lane '{lane}', expected one of {SEND_LANES}")
+
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        waiter = asyncio.get_running_loop().create_future()
+        queues = self._lanes[lane]
+        queues.setdefault(job_id or uuid.uuid4().hex, deque()).append((waiter, self._gap(spacing)))
+        self._wakeup.set()
+
+        queued_at = time.monotonic()
+        await waiter
+        observe("send_slot_wait_seconds", {"lane": lane}, time.monotonic() - queued_at, SLOT_WAIT_BUCKETS)
+        increment("send_slots_total", {"lane": lane})
+
+    def stats(self) -> dict:
+        """Get the budget, usage and queue depth per lane."""
+        now = time.monotonic()
+        return {
+            "min_spacing_seconds": self.min_spacing,
+            "jitter_seconds": self.jitter,
+            "hourly_cap": self.hourly_cap,
+            "daily_cap": self.daily_cap,
+            "sent_last_hour": self._sent_within(now, HOUR_SECONDS),
+            "sent_last_day": self._sent_within(now, DAY_SECONDS),
+            "min_safe_spacing_seconds": SEND_MIN_SAFE_SPACING_SECONDS,
+            "next_slot_in_seconds": round(self._slot_in(now, self.average_spacing), 1),
+            "waiting": {lane: self._waiting((lane,)) for lane in SEND_LANES},
+            "active_jobs": {
+                lane: sum(1 for queue in self._lanes[lane].values() if any(not future.done() for future, _ in queue))
+                for lane in SEND_LANES
+            },
+            "granted": self.granted,
+            "rejected": self.rejected,
+        }
+
+    def stop(self):
+        """Stop the dispatcher; senders still waiting are cancelled."""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for queues in self._lanes.values():
+            for queue in queues.values():
+                for waiter, _ in queue:
+                    waiter.cancel()
+            queues.clear()
+
+
+_schedulers = {}
+
+
+def get_send_scheduler(url: str = SEND_MEDIA_URL) -> SendScheduler:
+    """Get the scheduler owning a sender endpoint's send budget."""
+    if url not in _schedulers:
+        _schedulers[url] = SendScheduler(url)
+    return _schedulers[url]
+
+
+async def acquire_send_slot(
+    lane: str = "bulk",
+    job_id: str = None,
+    max_wait: float = None,
+    spacing: float = None,
+    url: str = SEND_MEDIA_URL,
+):
+    """Wait for the next send slot of a sender endpoint (see SendScheduler.acquire)."""
+    await get_send_scheduler(url).acquire(lane, job_id, max_wait, spacing)
+
+
+def check_send_slot(lane: str = "priority", max_wait: float = SEND_REQUEST_MAX_WAIT_SECONDS, url: str = SEND_MEDIA_URL):
+    """Reject a request-path send with 503 up front when the sender's next slot is too far away."""
+    get_send_scheduler(url).check(lane, max_wait)
+
+
+def stop_send_schedulers():
+    """Stop every scheduler (called on application shutdown)."""
+    for scheduler in _schedulers.values():
+        scheduler.stop()
+
+
+def get_send_scheduler_stats() -> dict:
+    """Get the pacing state of each sender endpoint."""
+    return {url: scheduler.stats() for url, scheduler in _schedulers.items()}
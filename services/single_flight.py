@@ -0,0 +1,63 @@
+"""
+Single-flight - Coalesce concurrent identical async calls.
+
+While a call for a key is in flight, later callers with the same key await
+the same future instead of starting their own call, and all of them get its
+result (or its exception).
+"""
+import asyncio
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls that share a key."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) once per key at a time and share its result."""
+        self.calls += 1
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # Shield so one cancelled waiter does not cancel the shared call
+            return await asyncio.shield(future)
+
+        self.executions += 1
+        future = asyncio.ensure_future(fn(*args, **kwargs))
+        self._in_flight[key] = future
+
+        def _done(finished):
+            if self._in_flight.get(key) is finished:
+                del self._in_flight[key]
+            if not finished.cancelled():
+                # Mark the exception retrieved even if every waiter went away
+                finished.exception()
+
+        future.add_done_callback(_done)
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        """Get call, execution and coalescing counters."""
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+        }
+
+
+structured_output_flight = SingleFlight("structured_output")
+image_flight = SingleFlight("image")
+
+
+def get_single_flight_stats() -> dict:
+    """Get the coalescing counters of every single-flight group."""
+    return {
+        flight.name: flight.stats()
+        for flight in (structured_output_flight, image_flight)
+    }
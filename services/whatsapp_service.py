@@ -1,31 +1,133 @@
 """
 WhatsApp Service - Send media via WhatsApp API.
+
+Images are handed over as the raw encoded bytes and sent with the transport
+configured for the sender endpoint (SEND_MEDIA_TRANSPORTS):
+
+- "json": the original request, a JSON body with the whole image as a
+  base64 string (built in memory, then serialized again by httpx).
+- "json-stream": the same JSON body, streamed with the base64 encoded on the
+  fly one chunk at a time, so no full base64 or JSON copy of the image exists.
+- "multipart": the raw bytes as a file part with phone and caption as form
+  fields, which also saves the ~33% base64 overhead on the wire.
 """
+import json
+import time
+import base64
+from typing import AsyncIterator, Union
 import httpx
-from config import SEND_MEDIA_URL, DEFAULT_PHONE_NUMBER
+from config import (
+    SEND_MEDIA_URL,
+    DEFAULT_PHONE_NUMBER,
+    SEND_MEDIA_TRANSPORTS,
+    DEFAULT_SEND_MEDIA_TRANSPORT,
+    SEND_MEDIA_FILE_FIELD,
+)
+from .metrics import observe, increment, BYTES_BUCKETS, DURATION_BUCKETS
 
+TRANSPORTS = ("json", "json-stream", "multipart")
+STREAM_CHUNK_BYTES = 48 * 1024  # Raw bytes per streamed chunk (a multiple of 3: no base64 padding mid-stream)
 
-async def send_to_whatsapp(
-    image_base64: str,
-    caption: str,
-    phone: str = DEFAULT_PHONE_NUMBER
-) -> dict:
-    """Send the final image to WhatsApp via API."""
+_MEDIA_TYPES = {
+    b"\x89PNG": ("image.png", "image/png"),
+    b"\xff\xd8\xff": ("image.jpg", "image/jpeg"),
+    b"RIFF": ("image.webp", "image/webp"),
+}
+
+
+def get_transport(url: str = SEND_MEDIA_URL) -> str:
+    """Get the transport configured for a sender endpoint."""
+    transport = SEND_MEDIA_TRANSPORTS.get(url, DEFAULT_SEND_MEDIA_TRANSPORT)
+    if transport not in TRANSPORTS:
+        raise ValueError(f"Unknown WhatsApp transport '{transport}' for {url}")
+    return transport
+
+
+def _media_type(image: bytes) -> tuple:
+    """Guess the file name and MIME type of encoded image bytes."""
+    for magic, media_type in _MEDIA_TYPES.items():
+        if image.startswith(magic):
+            return media_type
+    return ("image.bin", "application/octet-stream")
+
+
+def _json_stream(image: bytes, phone: str, caption: str) -> tuple:
+    """Build a streamed JSON body: (Content-Length, async chunk iterator)."""
+    head = json.dumps({"phone": phone, "caption": caption})[:-1].encode("utf-8") + b', "message": "'
+    tail = b'"}'
+    length = len(head) + 4 * ((len(image) + 2) // 3) + len(tail)
+
+    async def body() -> AsyncIterator[bytes]:
+        yield head
+        view = memoryview(image)
+        for start in range(0, len(view), STREAM_CHUNK_BYTES):
+            yield base64.b64encode(view[start:start + STREAM_CHUNK_BYTES])
+        yield tail
+
+    return length, body()
+
+
+async def _post(http_client: httpx.AsyncClient, url: str, transport: str, image, phone: str, caption: str):
+    """Send one request with the given transport; returns (response, body bytes)."""
+    if transport == "multipart":
+        if isinstance(image, str):
+            image = base64.b64decode(image)
+        file_name, content_type = _media_type(image)
+        response = await http_client.post(
+            url,
+            data={"phone": phone, "caption": caption},
+            files={SEND_MEDIA_FILE_FIELD: (file_name, image, content_type)},
+            timeout=60.0,
+        )
+        return response, int(response.request.headers.get("content-length", len(image)))
+
+    if transport == "json-stream" and isinstance(image, bytes):
+        length, body = _json_stream(image, phone, caption)
+        response = await http_client.post(
+            url,
+            content=body,
+            headers={"Content-Type": "application/json", "Content-Length": str(length)},
+            timeout=60.0,
+        )
+        return response, length
+
+    # "json" (or json-stream of a payload that is already base64)
+    image_base64 = image if isinstance(image, str) else base64.b64encode(image).decode("utf-8")
     payload = {
         "phone": phone,
         "message": image_base64,
         "caption": caption
     }
+    response = await http_client.post(url, json=payload, timeout=60.0)
+    return response, int(response.request.headers.get("content-length", len(image_base64)))
+
+
+async def send_to_whatsapp(
+    image: Union[bytes, str],
+    caption: str,
+    phone: str = DEFAULT_PHONE_NUMBER,
+    url: str = SEND_MEDIA_URL,
+) -> dict:
+    """Send the final image (encoded bytes, or a base64 string) to WhatsApp via API."""
+    transport = get_transport(url)
 
     print(f"[WhatsApp] Sending to: {phone}")
     print(f"[WhatsApp] Caption: {caption[:20]}..." if len(caption) > 100 else f"[WhatsApp] Caption: {caption}")
-    print(f"[WhatsApp] Image size: {len(image_base64)} chars")
-    print(f"[WhatsApp] API URL: {SEND_MEDIA_URL}")
+    print(f"[WhatsApp] Image size: {len(image)} {'bytes' if isinstance(image, bytes) else 'chars'}")
+    print(f"[WhatsApp] API URL: {url} ({transport})")
 
+    start = time.monotonic()
     async with httpx.AsyncClient() as http_client:
-        response = await http_client.post(SEND_MEDIA_URL, json=payload, timeout=60.0)
-        
-        print(f"[WhatsApp] Response status: {response.status_code}")
+        try:
+            response, body_bytes = await _post(http_client, url, transport, image, phone, caption)
+        except Exception:
+            increment("whatsapp_sends_total", {"transport": transport, "outcome": "error"})
+            raise
+        observe("whatsapp_send_seconds", {"transport": transport}, time.monotonic() - start, DURATION_BUCKETS)
+        observe("whatsapp_request_bytes", {"transport": transport}, body_bytes, BYTES_BUCKETS)
+        increment("whatsapp_sends_total", {"transport": transport, "outcome": str(response.status_code)})
+
+        print(f"[WhatsApp] Response status: {response.status_code} ({body_bytes} bytes sent)")
         # Handle non-JSON responses gracefully
         try:
             return response.json()
@@ -36,5 +138,3 @@ async def send_to_whatsapp(
                 "status_code": response.status_code,
                 "raw_response": response.text[:200] if response.text else "empty"
             }
-
-
@@ -0,0 +1,59 @@
+"""
+Tests for delivery window parsing (services.pacing.parse_window).
+"""
+from datetime import datetime
+
+import pytest
+
+from services.pacing import parse_window
+
+
+def window(start: str, end: str, now: datetime) -> tuple:
+    parsed = parse_window(start, end, now)
+    return datetime.fromisoformat(parsed["start"]), datetime.fromisoformat(parsed["end"])
+
+
+def test_window_later_today():
+    now = datetime(2026, 10, 17, 6, 0)
+    assert window("07:00", "10:00", now) == (datetime(2026, 10, 17, 7, 0), datetime(2026, 10, 17, 10, 0))
+
+
+def test_window_already_open_keeps_its_start():
+    now = datetime(2026, 10, 17, 8, 30)
+    assert window("07:00", "10:00", now) == (datetime(2026, 10, 17, 7, 0), datetime(2026, 10, 17, 10, 0))
+
+
+def test_window_over_today_rolls_to_tomorrow():
+    now = datetime(2026, 10, 17, 18, 0)
+    assert window("09:00", "17:00", now) == (datetime(2026, 10, 18, 9, 0), datetime(2026, 10, 18, 17, 0))
+
+
+def test_overnight_window_before_it_opens():
+    now = datetime(2026, 10, 17, 18, 0)
+    assert window("22:00", "02:00", now) == (datetime(2026, 10, 17, 22, 0), datetime(2026, 10, 18, 2, 0))
+
+
+def test_overnight_window_opened_yesterday():
+    now = datetime(2026, 10, 17, 1, 0)
+    assert window("22:00", "02:00", now) == (datetime(2026, 10, 16, 22, 0), datetime(2026, 10, 17, 2, 0))
+
+
+def test_overnight_window_after_it_closed():
+    now = datetime(2026, 10, 17, 3, 0)
+    assert window("22:00", "02:00", now) == (datetime(2026, 10, 17, 22, 0), datetime(2026, 10, 18, 2, 0))
+
+
+def test_deadline_only_opens_now():
+    now = datetime(2026, 10, 17, 6, 0)
+    assert window(None, "10:00", now) == (now, datetime(2026, 10, 17, 10, 0))
+    assert window(None, "05:00", now) == (now, datetime(2026, 10, 18, 5, 0))
+
+
+def test_no_window():
+    assert parse_window(None, None) is None
+
+
+@pytest.mark.parametrize("start, end", [("07:00", None), ("7h", "10:00"), ("07:00", "25:00")])
+def test_invalid_window(start, end):
+    with pytest.raises(ValueError):
+        parse_window(start, end, datetime(2026, 10, 17, 6, 0))